@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Benchmark of parse and write throughput of the XML backends on the bundled definitions.
+
+Write is the serialization of each Service and its output through ``MdfWriter``, as a tree merge
+writes its target. Backends that are not installed are skipped.
+
+Usage::
+
+    python benchmarks/bench_backend.py --repeat 10
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge.backend import BACKENDS, get_backend
+from idp_mdf_merge.writer import MdfWriter
+from benchmarks.common import BUNDLED, best_of
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse and write throughput of the XML backends')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        target = os.path.join(workdir, 'merged.idpmsg')
+        size = sum(os.path.getsize(f) for f in BUNDLED)
+        print('{} files, {:.1f} MB'.format(len(BUNDLED), size / 1048576.0))
+        print('{:<8} {:>10} {:>10} {:>10} {:>10}'.format('backend', 'parse', 'MB/s', 'write', 'MB/s'))
+        for name in BACKENDS:
+            try:
+                backend = get_backend(name)
+            except ImportError:
+                print('{:<8} not installed'.format(name))
+                continue
+            roots = [backend.parse(f) for f in BUNDLED]
+            services = [limb for root in roots for limb in root.find('Services')]
+
+            def parse():
+                for f in BUNDLED:
+                    backend.parse(f)
+
+            def write():
+                with MdfWriter(target, sorted(backend.namespaces(services).items())) as out:
+                    for limb in services:
+                        out.write(backend.serialize(limb, {}))
+
+            parse_time = best_of(args.repeat, parse)[0]
+            write_time = best_of(args.repeat, write)[0]
+            written = os.path.getsize(target)
+            print('{:<8} {:>7.1f} ms {:>10.1f} {:>7.1f} ms {:>10.1f}'.format(
+                name, parse_time * 1000, size / 1048576.0 / parse_time,
+                write_time * 1000, written / 1048576.0 / write_time))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Benchmark of NumPy columnar batch decoding against a per-message decode loop, using
+``fleetint_demo`` position reports (SIN 20, MIN 1), at several batch sizes to show where the
+batch overtakes the loop. NumPy is imported before timing.
+
+Usage::
+
+    python benchmarks/bench_batch.py --counts 1000 20000 200000 1000000
+
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.batch import decode_batch
+from idp_mdf_merge.codec import Codec
+from payloads import sample_values
+
+MDF_FILE = os.path.join(idp_mdf_merge.CORE_MODEM_PATH, 'fleetint_demo.idpmsg')
+
+
+def check(rows, columns):
+    """Raises AssertionError unless sampled rows of the batch match the per-message decode."""
+    count = len(rows)
+    for i in range(0, count, max(1, count // 1000)):
+        values = rows[i][2]
+        for name, column in columns.columns.items():
+            value = column[i]
+            if name in columns.items:
+                value = columns.items[name][value]
+            if value != values[name]:
+                raise AssertionError('Mismatch in row {} field {}'.format(i, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark columnar batch decoding')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 20000, 200000, 1000000],
+                        help='Numbers of payloads in the batch')
+    parser.add_argument('--sin', type=int, default=20)
+    parser.add_argument('--min', type=int, default=1)
+    args = parser.parse_args()
+    codec = Codec.from_file(MDF_FILE)
+    plan = codec.plan(args.sin, args.min)
+    variants = [plan.encode(sample_values(plan.fields, variant)) for variant in range(16)]
+    decode_batch(codec, variants)
+    print('{} ({} bytes)'.format(plan.name, len(variants[0])))
+    print('{:>9} {:>10} {:>12} {:>10} {:>12} {:>8}'.format('payloads', 'loop', 'msg/s', 'batch', 'msg/s',
+                                                           'speedup'))
+    for count in args.counts:
+        payloads = [variants[i % len(variants)] for i in range(count)]
+        start = time.time()
+        rows = [codec.decode(payload) for payload in payloads]
+        loop = time.time() - start
+        start = time.time()
+        batch = decode_batch(codec, payloads)
+        vectorized = time.time() - start
+        columns = batch[(args.sin, args.min)]
+        if not columns.vectorized:
+            raise AssertionError('{} is not vectorized'.format(plan.name))
+        check(rows, columns)
+        print('{:>9} {:9.3f}s {:12.0f} {:9.3f}s {:12.0f} {:7.1f}x'.format(count, loop, count / loop, vectorized,
+                                                                        count / vectorized, loop / vectorized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark of loading merged definitions from the binary export against parsing the merged XML.
+
+Each case merges a set of files with ``binary=True``, then times what a decoder does on start up
+to decode one message:
+
+    * ``xml codec`` - ``Codec.from_file`` of the merged XML, compiling every message
+    * ``xml model`` - ``model.load`` of the merged XML
+    * ``binary one`` - opening the binary export and compiling the plan of one message
+    * ``binary all`` - opening the binary export and compiling the plan of every message
+
+Usage::
+
+    python benchmarks/bench_binary.py --services 300 --repeat 5
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge, model
+from idp_mdf_merge.binary import BinaryDefinitions, binary_path
+from idp_mdf_merge.codec import Codec, CodecError
+from benchmarks.generator import generate_set
+from benchmarks.common import BUNDLED, best_of
+
+
+def binary_one(filename, key):
+    with BinaryDefinitions(filename) as definitions:
+        sin, direction, min = key
+        return definitions.plan(sin, min, direction)
+
+
+def binary_all(filename):
+    plans = 0
+    with BinaryDefinitions(filename) as definitions:
+        for sin, direction, min in definitions.keys():
+            try:
+                definitions.plan(sin, min, direction)
+                plans += 1
+            except CodecError:
+                pass
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loading the binary export of a merge')
+    parser.add_argument('--services', type=int, default=300, help='Services of the synthetic set')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        synthetic = generate_set(os.path.join(workdir, 'synthetic'), files=1, services=args.services)
+        print('{:<12} {:>9} {:>9} {:>11} {:>11} {:>11} {:>11}'.format('', 'XML', 'binary', 'xml codec', 'xml model',
+                                                                      'binary one', 'binary all'))
+        for name, files in (('bundled', BUNDLED), ('synthetic', synthetic)):
+            target = os.path.join(workdir, name + '.idpmsg')
+            idp_mdf_merge.merge_mdf(files, target, binary=True)
+            exported = binary_path(target)
+            codec_time, codec = best_of(args.repeat, Codec.from_file, target)
+            model_time, _ = best_of(args.repeat, model.load, target)
+            key = sorted(codec.plans)[len(codec.plans) // 2]
+            one_time, _ = best_of(args.repeat, binary_one, exported, key)
+            all_time, plans = best_of(args.repeat, binary_all, exported)
+            assert plans == len(codec.plans)
+            print('{:<12} {:6.0f} KB {:6.0f} KB {:8.1f} ms {:8.1f} ms {:8.2f} ms {:8.1f} ms'.format(
+                name, os.path.getsize(target) / 1024.0, os.path.getsize(exported) / 1024.0, codec_time * 1000,
+                model_time * 1000, one_time * 1000, all_time * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
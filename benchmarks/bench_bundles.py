@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Benchmark of merging many bundles with ``merge_bundles`` vs one ``merge_mdf`` per bundle.
+
+Each bundle merges the bundled core modem and LSF definitions, a synthetic set of Services common to
+all customers and a synthetic file of its own customer's Services, so most of the sources of a
+bundle are shared with every other bundle.
+
+Usage::
+
+    python benchmarks/bench_bundles.py --bundles 12 --jobs 4
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.bundle import Bundle, merge_bundles
+from benchmarks.generator import generate_set
+
+CORE = [idp_mdf_merge.CORE_MODEM_PATH + idp_mdf_merge.CORE_MODEM_FILE,
+        idp_mdf_merge.LSF_CORE_PATH + idp_mdf_merge.LSF_CORE_AGENTS_FILE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch merge of bundles vs independent merges')
+    parser.add_argument('--bundles', type=int, default=12, help='Number of bundles')
+    parser.add_argument('--services', type=int, default=50, help='Services of the common synthetic set')
+    parser.add_argument('--jobs', type=int, default=4, help='Worker processes of the parallel batch merge')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        common = generate_set(os.path.join(workdir, 'common'), files=2, services=args.services)
+        bundles = []
+        for n in range(args.bundles):
+            own = generate_set(os.path.join(workdir, 'customer{:02d}'.format(n)), files=1, services=5,
+                               first_sin=128 + 2 * args.services + 5 * n, seed=n)
+            bundles.append(Bundle(os.path.join(workdir, 'out', 'customer{:02d}.idpmsg'.format(n)),
+                                  CORE + common + own))
+        os.makedirs(os.path.join(workdir, 'out'))
+
+        start = time.time()
+        for bundle in bundles:
+            idp_mdf_merge.merge_mdf(bundle.files, bundle.target)
+        independent = time.time() - start
+
+        print('{} bundles of {} files'.format(len(bundles), len(bundles[0].files)))
+        print('{:<24} {:>10} {:>10} {:>12}'.format('', 'time', 'parsed', 'est. saved'))
+        print('{:<24} {:7.1f} ms {:>10} {:>12}'.format('independent', independent * 1000,
+                                                       sum(len(bundle.files) for bundle in bundles), '-'))
+        for label, workers in (('batch', None), ('batch -j {}'.format(args.jobs), args.jobs)):
+            start = time.time()
+            report = merge_bundles(bundles, workers=workers)
+            elapsed = time.time() - start
+            print('{:<24} {:7.1f} ms {:>10} {:9.1f} ms'.format(label, elapsed * 1000, report.sources,
+                                                                report.saved * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark of cold vs warm merge time of the bundled core modem and LSF core/agent definitions
+using the parsed-definition cache.
+
+Usage::
+
+    python benchmarks/bench_cache.py --repeat 20
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.backend import get_backend
+from idp_mdf_merge.cache import DefinitionCache
+from benchmarks.common import best_of
+
+FILES = [os.path.join(idp_mdf_merge.CORE_MODEM_PATH, idp_mdf_merge.CORE_MODEM_FILE),
+         os.path.join(idp_mdf_merge.LSF_CORE_PATH, idp_mdf_merge.LSF_CORE_AGENTS_FILE)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold vs warm cached merge')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of merges timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        target = os.path.join(workdir, 'merged.idpmsg')
+        cache_dir = os.path.join(workdir, 'cache')
+        pipeline = idp_mdf_merge.default_pipeline()
+        backend = get_backend()
+
+        def no_cache():
+            idp_mdf_merge.merge_mdf(FILES, target)
+
+        def cold():
+            cache = DefinitionCache(cache_dir)
+            cache.clear()
+            idp_mdf_merge.merge_mdf(FILES, target, cache=cache)
+
+        def warm_disk():
+            idp_mdf_merge.merge_mdf(FILES, target, cache=DefinitionCache(cache_dir))
+
+        shared = DefinitionCache(cache_dir)
+
+        def warm_memory():
+            idp_mdf_merge.merge_mdf(FILES, target, cache=shared)
+
+        def load(cache):
+            return lambda: list(idp_mdf_merge._iter_loaded(FILES, pipeline, backend, [], cache=cache))
+
+        def load_cold():
+            cache = DefinitionCache(cache_dir)
+            cache.clear()
+            list(idp_mdf_merge._iter_loaded(FILES, pipeline, backend, [], cache=cache))
+
+        print('{:<14} {:>10} {:>10}'.format('', 'load', 'merge'))
+        for label, merge, loader in (('no cache', no_cache, load(None)),
+                                     ('cold', cold, load_cold),
+                                     ('warm (disk)', warm_disk, load(DefinitionCache(cache_dir, max_entries=0))),
+                                     ('warm (memory)', warm_memory, load(shared))):
+            print('{:<14} {:7.2f} ms {:7.2f} ms'.format(label, best_of(args.repeat, loader)[0] * 1000,
+                                                       best_of(args.repeat, merge)[0] * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Round trip check and throughput benchmark of the compiled payload codec.
+
+Every compiled message of the bundled ``mdf/*.idpmsg`` files is encoded and decoded with sample
+values, then return message decode throughput is compared with a generic interpreter that walks
+the XML message definition for each payload.
+
+Usage::
+
+    python benchmarks/bench_codec.py --seconds 2
+
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.codec import Codec, XSI_TYPE, RETURN
+from payloads import sample_payloads
+
+MDF_FILES = sorted(glob.glob(os.path.join(idp_mdf_merge.CORE_MODEM_PATH, '*.idpmsg')))
+
+
+def interpret(message, payload):
+    """Decodes a payload by walking the XML Message definition over a string of bits."""
+    bits = ''.join('{:08b}'.format(b) for b in bytearray(payload))
+
+    def read(pos, count):
+        return int(bits[pos:pos + count] or '0', 2), pos + count
+
+    def length(pos):
+        flag, pos = read(pos, 1)
+        return read(pos, 15 if flag else 7)
+
+    def fields(parent, pos, values):
+        for field in parent.findall('Fields/Field'):
+            name = field.findtext('Name')
+            if field.findtext('Optional') == 'true':
+                present, pos = read(pos, 1)
+                if not present:
+                    continue
+            ftype = field.get(XSI_TYPE)
+            fixed = field.findtext('Fixed') == 'true'
+            size = int(field.findtext('Size') or 0)
+            if ftype == 'BooleanField':
+                value, pos = read(pos, 1)
+                values[name] = value == 1
+            elif ftype in ('UnsignedIntField', 'SignedIntField', 'EnumField'):
+                value, pos = read(pos, size)
+                if ftype == 'SignedIntField' and value >> (size - 1):
+                    value -= 1 << size
+                elif ftype == 'EnumField':
+                    items = [item.text for item in field.findall('Items/string')]
+                    value = items[value] if value < len(items) else value
+                values[name] = value
+            elif ftype in ('StringField', 'DataField'):
+                count, pos = (size, pos) if fixed else length(pos)
+                data = bytearray()
+                for _ in range(count):
+                    byte, pos = read(pos, 8)
+                    data.append(byte)
+                if ftype == 'DataField':
+                    values[name] = bytes(data)
+                else:
+                    values[name] = (bytes(data).rstrip(b'\0') if fixed else bytes(data)).decode('latin-1')
+            else:
+                count, pos = (size, pos) if fixed else length(pos)
+                elements = []
+                for _ in range(count):
+                    element = {}
+                    pos = fields(field, pos, element)
+                    elements.append(element)
+                values[name] = elements
+        return pos
+
+    result = {}
+    fields(message, 16, result)
+    return result
+
+
+def throughput(decode, samples, seconds):
+    """Returns messages per second decoding ``samples`` repeatedly for about ``seconds``."""
+    count = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        for sample in samples:
+            decode(sample)
+        count += len(samples)
+    return count / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the compiled payload codec')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Duration of each throughput run')
+    args = parser.parse_args()
+    compiled = []
+    for filename in MDF_FILES:
+        codec = Codec.from_file(filename)
+        samples = sample_payloads(codec)
+        failures = 0
+        for plan, values, payload in samples:
+            if codec.decode(payload, plan.direction)[2] != values:
+                failures += 1
+        print('{:<32} {:4} messages compiled, {:3} unsupported, {:5} round trips, {} failures'.format(
+            os.path.basename(filename), len(codec.plans), len(codec.unsupported), len(samples), failures))
+        compiled.append((filename, codec))
+    filename, codec = compiled[-1]
+    definitions = {}
+    for service in idp_mdf_merge.ET.parse(filename).getroot().find('Services'):
+        for message in service.findall(RETURN + '/Message'):
+            definitions[(int(service.findtext('SIN')), int(message.findtext('MIN')))] = message
+    samples = [payload for plan, values, payload in sample_payloads(codec, direction=RETURN)]
+    print('Return message decode throughput ({}):'.format(os.path.basename(filename)))
+    compiled_rate = throughput(codec.decode, samples, args.seconds)
+    generic_rate = throughput(lambda p: interpret(definitions[(bytearray(p)[0], bytearray(p)[1])], p),
+                              samples, args.seconds)
+    print('  compiled codec      {:10.0f} msg/s'.format(compiled_rate))
+    print('  generic interpreter {:10.0f} msg/s ({:.1f}x slower)'.format(generic_rate, compiled_rate / generic_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Benchmark of resolving a SIN split across many partial Services with each conflict policy.
+
+Each case registers ``--parts`` partial Services of one SIN, each defining its own range of MINs
+plus one MIN identical to the first part and, one part in ten, a conflicting MIN. The time per
+message of ``union`` should stay flat as the number of messages grows, since each message is
+resolved by a (SIN, direction, MIN) lookup. Scan is the same union resolved by searching the
+messages of the registered Service for each MIN.
+
+Usage::
+
+    python benchmarks/bench_conflicts.py --parts 10 50 200 --messages 10
+
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge.registry import ServiceRegistry, CONFLICT_POLICIES, DIRECTIONS, content_digest
+from benchmarks.generator import MdfGenerator
+
+
+def partial_services(parts, messages, fields):
+    """Returns (list of Element) partial Services of SIN 200, each numbered from its own range of MINs."""
+    generator = MdfGenerator(messages=messages, fields=fields, depth=0)
+    template = ET.fromstring('<Services xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">' +
+                             generator.service(200) + '</Services>')[0]
+    services = []
+    for part in range(parts):
+        service = copy.deepcopy(template)
+        for direction in DIRECTIONS:
+            container = service.find(direction)
+            for n, message in enumerate(container):
+                message.find('MIN').text = str(1 + part * messages + n)
+            if part > 0:
+                # identical to a message of the first part, and every tenth part a conflict
+                shared = copy.deepcopy(template.find(direction)[0])
+                if part % 10 == 0:
+                    shared.find('Name').text = 'conflict{}'.format(part)
+                container.append(shared)
+        services.append(service)
+    return services
+
+
+def union_scan(services):
+    """Merges the messages of each Service into the first by searching its messages for each MIN."""
+    registered = services[0]
+    conflicts = 0
+    for service in services[1:]:
+        for direction in DIRECTIONS:
+            target = registered.find(direction)
+            for message in list(service.find(direction)):
+                min_text = message.findtext('MIN')
+                for existing in target:
+                    if existing.findtext('MIN') == min_text:
+                        if content_digest(existing) != content_digest(message):
+                            conflicts += 1
+                        break
+                else:
+                    target.append(message)
+    return conflicts
+
+
+def register(services, policy):
+    registry = ServiceRegistry()
+    for service in services:
+        registry.add(service, policy)
+    return registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark resolving duplicate SINs by conflict policy')
+    parser.add_argument('--parts', type=int, nargs='+', default=[10, 50, 200], help='Partial Services per case')
+    parser.add_argument('--messages', type=int, default=10, help='Messages per direction of each part')
+    parser.add_argument('--fields', type=int, default=4, help='Fields per message')
+    args = parser.parse_args()
+    print('{:>8} {:>9} '.format('parts', 'messages') +
+          ' '.join('{:>13}'.format(label) for label in CONFLICT_POLICIES + ('scan',)))
+    for parts in args.parts:
+        times = []
+        for policy in CONFLICT_POLICIES:
+            services = partial_services(parts, args.messages, args.fields)
+            start = time.time()
+            registry = register(services, policy)
+            times.append(time.time() - start)
+        services = partial_services(parts, args.messages, args.fields)
+        start = time.time()
+        union_scan(services)
+        times.append(time.time() - start)
+        total = parts * 2 * args.messages
+        print('{:>8} {:>9} '.format(parts, total) +
+              ' '.join('{:7.2f} us/msg'.format(elapsed * 1e6 / total) for elapsed in times) +
+              '  ({} conflicts)'.format(len(registry.conflicts)))
+
+
+if __name__ == '__main__':
+    main()
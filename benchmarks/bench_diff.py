@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark of the structural diff of two versions of a synthetic message definition file.
+
+Snapshot is the time to load a version and compute its digests, done once per version when
+comparing a series of versions such as the commits of a repository. Diff compares two snapshots,
+with no change, with the Size of one Field changed, and with one Field changed in 10% of the
+Services, and with the MIN of one Message and the SIN of one Service removed, checking that each
+is reported. Equality compares the same versions without digests, Service by Service with ``==`` of
+the model.
+
+Usage::
+
+    python benchmarks/bench_diff.py --services 150 --repeat 20
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import model
+from idp_mdf_merge.diff import ADDED, Snapshot, diff
+from idp_mdf_merge.registry import DIRECTIONS
+from benchmarks.generator import generate_set
+from benchmarks.common import best_of
+
+
+def change_fields(services, every):
+    """Returns copies of Services with the Size of the first sized Field changed in every ``every`` Service."""
+    changed = []
+    for n, service in enumerate(services):
+        if n % every == 0:
+            limb = service.to_element()
+            for field in limb.iter('Field'):
+                size = field.find('Size')
+                if size is not None:
+                    size.text = str(int(size.text) + 1)
+                    break
+            service = model.Service.from_element(limb)
+        changed.append(service)
+    return changed
+
+
+def drop_ids(services):
+    """Returns copies of Services with the MIN of the first Message and the SIN of the last Service removed."""
+    changed = list(services)
+    limb = changed[0].to_element()
+    message = next(limb.iter('Message'))
+    message.remove(message.find('MIN'))
+    changed[0] = model.Service.from_element(limb)
+    limb = changed[-1].to_element()
+    limb.remove(limb.find('SIN'))
+    changed[-1] = model.Service.from_element(limb)
+    return changed
+
+
+def equal(old, new):
+    """Compares Services and their Messages by SIN, direction and MIN without digests."""
+    new_by_sin = dict((service.sin, service) for service in new)
+    modified = 0
+    for service in old:
+        other = new_by_sin.get(service.sin)
+        if other is None or other == service:
+            continue
+        for direction in DIRECTIONS:
+            messages = dict((message.min, message) for message in other.messages(direction))
+            for message in service.messages(direction):
+                if messages.get(message.min) != message:
+                    modified += 1
+    return modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the structural diff of message definitions')
+    parser.add_argument('--services', type=int, default=150, help='Services of the synthetic file')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        filename = generate_set(workdir, files=1, services=args.services)[0]
+        print('{} Services, {:.1f} MB'.format(args.services, os.path.getsize(filename) / 1048576.0))
+        snapshot_time, old = best_of(args.repeat, Snapshot.from_file, filename)
+        services = model.load(filename)
+        print('{:<24} {:7.2f} ms'.format('snapshot', snapshot_time * 1000))
+        print('{:<24} {:>10} {:>10} {:>10}'.format('', 'changes', 'diff', 'equality'))
+        for label, new_services in (('unchanged', services),
+                                    ('1 field', change_fields(services, len(services))),
+                                    ('10% of Services', change_fields(services, 10)),
+                                    ('no MIN / no SIN', drop_ids(services))):
+            new = Snapshot(new_services)
+            diff_time, changes = best_of(args.repeat, diff, old, new)
+            equal_time, modified = best_of(args.repeat, equal, services, new_services)
+            print('{:<24} {:>10} {:7.3f} ms {:7.3f} ms'.format(label, len(changes), diff_time * 1000,
+                                                                equal_time * 1000))
+        if not any(change.min is None and change.kind == ADDED for change in changes):
+            raise AssertionError('Message without a MIN not reported')
+        if not any(change.sin is None and change.kind == ADDED for change in changes):
+            raise AssertionError('Service without a SIN not reported')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
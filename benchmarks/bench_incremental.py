@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Benchmark of full vs incremental re-merge of the bundled definitions when one small customer file
+changes between merges.
+
+Usage::
+
+    python benchmarks/bench_incremental.py --repeat 20
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from benchmarks.common import BUNDLED, best_of
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full vs incremental re-merge')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of merges timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        files = []
+        for source in BUNDLED:
+            files.append(os.path.join(workdir, os.path.basename(source)))
+            shutil.copy(source, files[-1])
+        edited = min(files, key=os.path.getsize)
+        with open(edited) as f:
+            original = f.read()
+        target = os.path.join(workdir, 'merged.idpmsg')
+
+        def edit(i):
+            with open(edited, 'w') as f:
+                f.write(original.replace('<Name>', '<Name>{}'.format(i), 1))
+
+        def full():
+            idp_mdf_merge.merge_mdf(files, target)
+
+        def incremental():
+            idp_mdf_merge.merge_mdf(files, target, incremental=True)
+
+        incremental()
+        print('{} files, editing {}'.format(len(files), os.path.basename(edited)))
+        for label, merge, before in (('full', full, edit),
+                                     ('incremental', incremental, edit),
+                                     ('unchanged', incremental, None)):
+            print('{:<12} {:7.2f} ms'.format(label, best_of(args.repeat, merge, before=before)[0] * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
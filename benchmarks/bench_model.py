@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark of the compact object model vs ElementTree Elements holding the Services of the bundled
+definitions and of a synthetic set.
+
+Load is the time to parse every file and keep its Services, with the ElementTree backend for the
+model and, if installed, with lxml. Memory is the size traced by ``tracemalloc`` of the Services
+kept after loading, where ``tracemalloc`` is available. Sort orders the Services by SIN, and walk
+reads the type and Size of every Field.
+
+Usage::
+
+    python benchmarks/bench_model.py --repeat 5
+
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from operator import attrgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import model
+from idp_mdf_merge.backend import backend_error, get_backend
+from idp_mdf_merge.codec import UNSIGNED, XSI_TYPE
+from idp_mdf_merge.registry import DIRECTIONS
+from benchmarks.generator import generate_set
+from benchmarks.common import BUNDLED, best_of
+
+
+def load_elements(files):
+    return [limb for f in files for limb in ET.parse(f).getroot().find('Services')]
+
+
+def load_model(files, backend=None):
+    return [service for f in files for service in model.load(f, backend)]
+
+
+def load_model_lxml(files):
+    return load_model(files, get_backend('lxml'))
+
+
+def sort_elements(services):
+    return sorted(services, key=lambda limb: int(limb.findtext('SIN')))
+
+
+def sort_model(services):
+    return sorted(services, key=attrgetter('sin'))
+
+
+def walk_elements(services):
+    bits = 0
+    for limb in services:
+        for field in limb.iter('Field'):
+            size = field.findtext('Size')
+            if field.get(XSI_TYPE) == 'UnsignedIntField' and size:
+                bits += int(size)
+    return bits
+
+
+def _walk_fields(fields):
+    bits = 0
+    for field in fields:
+        if field.type == UNSIGNED and field.size:
+            bits += field.size
+        if field.fields:
+            bits += _walk_fields(field.fields)
+    return bits
+
+
+def walk_model(services):
+    bits = 0
+    for service in services:
+        for direction in DIRECTIONS:
+            for message in service.messages(direction):
+                bits += _walk_fields(message.fields)
+    return bits
+
+
+def resident(load, files):
+    """Returns the bytes traced for the Services kept after ``load(files)``, or None."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    services = load(files)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del services
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the compact object model vs ElementTree')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs timed per case')
+    parser.add_argument('--services', type=int, default=200, help='Services per file of the synthetic set')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        synthetic = generate_set(os.path.join(workdir, 'synthetic'), files=2, services=args.services)
+        print('{:<22} {:>10} {:>10} {:>10} {:>10}'.format('', 'load', 'memory', 'sort', 'walk'))
+        for name, files in (('bundled', BUNDLED), ('synthetic', synthetic)):
+            cases = [('ElementTree', load_elements, sort_elements, walk_elements),
+                     ('model', load_model, sort_model, walk_model)]
+            if backend_error('lxml') is None:
+                cases.append(('model lxml', load_model_lxml, sort_model, walk_model))
+            for label, load, sort, walk in cases:
+                load_time, services = best_of(args.repeat, load, files)
+                sort_time, ordered = best_of(args.repeat, sort, services)
+                walk_time, bits = best_of(args.repeat, walk, services)
+                size = resident(load, files)
+                print('{:<22} {:7.1f} ms {:>7} MB {:7.2f} ms {:7.2f} ms'.format(
+                    '{} {}'.format(name, label), load_time * 1000,
+                    '-' if size is None else '{:.1f}'.format(size / 1048576.0), sort_time * 1000, walk_time * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
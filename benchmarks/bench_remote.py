@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Benchmark of fetching remote sources with a ``RemoteFetcher`` from a local ``http.server``.
+
+Synthetic files are served on 127.0.0.1 over HTTP/1.1 keep-alive connections, with the
+``Last-Modified`` validator of ``SimpleHTTPRequestHandler``. Cases:
+
+    * ``cold`` - each file fetched into an empty cache, with one worker and with ``--workers``
+    * ``revalidate`` - a new fetcher on the same cache, each file answered ``304 Not Modified``
+    * ``remerge changed`` - ``merge_mdf`` of the URLs twice with one fetcher, the first served file
+      changed in between, checking the second merge has the changed content
+    * ``offline`` - the server stopped, each file taken from its local copy and listed in
+      ``RemoteFetcher.offline``
+    * ``merge offline`` - ``merge_mdf`` of the URLs with the server stopped, each reported with a
+      warning rather than an error
+
+Connections is the number opened, fewer than requests when kept-alive connections are reused.
+Each case checks the counts it expects and raises AssertionError otherwise.
+
+Usage::
+
+    python benchmarks/bench_remote.py --files 64 --workers 8
+
+"""
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.remote import RemoteFetcher
+from benchmarks.generator import generate_set
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory):
+    """Serves ``directory`` on a free port of 127.0.0.1 from a thread, returning (HTTPServer)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch(cache, urls, workers):
+    """Fetches ``urls`` with a new fetcher on ``cache``, returning (tuple) the seconds taken and the fetcher."""
+    fetcher = RemoteFetcher(cache, workers=workers, timeout=5)
+    start = time.time()
+    paths, errors = fetcher.fetch_all(urls)
+    elapsed = time.time() - start
+    fetcher.close()
+    if errors or len(paths) != len(urls):
+        raise AssertionError('{} URLs not fetched: {}'.format(len(errors), sorted(errors.values())[:1]))
+    return elapsed, fetcher
+
+
+def report(label, elapsed, fetcher, count):
+    print('{:<22} {:8.1f} ms {:>9} {:>12} {:>13} {:>8}'.format(label, elapsed * 1000, fetcher.requests,
+                                                                fetcher.connections, fetcher.not_modified,
+                                                                len(fetcher.offline)))
+    if fetcher.requests < count:
+        raise AssertionError('{}: {} requests for {} URLs'.format(label, fetcher.requests, count))
+
+
+def remerge_changed(workdir, cache, served, urls, workers):
+    """Merges ``urls`` twice with one fetcher, changing the ``served`` file of the first URL in between."""
+    fetcher = RemoteFetcher(cache, workers=workers, timeout=5)
+    target = os.path.join(workdir, 'remerged.idpmsg')
+    idp_mdf_merge.merge_mdf(urls, target, fetcher=fetcher)
+    with open(served) as f:
+        content = f.read()
+    with open(served, 'w') as f:
+        f.write(content.replace('<Name>synthetic', '<Name>changed', 1))
+    # newer than the validator of the first merge, so that the revalidation is answered 200
+    future = time.time() + 60
+    os.utime(served, (future, future))
+    requests = fetcher.requests
+    start = time.time()
+    error = idp_mdf_merge.merge_mdf(urls, target, fetcher=fetcher)
+    elapsed = time.time() - start
+    fetcher.close()
+    report('remerge changed x{}'.format(workers), elapsed, fetcher, 2 * len(urls))
+    if error and 'ERROR' in error:
+        raise AssertionError(error.split('\n')[0])
+    if fetcher.requests - requests != len(urls):
+        raise AssertionError('{} requests to re-merge {} URLs'.format(fetcher.requests - requests, len(urls)))
+    if fetcher.not_modified != 2 * len(urls) - 1:
+        raise AssertionError('{} of {} revalidations not modified'.format(fetcher.not_modified, 2 * len(urls) - 1))
+    with open(target) as f:
+        if '<Name>changed' not in f.read():
+            raise AssertionError('re-merge kept the stale copy of {}'.format(urls[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fetching remote sources from a local server')
+    parser.add_argument('--files', type=int, default=64, help='Files served')
+    parser.add_argument('--services', type=int, default=20, help='Services per file')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent requests of the fetcher')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    server = None
+    try:
+        served = os.path.join(workdir, 'served')
+        files = generate_set(served, files=args.files, services=args.services)
+        # older than the validators sent, so that each revalidation is answered 304
+        past = time.time() - 60
+        for f in files:
+            os.utime(f, (past, past))
+        server = start_server(served)
+        urls = ['http://127.0.0.1:{}/{}'.format(server.server_address[1], os.path.basename(f)) for f in files]
+        size = sum(os.path.getsize(f) for f in files)
+        print('{} files, {:.1f} MB'.format(len(files), size / 1048576.0))
+        print('{:<22} {:>11} {:>9} {:>12} {:>13} {:>8}'.format('case', 'time', 'requests', 'connections',
+                                                               'not modified', 'offline'))
+        for workers in (1, args.workers):
+            cache = os.path.join(workdir, 'cache{}'.format(workers))
+            elapsed, fetcher = fetch(cache, urls, workers)
+            report('cold x{}'.format(workers), elapsed, fetcher, len(urls))
+            if fetcher.connections > workers:
+                raise AssertionError('{} connections opened by {} workers'.format(fetcher.connections, workers))
+        elapsed, fetcher = fetch(cache, urls, args.workers)
+        report('revalidate x{}'.format(args.workers), elapsed, fetcher, len(urls))
+        if fetcher.not_modified != len(urls):
+            raise AssertionError('{} of {} revalidations not modified'.format(fetcher.not_modified, len(urls)))
+        remerge_changed(workdir, cache, files[0], urls, args.workers)
+        server.shutdown()
+        server.server_close()
+        server = None
+        elapsed, fetcher = fetch(cache, urls, args.workers)
+        report('offline x{}'.format(args.workers), elapsed, fetcher, len(urls))
+        if len(fetcher.offline) != len(urls):
+            raise AssertionError('{} of {} URLs fetched offline'.format(len(fetcher.offline), len(urls)))
+        fetcher = RemoteFetcher(cache, workers=args.workers, timeout=5)
+        start = time.time()
+        error = idp_mdf_merge.merge_mdf(urls, os.path.join(workdir, 'merged.idpmsg'), fetcher=fetcher)
+        elapsed = time.time() - start
+        report('merge offline x{}'.format(args.workers), elapsed, fetcher, len(urls))
+        if error and 'ERROR' in error:
+            raise AssertionError(error.split('\n')[0])
+        if 'using the local copy' not in (error or ''):
+            raise AssertionError('offline merge reported no warning')
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
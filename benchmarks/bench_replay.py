@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark of replaying a recorded message log through the merged bundled definitions.
+
+The log repeats sample payloads of every return message of the bundled definitions until it has
+``--lines`` lines. Each case replays the whole log, serially and with ``--jobs`` worker processes,
+counting only or also writing each decoded record as JSON, with the definitions loaded from the
+merged XML or from its binary export. Peak memory is the largest resident set size of the
+process and its workers so far, where the ``resource`` module is available.
+
+Usage::
+
+    python benchmarks/bench_replay.py --lines 200000 --jobs 4
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from binascii import hexlify
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.binary import binary_path
+from idp_mdf_merge.codec import Codec, RETURN
+from idp_mdf_merge.replay import replay_log
+from benchmarks.payloads import sample_payloads
+from benchmarks.common import BUNDLED
+
+
+def peak_memory():
+    """Returns (float) the peak resident set size in MB of the process and its children, or None."""
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def write_log(filename, merged, lines):
+    samples = sample_payloads(Codec.from_file(merged), variants=4, direction=RETURN)
+    with open(filename, 'w') as f:
+        for n in range(lines):
+            plan, values, payload = samples[n % len(samples)]
+            f.write('{},{},{}\n'.format(plan.sin, plan.min, hexlify(payload).decode('ascii')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark replaying a recorded message log')
+    parser.add_argument('--lines', type=int, default=200000, help='Lines of the log')
+    parser.add_argument('--jobs', type=int, default=4, help='Worker processes')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        merged = os.path.join(workdir, 'merged.idpmsg')
+        idp_mdf_merge.merge_mdf(BUNDLED, merged)
+        log = os.path.join(workdir, 'log.txt')
+        write_log(log, merged, args.lines)
+        output = os.path.join(workdir, 'records.ndjson')
+        print('{:.1f} MB log, {} lines'.format(os.path.getsize(log) / 1048576.0, args.lines))
+        print('{:<12} {:<8} {:>8} {:>12} {:>10}'.format('definitions', 'records', 'workers', 'lines/s', 'peak'))
+        for definitions in ('xml', 'binary'):
+            if definitions == 'binary':
+                idp_mdf_merge.merge_mdf(BUNDLED, merged, binary=True)
+                assert os.path.isfile(binary_path(merged))
+            for records in (None, output):
+                for workers in (None, args.jobs):
+                    start = time.time()
+                    report = replay_log(log, merged, output=records, workers=workers)
+                    elapsed = time.time() - start
+                    assert report.decoded == args.lines
+                    memory = peak_memory()
+                    print('{:<12} {:<8} {:>8} {:>12.0f} {:>10}'.format(
+                        definitions, 'json' if records else 'counts', workers or 1, args.lines / elapsed,
+                        '{:.0f} MB'.format(memory) if memory is not None else '-'))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
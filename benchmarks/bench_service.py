@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark of the HTTP merge service against running the command line tool for each merge.
+
+The service runs in its own process, as started with ``--serve``, and is called by a local client
+over keep-alive connections. Each case merges the bundled definitions with one of ``--variants``
+synthetic customer files:
+
+    * ``cli`` - one ``idp_mdf_merge --no-gui`` process per merge, one merge at a time
+    * ``service`` - one request at a time, source files resident after the first request
+    * ``service xN`` - N clients requesting merges of different customer files at once
+    * ``identical xN`` - N clients requesting the same merge at once, which share one result
+
+Latency is the median and 95th percentile time from sending a request to reading the response.
+Stats is the latency of ``GET /stats`` while a large source file is parsed for the first time,
+which measures how responsive the event loop stays during a parse.
+
+Usage::
+
+    python benchmarks/bench_service.py --requests 40 --clients 8
+
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks.generator import generate_set
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_service(port, workers=None):
+    """Starts the service in a process and waits until it accepts connections."""
+    command = [sys.executable, '-m', 'idp_mdf_merge.idp_mdf_merge', '--serve', '127.0.0.1:{}'.format(port)]
+    if workers is not None:
+        command += ['-j', str(workers)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except socket.error:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('service did not start')
+
+
+def request(connection, method, path, body=None):
+    """Returns (tuple) the seconds taken by a request and its decoded JSON response."""
+    start = time.time()
+    connection.request(method, path, json.dumps(body) if body is not None else None)
+    response = connection.getresponse()
+    data = json.loads(response.read().decode('utf-8'))
+    return time.time() - start, data
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_clients(port, bodies, clients):
+    """Sends ``bodies`` from ``clients`` threads, returning (tuple) the elapsed seconds and each latency."""
+    latencies = []
+    lock = threading.Lock()
+    queue = list(bodies)
+
+    def client():
+        connection = httplib.HTTPConnection('127.0.0.1', port)
+        try:
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    body = queue.pop()
+                elapsed, result = request(connection, 'POST', '/merge', body)
+                if result.get('xml') is None:
+                    raise RuntimeError(result.get('error'))
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, latencies
+
+
+def report(label, elapsed, latencies):
+    print('{:<16} {:>8} {:8.1f} ms {:8.1f} ms {:8.1f}/s'.format(
+        label, len(latencies), percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+        len(latencies) / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HTTP merge service against the command line')
+    parser.add_argument('--requests', type=int, default=40, help='Merges requested per case')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--variants', type=int, default=4, help='Distinct customer files merged')
+    parser.add_argument('--cli', type=int, default=5, help='Merges run with the command line tool')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes of the service')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    port = free_port()
+    process = start_service(port, args.workers)
+    try:
+        customers = [generate_set(os.path.join(workdir, 'customer{}'.format(n)), files=1, services=5,
+                                  first_sin=128 + 10 * n, seed=n)[0] for n in range(args.variants)]
+        large = generate_set(os.path.join(workdir, 'large'), files=1, services=300, first_sin=128)[0]
+        bodies = [{'files': [customers[n % args.variants]], 'modem': True, 'lsf': True} for n in range(args.requests)]
+        print('{:<16} {:>8} {:>11} {:>11} {:>10}'.format('', 'merges', 'median', 'p95', 'throughput'))
+        latencies = []
+        start = time.time()
+        for n in range(args.cli):
+            target = os.path.join(workdir, 'cli.idpmsg')
+            began = time.time()
+            subprocess.check_call([sys.executable, '-m', 'idp_mdf_merge.idp_mdf_merge', '--no-gui', '--no-cache',
+                                   '-m', '-l', '-f', customers[n % args.variants], '-t', target], cwd=ROOT,
+                                  stdout=subprocess.PIPE)
+            latencies.append(time.time() - began)
+        report('cli', time.time() - start, latencies)
+        report('service', *run_clients(port, bodies, 1))
+        report('service x{}'.format(args.clients), *run_clients(port, bodies, args.clients))
+        report('identical x{}'.format(args.clients), *run_clients(port, bodies[:1] * args.requests, args.clients))
+        parse = threading.Thread(target=run_clients, args=(port, [{'files': [large]}], 1))
+        connection = httplib.HTTPConnection('127.0.0.1', port)
+        stats = []
+        parse.start()
+        while parse.is_alive():
+            stats.append(request(connection, 'GET', '/stats')[0])
+        parse.join()
+        connection.close()
+        print('stats during a {:.1f} MB parse: {} requests, max {:.1f} ms'.format(
+            os.path.getsize(large) / 1048576.0, len(stats), max(stats) * 1000))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Benchmark of splitting a merge of a synthetic set of Services of varied sizes into shards within a
+byte budget.
+
+Pack compares the number of shards and the time taken by the first fit decreasing packing of
+``shard.pack`` with next fit in ascending order of SIN, i.e. starting a new shard whenever the next
+Service does not fit in the current one. Write is the time to write the shards serially and with
+``--jobs`` threads.
+
+Usage::
+
+    python benchmarks/bench_shards.py --services 400 --budget 262144 --jobs 4
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.backend import get_backend
+from idp_mdf_merge.shard import pack, split_services
+from idp_mdf_merge.writer import SEPARATOR, document_size
+from benchmarks.generator import generate_set
+from benchmarks.common import best_of
+
+
+def next_fit(weights, capacity):
+    """Packs items in ascending order into the current bin, opening a new bin when one does not fit."""
+    bins = []
+    load = None
+    for item in sorted(weights):
+        if load is None or load + weights[item] > capacity:
+            bins.append([])
+            load = 0
+        bins[-1].append(item)
+        load += weights[item]
+    return bins
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark splitting a merge into shards')
+    parser.add_argument('--services', type=int, default=400, help='Services of the synthetic set')
+    parser.add_argument('--budget', type=int, default=256 * 1024, help='Largest size of a shard in bytes')
+    parser.add_argument('--jobs', type=int, default=4, help='Threads writing shards')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        # Services of 2 to 25 messages per direction, so that their sizes vary
+        files = []
+        for n, messages in enumerate((2, 5, 10, 25)):
+            files.extend(generate_set(os.path.join(workdir, 'synthetic{}'.format(n)), files=1,
+                                      services=args.services // 4, messages=messages,
+                                      first_sin=128 + n * args.services, seed=n))
+        pipeline = idp_mdf_merge.default_pipeline()
+        loaded = [(f, idp_mdf_merge.serialize_file(f, pipeline, get_backend())) for f in files]
+        services, namespaces = idp_mdf_merge.resolve_services(loaded, [])
+        declarations = idp_mdf_merge.root_declarations(namespaces)
+        weights = dict((sin, len(xml) + len(SEPARATOR)) for sin, xml in services.items())
+        capacity = args.budget - document_size(declarations, []) + len(SEPARATOR)
+        total = document_size(declarations, [len(xml) for xml in services.values()])
+        print('{} Services, {:.1f} MB merged, {} KB budget'.format(len(services), total / 1048576.0,
+                                                                 args.budget // 1024))
+        for label, packer in (('first fit decreasing', pack), ('next fit by SIN', next_fit)):
+            pack_time, bins = best_of(args.repeat, packer, weights, capacity)
+            fill = total / float(len(bins) * args.budget)
+            print('{:<24} {:>4} shards {:5.0f}% full {:7.2f} ms'.format(label, len(bins), fill * 100,
+                                                                          pack_time * 1000))
+        target = os.path.join(workdir, 'merged.idpmsg')
+        for label, workers in (('write serial', None), ('write {} threads'.format(args.jobs), args.jobs)):
+            write_time, shards = best_of(args.repeat, split_services, services, namespaces, target, args.budget,
+                                         None, None, workers)
+            print('{:<24} {:>4} shards {:>11} {:7.2f} ms'.format(label, len(shards), '', write_time * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark of the message size bounds index of the bundled definitions and of a synthetic set.
+
+Index is the time to compute the bounds of every message of Services already loaded in the model,
+memoizing bounds by field layout across the whole set, and unshared with a memo per top-level
+Field, i.e. computing each field from its definition. File is the time to build the index of a
+file including parsing, and cached the time to read it back from a ``DefinitionCache``.
+
+Usage::
+
+    python benchmarks/bench_sizes.py --services 200 --repeat 5
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge, model
+from idp_mdf_merge.cache import DefinitionCache
+from idp_mdf_merge.codec import CodecError
+from idp_mdf_merge.registry import DIRECTIONS
+from idp_mdf_merge.sizes import SizeIndex, field_bounds
+from benchmarks.generator import generate_set
+from benchmarks.common import best_of
+
+BUNDLED = os.path.join(idp_mdf_merge.OUTPUT_PATH, 'skywave_lsf_core_agents.idpmsg')
+
+
+def index_unshared(services):
+    """Computes the maximum bits of every message with a new memo per top-level Field."""
+    count = 0
+    for service in services:
+        for direction in DIRECTIONS:
+            for message in service.messages(direction):
+                for field in message.fields:
+                    try:
+                        field_bounds(field, {})
+                    except CodecError:
+                        pass
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the message size bounds index')
+    parser.add_argument('--services', type=int, default=200, help='Services of the synthetic file')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        synthetic = generate_set(os.path.join(workdir, 'synthetic'), files=1, services=args.services, depth=2)[0]
+        cache = DefinitionCache(os.path.join(workdir, 'cache'))
+        print('{:<12} {:>9} {:>10} {:>10} {:>10} {:>10} {:>8}'.format('', 'messages', 'index', 'unshared', 'file',
+                                                                        'cached', 'layouts'))
+        for name, filename in (('bundled', BUNDLED), ('synthetic', synthetic)):
+            services = model.load(filename)
+            index_time, index = best_of(args.repeat, SizeIndex, services)
+            unshared_time, _ = best_of(args.repeat, index_unshared, services)
+            file_time, _ = best_of(args.repeat, SizeIndex.from_file, filename)
+            SizeIndex.from_file(filename, cache=cache)
+            cached_time, _ = best_of(args.repeat, SizeIndex.from_file, filename, None,
+                                     DefinitionCache(cache.directory))
+            print('{:<12} {:>9} {:7.2f} ms {:7.2f} ms {:7.1f} ms {:7.2f} ms {:>8}'.format(
+                name, len(index) + len(index.errors), index_time * 1000, unshared_time * 1000, file_time * 1000,
+                cached_time * 1000, len(index._memo)))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Benchmark of import time and end-to-end latency of the headless merge core.
+
+Each case runs in a fresh interpreter and the fastest of ``--repeat`` runs is reported,
+including the cost of importing the Tkinter UI where it is available.
+
+Usage::
+
+    python benchmarks/bench_startup.py --repeat 10
+
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'idp_mdf_merge', 'idp_mdf_merge.py')
+
+
+def best_time(command, repeat):
+    """Returns the fastest wall time in seconds of running ``command``, or None if it fails."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(command, cwd=ROOT, stdout=devnull, stderr=devnull) != 0:
+                return None
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time and end-to-end latency')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of runs per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        target = os.path.join(workdir, 'merged.idpmsg')
+        cases = (
+            ('interpreter', [sys.executable, '-c', 'pass']),
+            ('import core', [sys.executable, '-c', 'import idp_mdf_merge.idp_mdf_merge']),
+            ('import core + UI', [sys.executable, '-c', 'import idp_mdf_merge.gui']),
+            ('merge -m -l --no-gui', [sys.executable, SCRIPT, '--no-gui', '--no-cache', '-m', '-l', '-t', target]),
+        )
+        for label, command in cases:
+            elapsed = best_time(command, args.repeat)
+            if elapsed is None:
+                print('{:<22} unavailable'.format(label))
+            else:
+                print('{:<22} {:8.1f} ms'.format(label, elapsed * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
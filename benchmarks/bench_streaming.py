@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark of peak memory and elapsed time for in-memory vs streaming merges.
+
+Builds a synthetic ``.idpmsg`` file of the requested size by replicating the Services of the
+bundled LSF core/agent definitions under new SINs, then merges it in a separate process per
+mode so that each peak resident set size is measured independently.
+
+Usage::
+
+    python benchmarks/bench_streaming.py --size-mb 100
+
+"""
+import argparse
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+
+SEED_FILE = os.path.join(idp_mdf_merge.LSF_CORE_PATH, idp_mdf_merge.LSF_CORE_AGENTS_FILE)
+
+
+def make_synthetic(filename, size_mb):
+    """Writes a message definition file of approximately ``size_mb`` megabytes."""
+    with open(SEED_FILE, 'rb') as f:
+        seed = f.read()
+    services = re.findall(br'    <Service>.*?</Service>\n', seed, re.DOTALL)
+    head = seed[:seed.index(b'<Services>') + len(b'<Services>\n')]
+    tail = b'  </Services>\n</MessageDefinition>\n'
+    target = size_mb * 1024 * 1024
+    written = 0
+    sin = 0
+    with open(filename, 'wb') as f:
+        f.write(head)
+        while written < target:
+            service = services[sin % len(services)]
+            service = re.sub(br'(?m)^      <SIN>\d+</SIN>', '      <SIN>{}</SIN>'.format(sin).encode('utf-8'),
+                             service, count=1)
+            f.write(service)
+            written += len(service)
+            sin += 1
+        f.write(tail)
+    return sin
+
+
+def run_one(filename, stream):
+    """Merges ``filename`` in this process and prints elapsed seconds and peak RSS in kB."""
+    target = os.path.join(os.path.dirname(filename), 'merged.idpmsg')
+    start = time.time()
+    idp_mdf_merge.merge_mdf([filename], target, stream=stream)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    print('{:.3f} {}'.format(elapsed, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming vs in-memory merge')
+    parser.add_argument('--size-mb', type=int, default=100, help='Size of the synthetic input file')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--stream', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_one(args.run, args.stream)
+        return
+    workdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(workdir, 'synthetic.idpmsg')
+        count = make_synthetic(filename, args.size_mb)
+        print('Synthetic input: {} Services, {:.1f} MB'.format(count, os.path.getsize(filename) / 1048576.0))
+        for label, flags in (('in-memory', []), ('streaming', ['--stream'])):
+            out = subprocess.check_output([sys.executable, os.path.realpath(__file__), '--run', filename] + flags)
+            elapsed, peak = out.decode('utf-8').split()
+            print('{:<10} {:>8}s  peak RSS {:>8.1f} MB'.format(label, elapsed, int(peak) / 1024.0))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Benchmark of the transform pipeline vs normalizing each Service in separate passes (prune, then
+metadata tags, then descriptions, then any validation) on the LSF core/agent definitions.
+
+The separate passes search each Service for its Messages and each Message for its Name and MIN to
+apply metadata tags, and walk the Messages again to validate them with ``validate_service``. The
+pipeline walks the Messages once for both, reading the Name, MIN and Fields of each Message in one
+loop over its elements. Both search each Service once for its Descriptions. Each case checks that
+the pipeline produces the same Services and diagnostics as the separate passes, then times both
+alternately on freshly parsed Services, reporting the fastest run of each and their ratio.
+
+Usage::
+
+    python benchmarks/bench_transform.py --repeat 50
+
+"""
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.transform import ValidateStage
+from idp_mdf_merge.validate import validate_service
+
+SOURCE = os.path.join(idp_mdf_merge.LSF_CORE_PATH, idp_mdf_merge.LSF_CORE_AGENTS_FILE)
+
+
+def multi_pass(limb, meta, validate, exceptions):
+    """
+    Normalizes a Service with one pass per step, as before the transform pipeline.
+    """
+    service = limb.find('SIN').text
+    for twig in [twig for twig in limb if twig.tag not in idp_mdf_merge.SUPPORTED_TAGS]:
+        limb.remove(twig)
+        exceptions.append("WARNING: Found/removed unsupported tag {tag} "
+                          "in {service}".format(tag=twig.tag, service=service))
+    if meta:
+        limb.set('sin', service)
+        limb.set('name', limb.find('Name').text or "*undefined*")
+        for msg in limb.iter('Message'):
+            if msg.find('MIN').text:
+                msg.set('min', msg.find('MIN').text)
+            else:
+                exceptions.append("ERROR: MIN not specified in SIN {sin}".format(sin=service))
+            msg.set('name', msg.find('Name').text or '*undefined*')
+    for desc in limb.iter('Description'):
+        desc.text = idp_mdf_merge.clean_desc(desc.text)
+    if validate:
+        validate_service(limb, service, exceptions)
+
+
+def best_of(repeat, *normalizers):
+    """
+    Times ``normalize(services)`` of each normalizer in turn, ``repeat`` times, parsing untimed.
+
+    :return: (list of float) the fastest run of each normalizer in seconds
+
+    """
+    best = [None] * len(normalizers)
+    for _ in range(repeat):
+        for i, normalize in enumerate(normalizers):
+            services = list(ET.parse(SOURCE).getroot()[0])
+            start = time.time()
+            normalize(services)
+            elapsed = time.time() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return best
+
+
+def normalized(normalize):
+    """Returns (tuple) the serialized Services and the sorted diagnostics of ``normalize(services, exceptions)``."""
+    services = list(ET.parse(SOURCE).getroot()[0])
+    exceptions = []
+    normalize(services, exceptions)
+    return [ET.tostring(limb) for limb in services], sorted(exceptions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the transform pipeline vs multi-pass normalization')
+    parser.add_argument('--repeat', type=int, default=50, help='Number of runs timed per case')
+    args = parser.parse_args()
+    services = list(ET.parse(SOURCE).getroot()[0])
+    elements = sum(sum(1 for elem in limb.iter()) for limb in services)
+    print('{}: {} Services, {} elements'.format(os.path.basename(SOURCE), len(services), elements))
+    print('{:<20} {:>12} {:>12} {:>7}'.format('', 'multi-pass', 'pipeline', 'ratio'))
+    for meta, validate in ((False, False), (True, False), (False, True), (True, True)):
+        pipeline = idp_mdf_merge.default_pipeline(meta)
+        if validate:
+            pipeline.register(ValidateStage())
+
+        def separate(services, exceptions=None):
+            for limb in services:
+                multi_pass(limb, meta, validate, [] if exceptions is None else exceptions)
+
+        def single(services, exceptions=None):
+            for limb in services:
+                pipeline.run(limb, [] if exceptions is None else exceptions)
+
+        if normalized(separate) != normalized(single):
+            raise AssertionError('pipeline differs from multi-pass with meta={} validate={}'.format(meta, validate))
+        options = ' '.join(option for option, used in (('meta', meta), ('validate', validate)) if used)
+        separate_time, single_time = best_of(args.repeat, separate, single)
+        print('{:<20} {:9.2f} ms {:9.2f} ms {:7.2f}'.format(options or 'default', separate_time * 1000,
+                                                              single_time * 1000, single_time / separate_time))
+
+if __name__ == '__main__':
+    main()
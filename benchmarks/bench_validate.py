@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark of validating synthetic Services and of writing the error log of a merge.
+
+Cases:
+
+    * ``rules`` - ``validate_service`` on each parsed Service, the checks of each field type
+      compiled once in ``FIELD_RULES``
+    * ``merge`` - a merge of the set, streamed or not, with and without ``validate=True``; SINs
+      of the set beyond 255 and 32-bit Unsigned fields are reported
+    * ``log`` - writing ``--diagnostics`` warnings, 100 distinct texts repeated, to an error log by
+      string concatenation as before the ``ErrorLog``, and with an ``ErrorLog`` writing all or at
+      most ``MAX_REPEATS`` repeats of each
+
+Usage::
+
+    python benchmarks/bench_validate.py --services 10000 --repeat 3
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.validate import ErrorLog, MAX_REPEATS, validate_service
+from benchmarks.generator import generate_set
+from benchmarks.common import best_of
+
+
+def validate_all(services):
+    exceptions = []
+    for limb in services:
+        validate_service(limb, limb.findtext('SIN'), exceptions)
+    return len(exceptions)
+
+
+def merge(files, target, stream, validate):
+    return idp_mdf_merge.merge_mdf(files, target, stream=stream, validate=validate)
+
+
+def concatenate_log(filename, exceptions):
+    """Writes an error log as before the ``ErrorLog``."""
+    error_string = ''
+    for e in exceptions:
+        if error_string != '':
+            error_string += '\n'
+        error_string += e
+    with open(filename, 'w') as f:
+        f.write(error_string)
+    return len(error_string)
+
+
+def stream_log(filename, exceptions, max_repeats):
+    with ErrorLog(filename, max_repeats) as log:
+        for e in exceptions:
+            log.append(e)
+    return len(log.text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark validating Services and writing the error log')
+    parser.add_argument('--services', type=int, default=10000, help='Services of the synthetic set')
+    parser.add_argument('--messages', type=int, default=2, help='Messages per direction of each Service')
+    parser.add_argument('--fields', type=int, default=6, help='Fields per message')
+    parser.add_argument('--diagnostics', type=int, default=200000, help='Diagnostics written to the error log')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs timed per case')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        files = generate_set(os.path.join(workdir, 'synthetic'), files=4, services=args.services // 4,
+                             messages=args.messages, fields=args.fields)
+        size = sum(os.path.getsize(f) for f in files)
+        services = [limb for f in files for limb in ET.parse(f).getroot()[0]]
+        print('{} Services, {} Fields, {:.1f} MB'.format(len(services), sum(1 for limb in services
+                                                                           for field in limb.iter('Field')),
+                                                      size / 1048576.0))
+        print('{:<28} {:>10} {:>14} {:>12}'.format('case', 'time', 'per Service', 'diagnostics'))
+        elapsed, diagnostics = best_of(args.repeat, validate_all, services)
+        print('{:<28} {:7.0f} ms {:11.1f} us {:>12}'.format('rules', elapsed * 1000, elapsed * 1e6 / len(services),
+                                                           diagnostics))
+        target = os.path.join(workdir, 'merged.idpmsg')
+        for stream in (False, True):
+            for validate in (False, True):
+                elapsed, error = best_of(args.repeat, merge, files, target, stream, validate)
+                label = 'merge{}{}'.format(' stream' if stream else '', ' validate' if validate else '')
+                print('{:<28} {:7.0f} ms {:11.1f} us {:>12}'.format(label, elapsed * 1000,
+                                                                   elapsed * 1e6 / len(services),
+                                                                   len(error.split('\n')) if error else 0))
+        exceptions = ['WARNING: Diagnostic {kind} of a benchmark - SIN 128'.format(kind=n % 100)
+                      for n in range(args.diagnostics)]
+        log = os.path.join(workdir, 'merged_ERR.log')
+        for label, run, extra in (('log concatenation', concatenate_log, ()),
+                                  ('log ErrorLog all', stream_log, (None,)),
+                                  ('log ErrorLog capped', stream_log, (MAX_REPEATS,))):
+            elapsed, written = best_of(args.repeat, run, log, exceptions, *extra)
+            print('{:<28} {:7.0f} ms {:>14} {:>9.1f} KB'.format(label, elapsed * 1000, '', written / 1024.0))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
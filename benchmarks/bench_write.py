@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Benchmark of writing a merged tree with the streaming ``MdfWriter`` vs serializing a whole
+ElementTree document, on the bundled definitions and a large synthetic set.
+
+Time to first byte is when the first block of output reaches the file. Peak memory is the peak
+traced by ``tracemalloc`` while writing, excluding the Services already loaded.
+
+Usage::
+
+    python benchmarks/bench_write.py --repeat 10
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.registry import ServiceRegistry
+from idp_mdf_merge.writer import MdfWriter, service_namespaces
+from benchmarks.generator import generate_set
+from benchmarks.common import BUNDLED
+
+
+class FirstWrite(object):
+    """File wrapper recording the time of the first write."""
+    def __init__(self, f):
+        self.f = f
+        self.first = None
+
+    def write(self, data):
+        if self.first is None:
+            self.first = time.time()
+        return self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+class TimedWriter(MdfWriter):
+    def _open(self, path):
+        self.file = FirstWrite(MdfWriter._open(self, path))
+        return self.file
+
+
+def write_element_tree(target, registry):
+    """Writes the merged document as a whole ElementTree, returning the time of the first write."""
+    root = ET.Element('MessageDefinition')
+    root.tail = '\n'
+    root.text = '\n  '
+    trunk = ET.SubElement(root, 'Services')
+    trunk.tail = '\n'
+    trunk.text = '\n    '
+    trunk.extend(registry.by_sin())
+    for limb in trunk:
+        limb.tail = '\n    '
+    trunk[-1].tail = '\n  '
+    for prefix, uri in idp_mdf_merge.NS.items():
+        root.set('xmlns:' + prefix, uri)
+    with open(target, 'wb') as f:
+        out = FirstWrite(f)
+        ET.ElementTree(root).write(out, encoding='utf-8', xml_declaration=True)
+    return out.first
+
+
+def write_streaming(target, registry):
+    """Writes the merged document with ``MdfWriter``, returning the time of the first write."""
+    services = registry.by_sin()
+    namespaces = sorted(service_namespaces(services).items()) + list(idp_mdf_merge.NS.items())
+    with TimedWriter(target, namespaces) as out:
+        for limb in services:
+            out.write_service(limb)
+    return out.file.first
+
+
+def measure(repeat, write, target, registry):
+    """Returns the best total and first byte times in seconds and the peak traced memory in bytes."""
+    total = first = None
+    for _ in range(repeat):
+        start = time.time()
+        first_write = write(target, registry)
+        end = time.time()
+        total = end - start if total is None else min(total, end - start)
+        first = first_write - start if first is None else min(first, first_write - start)
+    peak = None
+    try:
+        import tracemalloc
+        tracemalloc.start()
+        write(target, registry)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except ImportError:
+        pass
+    return total, first, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming vs ElementTree output of a merge')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of writes timed per case')
+    parser.add_argument('--services', type=int, default=400, help='Services per file of the synthetic set')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        synthetic = generate_set(os.path.join(workdir, 'synthetic'), files=4, services=args.services, messages=10)
+        print('{:<24} {:>8} {:>10} {:>12} {:>10}'.format('', 'MB', 'write', 'first byte', 'peak'))
+        for name, files in (('bundled', BUNDLED), ('synthetic', synthetic)):
+            registry = ServiceRegistry()
+            target = os.path.join(workdir, name + '.idpmsg')
+            idp_mdf_merge.merge_mdf(files, target, registry=registry, backend='etree')
+            for label, write in (('ElementTree', write_element_tree), ('streaming', write_streaming)):
+                total, first, peak = measure(args.repeat, write, target, registry)
+                print('{:<24} {:>8.1f} {:>7.1f} ms {:>9.1f} ms {:>7} MB'.format(
+                    '{} {}'.format(name, label), os.path.getsize(target) / 1048576.0, total * 1000, first * 1000,
+                    '-' if peak is None else '{:.1f}'.format(peak / 1048576.0)))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Bundled inputs and timing shared by the benchmarks.
+"""
+import os
+import time
+
+from idp_mdf_merge import idp_mdf_merge
+
+# The bundled message definition files, without any merged output written next to them
+BUNDLED = [os.path.join(idp_mdf_merge.OUTPUT_PATH, name) for name in sorted(os.listdir(idp_mdf_merge.OUTPUT_PATH))
+           if name.endswith('.idpmsg') and name != idp_mdf_merge.OUTPUT_FILE]
+
+
+def best_of(repeat, run, *args, **options):
+    """
+    Returns the fastest of ``repeat`` calls to ``run(*args)`` in seconds, and the result of the last.
+
+    :param before: (function) called untimed with the number of each call before it, or None
+
+    """
+    before = options.get('before')
+    best = result = None
+    for i in range(repeat):
+        if before is not None:
+            before(i)
+        start = time.time()
+        result = run(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
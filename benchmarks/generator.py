@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Generator of synthetic message definition files for benchmarks.
+
+Files are laid out like the bundled definitions: every Service has a Description, which the merge
+prunes as an unsupported tag, and messages draw their fields from all ten field types of the
+``idp_mdf_merge`` data type table. ArrayFields nest up to ``depth`` levels of Fields. As in the
+bundled files, a MessageField embeds a message chosen at run time and so has no Fields of its own.
+SINs are allocated consecutively, so large sets go beyond the 8-bit SIN range of a terminal, which
+only a merge with ``validate=True`` reports.
+
+Usage::
+
+    python benchmarks/generator.py --services 500 --messages 20 --files 4 --duplicates 0.1 /tmp/mdf
+
+"""
+import argparse
+import os
+import random
+
+# Field types and their relative frequency in the bundled definitions
+FIELD_MIX = {
+    'EnumField': 7,
+    'BooleanField': 4,
+    'UnsignedIntField': 50,
+    'SignedIntField': 20,
+    'StringField': 6,
+    'DataField': 4,
+    'ArrayField': 5,
+    'DynamicField': 2,
+    'PropertyField': 2,
+    'MessageField': 0.5,
+}
+
+_HEAD = ('<?xml version="1.0" encoding="utf-8"?>\n'
+         '<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+         'xmlns:xsd="http://www.w3.org/2001/XMLSchema">\n'
+         '  <Services>\n')
+_TAIL = '  </Services>\n</MessageDefinition>\n'
+_WORDS = ('terminal', 'position', 'report', 'interval', 'status', 'sensor', 'value', 'event',
+          'config', 'speed', 'heading', 'battery', 'level', 'count', 'mode', 'timestamp')
+
+
+class MdfGenerator(object):
+    """
+    Builds synthetic Services.
+
+    :param messages: (int) messages per direction of each Service
+    :param fields: (int) fields per message, and per level of an ArrayField
+    :param field_mix: (dict) relative weight of each field type name, default ``FIELD_MIX``
+    :param depth: (int) maximum nesting depth of ArrayFields, 0 for none
+    :param seed: (int) random seed, the same seed generating the same files
+
+    """
+    def __init__(self, messages=10, fields=8, field_mix=None, depth=1, seed=0):
+        self.messages = messages
+        self.fields = fields
+        self.depth = depth
+        self.random = random.Random(seed)
+        mix = field_mix if field_mix is not None else FIELD_MIX
+        self._types = sorted(name for name in mix if mix[name] > 0)
+        self._weights = [mix[name] for name in self._types]
+        self._total = float(sum(self._weights))
+
+    def _name(self, i):
+        return '{}{}{}'.format(self.random.choice(_WORDS), self.random.choice(_WORDS).title(), i)
+
+    def _pick_type(self, depth):
+        while True:
+            point = self.random.random() * self._total
+            for name, weight in zip(self._types, self._weights):
+                point -= weight
+                if point < 0:
+                    break
+            if name != 'ArrayField' or depth < self.depth or len(self._types) == 1:
+                return name
+
+    def field(self, i, indent, depth=0):
+        """Returns (string) the XML of one Field."""
+        ftype = self._pick_type(depth)
+        pad = ' ' * indent
+        lines = ['{}<Field xsi:type="{}">'.format(pad, ftype),
+                 '{}  <Name>{}</Name>'.format(pad, self._name(i))]
+        if i % 3 == 0:
+            lines.append('{}  <Description>The {} of the\n{}  record.</Description>'.format(
+                pad, self.random.choice(_WORDS), pad))
+        if i % 5 == 4:
+            lines.append('{}  <Optional>true</Optional>'.format(pad))
+        if ftype == 'EnumField':
+            lines.append('{}  <Items>'.format(pad))
+            for j in range(self.random.randint(2, 8)):
+                lines.append('{}    <string>{}</string>'.format(pad, self._name(j)))
+            lines.append('{}  </Items>'.format(pad))
+            lines.append('{}  <Size>4</Size>'.format(pad))
+        elif ftype in ('UnsignedIntField', 'SignedIntField'):
+            lines.append('{}  <Size>{}</Size>'.format(pad, self.random.choice((8, 16, 24, 32))))
+        elif ftype in ('StringField', 'DataField'):
+            if i % 4 == 1:
+                lines.append('{}  <Fixed>true</Fixed>'.format(pad))
+            lines.append('{}  <Size>{}</Size>'.format(pad, self.random.choice((8, 32, 128))))
+        elif ftype == 'ArrayField':
+            lines.append('{}  <Fields>'.format(pad))
+            for j in range(max(1, self.fields // 2)):
+                lines.append(self.field(j, indent + 4, depth + 1))
+            lines.append('{}  </Fields>'.format(pad))
+            lines.append('{}  <Size>{}</Size>'.format(pad, self.random.choice((4, 16, 255))))
+        elif ftype == 'PropertyField':
+            lines.append('{}  <SIN>{}</SIN>'.format(pad, self.random.randint(16, 255)))
+            lines.append('{}  <PIN>{}</PIN>'.format(pad, self.random.randint(1, 255)))
+        lines.append('{}</Field>'.format(pad))
+        return '\n'.join(lines)
+
+    def message(self, min, indent):
+        """Returns (string) the XML of one Message."""
+        pad = ' ' * indent
+        lines = ['{}<Message>'.format(pad),
+                 '{}  <Name>{}</Name>'.format(pad, self._name(min)),
+                 '{}  <Description>Synthetic message {}.</Description>'.format(pad, min),
+                 '{}  <MIN>{}</MIN>'.format(pad, min)]
+        if self.fields > 0:
+            lines.append('{}  <Fields>'.format(pad))
+            for i in range(self.fields):
+                lines.append(self.field(i, indent + 4))
+            lines.append('{}  </Fields>'.format(pad))
+        lines.append('{}</Message>'.format(pad))
+        return '\n'.join(lines)
+
+    def service(self, sin):
+        """Returns (string) the XML of one Service, with a trailing line feed."""
+        lines = ['    <Service>',
+                 '      <Name>synthetic{}</Name>'.format(sin),
+                 '      <Description>Synthetic service {}.</Description>'.format(sin),
+                 '      <SIN>{}</SIN>'.format(sin)]
+        for direction in ('ForwardMessages', 'ReturnMessages'):
+            if self.messages > 0:
+                lines.append('      <{}>'.format(direction))
+                for min in range(1, self.messages + 1):
+                    lines.append(self.message(min, 8))
+                lines.append('      </{}>'.format(direction))
+        lines.append('    </Service>\n')
+        return '\n'.join(lines)
+
+
+def generate_set(directory, files=1, services=10, messages=10, fields=8, field_mix=None, depth=1,
+                 duplicates=0.0, first_sin=128, seed=0):
+    """
+    Writes a set of synthetic message definition files.
+
+    :param directory: (string) where the files are written, created if missing
+    :param files: (int) number of files
+    :param services: (int) Services per file
+    :param messages: (int) messages per direction of each Service
+    :param fields: (int) fields per message
+    :param field_mix: (dict) relative weight of each field type name, default ``FIELD_MIX``
+    :param depth: (int) maximum nesting depth of ArrayFields
+    :param duplicates: (float) fraction of Services reusing a SIN already used in the set
+    :param first_sin: (int) SIN of the first Service
+    :param seed: (int) random seed
+    :return: (list of string) path/filename of each file
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    generator = MdfGenerator(messages=messages, fields=fields, field_mix=field_mix, depth=depth, seed=seed)
+    used = []
+    filenames = []
+    for n in range(files):
+        filename = os.path.join(directory, 'synthetic{:03d}.idpmsg'.format(n))
+        with open(filename, 'w') as f:
+            f.write(_HEAD)
+            for i in range(services):
+                if used and generator.random.random() < duplicates:
+                    sin = generator.random.choice(used)
+                else:
+                    sin = first_sin + len(used)
+                    used.append(sin)
+                f.write(generator.service(sin))
+            f.write(_TAIL)
+        filenames.append(filename)
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic message definition files')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('--files', type=int, default=1, help='Number of files')
+    parser.add_argument('--services', type=int, default=10, help='Services per file')
+    parser.add_argument('--messages', type=int, default=10, help='Messages per direction of each Service')
+    parser.add_argument('--fields', type=int, default=8, help='Fields per message')
+    parser.add_argument('--depth', type=int, default=1, help='Maximum nesting depth of ArrayFields')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='Fraction of Services with a duplicate SIN')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    for filename in generate_set(args.directory, files=args.files, services=args.services,
+                                 messages=args.messages, fields=args.fields, depth=args.depth,
+                                 duplicates=args.duplicates, seed=args.seed):
+        print('{} ({:.1f} MB)'.format(filename, os.path.getsize(filename) / 1048576.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Deterministic sample field values and payloads for the compiled message plans of a Codec.
+"""
+from idp_mdf_merge.codec import ENUM, BOOLEAN, UNSIGNED, SIGNED, STRING, DATA
+
+_TEXT = 'The quick brown fox jumps over the lazy dog'
+
+
+def sample_values(fields, variant=0):
+    """
+    Returns a dict of valid values for ``fields`` that varies with ``variant``.
+
+    :param fields: (tuple of FieldPlan) e.g. ``MessagePlan.fields``
+    :param variant: (int) selects which optional fields are present and the values used
+
+    """
+    values = {}
+    for i, field in enumerate(fields):
+        if field.optional and (variant + i) % 2:
+            continue
+        ftype = field.type
+        if ftype == BOOLEAN:
+            value = (variant + i) % 2 == 0
+        elif ftype == ENUM:
+            count = min(len(field.items), 1 << field.size)
+            value = field.items[variant % count] if count else 0
+        elif ftype == UNSIGNED:
+            value = ((1 << field.size) - 1) if variant % 2 else variant % (1 << field.size)
+        elif ftype == SIGNED:
+            value = (-(1 << (field.size - 1)), (1 << (field.size - 1)) - 1, 0)[variant % 3]
+        elif ftype in (STRING, DATA):
+            length = field.size if field.fixed else min(field.size, 3 + variant % 5)
+            if ftype == STRING:
+                value = (_TEXT * (length // len(_TEXT) + 1))[:length]
+            else:
+                value = bytes(bytearray((j * 7 + variant) % 256 for j in range(length)))
+        else:
+            count = field.size if field.fixed else min(field.size, 1 + variant % 3)
+            value = [sample_values(field.fields, variant + j) for j in range(count)]
+        values[field.name] = value
+    return values
+
+
+def sample_payloads(codec, variants=4, direction=None):
+    """
+    Returns a list of ``(plan, values, payload)`` for each compiled message of a Codec.
+
+    :param codec: (Codec) with compiled plans
+    :param variants: (int) number of distinct payloads per message
+    :param direction: ``FORWARD`` or ``RETURN`` to restrict the messages, or None for both
+
+    """
+    samples = []
+    for key in sorted(codec.plans):
+        plan = codec.plans[key]
+        if direction is not None and plan.direction != direction:
+            continue
+        for variant in range(variants):
+            values = sample_values(plan.fields, variant)
+            samples.append((plan, values, codec.encode(plan.sin, plan.min, values, plan.direction)))
+    return samples
+
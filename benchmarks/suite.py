@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Merge benchmark suite over the bundled definitions and synthetic sets of increasing size.
+
+Each case is timed end to end through ``merge_mdf`` in tree, stream and incremental mode (with no
+input changed since the previous merge), and phase by phase (parse, prune, describe, index, write)
+for a tree merge, as measured by ``MergeStats``. Peak traced memory of a tree and a stream merge is recorded where ``tracemalloc``
+is available. Results are written as JSON, and can be compared with the JSON of an earlier run or
+release.
+
+Usage::
+
+    python benchmarks/suite.py --scale small medium --output results.json
+    python benchmarks/suite.py --compare results-1.1.0.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from idp_mdf_merge import idp_mdf_merge
+from idp_mdf_merge.stats import MergeStats, PHASES
+from benchmarks.generator import generate_set
+from benchmarks.common import BUNDLED, best_of
+
+# Synthetic sets by scale: generate_set keyword arguments
+SCALES = {
+    'small': dict(files=4, services=25, messages=5, duplicates=0.05),
+    'medium': dict(files=4, services=100, messages=10, duplicates=0.05),
+    'large': dict(files=8, services=200, messages=10, duplicates=0.05),
+}
+
+
+def peak_memory(run):
+    """Returns the peak traced memory in bytes of ``run()``, or None without ``tracemalloc``."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def phases(files, target):
+    """
+    Runs a tree merge instrumented with ``MergeStats``.
+
+    :return: (tuple) seconds spent in each phase (dict), and the number of Services merged
+
+    """
+    stats = MergeStats()
+    idp_mdf_merge.merge_mdf(files, target, stats=stats)
+    return stats.phases, stats.services
+
+
+def run_case(name, files, workdir, repeat):
+    """Benchmarks one set of files, returning (dict) its results."""
+    target = os.path.join(workdir, name + '-merged.idpmsg')
+    result = {
+        'name': name,
+        'files': len(files),
+        'bytes': sum(os.path.getsize(f) for f in files),
+        'merge': {},
+        'phases': {},
+        'peak_memory': {},
+    }
+    modes = (('tree', lambda: idp_mdf_merge.merge_mdf(files, target)),
+             ('stream', lambda: idp_mdf_merge.merge_mdf(files, target, stream=True)),
+             ('incremental', lambda: idp_mdf_merge.merge_mdf(files, target, incremental=True)))
+    modes[2][1]()
+    for mode, run in modes:
+        result['merge'][mode] = best_of(repeat, run)[0]
+    for mode, run in modes[:2]:
+        result['peak_memory'][mode] = peak_memory(run)
+    best = None
+    for _ in range(repeat):
+        times, services = phases(files, target)
+        if best is None:
+            best = times
+        else:
+            best = dict((phase, min(best[phase], times[phase])) for phase in best)
+    result['phases'] = best
+    result['services'] = services
+    return result
+
+
+def report(results, baseline=None):
+    """Prints a table of results, with the ratio to ``baseline`` results of the same case if given."""
+    previous = dict((case['name'], case) for case in baseline['cases']) if baseline else {}
+    print('{:<8} {:>5} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'case', 'files', 'MB', 'services', 'tree', 'stream', 'incr.', 'peak', 'vs base'))
+    for case in results['cases']:
+        merge = case['merge']
+        peak = case['peak_memory'].get('tree')
+        ratio = ''
+        if case['name'] in previous:
+            ratio = '{:.2f}x'.format(merge['tree'] / previous[case['name']]['merge']['tree'])
+        print('{:<8} {:>5} {:>8.1f} {:>9} {:>6.0f} ms {:>6.0f} ms {:>6.0f} ms {:>6} MB {:>9}'.format(
+            case['name'], case['files'], case['bytes'] / 1048576.0, case['services'], merge['tree'] * 1000,
+            merge['stream'] * 1000, merge['incremental'] * 1000,
+            '-' if peak is None else '{:.0f}'.format(peak / 1048576.0), ratio))
+        print('{:<8} {}'.format('', '  '.join('{} {:.0f} ms'.format(phase, case['phases'][phase] * 1000)
+                                              for phase in PHASES if phase in case['phases'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark merge_mdf on bundled and synthetic definitions')
+    parser.add_argument('--scale', nargs='*', default=['small', 'medium'], choices=sorted(SCALES),
+                        help='Synthetic set sizes to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs timed per measurement')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to')
+    parser.add_argument('--compare', default=None, help='JSON file of earlier results to compare with')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {
+            'version': idp_mdf_merge.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cases': [run_case('bundled', BUNDLED, workdir, args.repeat)],
+        }
+        for scale in args.scale:
+            files = generate_set(os.path.join(workdir, scale), **SCALES[scale])
+            results['cases'].append(run_case(scale, files, workdir, args.repeat))
+    finally:
+        shutil.rmtree(workdir)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
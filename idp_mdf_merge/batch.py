@@ -0,0 +1,175 @@
+"""
+Columnar batch decoding of message payloads with NumPy.
+
+Payloads are joined into one buffer and grouped by (SIN, MIN) with NumPy. Messages whose fields
+are all fixed-size, non-optional Enum, Boolean, Unsigned or Signed fields are decoded with
+vectorized bit operations over the bytes of the buffer at each field offset, producing one array
+per field. Other messages fall back to decoding each payload with its compiled
+:class:`~idp_mdf_merge.codec.MessagePlan`, producing one list per field.
+
+Requires NumPy, which is imported on first use.
+
+"""
+
+try:
+    from .codec import CodecError, ENUM, BOOLEAN, SIGNED, RETURN
+except (ImportError, ValueError):
+    from codec import CodecError, ENUM, BOOLEAN, SIGNED, RETURN
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Batch decoding requires NumPy (pip install numpy)")
+    return numpy
+
+
+class BatchColumns(object):
+    """
+    Decoded fields of the payloads of one (SIN, MIN) in a batch.
+
+    Attributes:
+
+        * ``sin``, ``min`` - (int) Service and Message Identification Numbers
+        * ``name`` - (string) message name, or None if the message is not defined
+        * ``vectorized`` - (Boolean) columns are NumPy arrays rather than lists
+        * ``indices`` - (numpy.ndarray) position in the batch of each decoded row
+        * ``columns`` - (dict) array or list of values by field name; Enum arrays hold item
+          indices, lists hold None where an Optional field is absent
+        * ``items`` - (dict) Enum items by field name
+        * ``errors`` - (list of tuple) ``(position, reason)`` of payloads that were not decoded
+
+    """
+    __slots__ = ('sin', 'min', 'name', 'vectorized', 'indices', 'columns', 'items', 'errors')
+
+    def __init__(self, sin, min, name=None, vectorized=False):
+        self.sin = sin
+        self.min = min
+        self.name = name
+        self.vectorized = vectorized
+        self.indices = None
+        self.columns = {}
+        self.items = {}
+        self.errors = []
+
+    def __len__(self):
+        return 0 if self.indices is None else len(self.indices)
+
+
+def is_vectorizable(plan):
+    """Returns True if every field of a MessagePlan has a fixed offset and integer value."""
+    return len(plan.offsets) == len(plan.fields)
+
+
+def decode_batch(codec, payloads, direction=RETURN):
+    """
+    Decodes a batch of payloads into columns grouped by (SIN, MIN).
+
+    The payloads are joined into one buffer viewed as a NumPy array, so the headers are grouped
+    and the fields of vectorizable messages extracted by indexing the buffer at the start of each
+    payload, without Python work per payload.
+
+    :param codec: (Codec) compiled from the message definitions
+    :param payloads: (list of bytes) payloads each starting with SIN and MIN
+    :param direction: ``RETURN`` (default) or ``FORWARD``
+    :return: (dict) BatchColumns by ``(sin, min)``
+
+    """
+    np = _numpy()
+    lengths = np.fromiter(map(len, payloads), dtype=np.intp, count=len(payloads))
+    starts = np.zeros(len(payloads), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    data = np.frombuffer(b''.join(payloads), dtype=np.uint8)
+    headed = lengths >= 2
+    positions = np.flatnonzero(headed)
+    keys = (data[starts[positions]].astype(np.intp) << 8) | data[starts[positions] + 1]
+    results = {}
+    for key, group in _groups(np, keys, positions):
+        sin, min = key >> 8, key & 0xff
+        plan = codec.plans.get((sin, direction, min))
+        if plan is None:
+            columns = BatchColumns(sin, min)
+            reason = codec.unsupported.get((sin, direction, min), "not defined")
+            columns.errors = [(position, reason) for position in group.tolist()]
+            columns.indices = np.zeros(0, dtype=np.intp)
+        elif is_vectorizable(plan):
+            columns = _decode_vectorized(np, plan, group, data, starts, lengths)
+        else:
+            columns = _decode_each(np, plan, payloads, group.tolist())
+        results[(sin, min)] = columns
+    short = np.flatnonzero(~headed)
+    if len(short) > 0:
+        columns = results.setdefault(None, BatchColumns(None, None))
+        columns.indices = np.zeros(0, dtype=np.intp)
+        columns.errors = [(position, "Payload too short for SIN/MIN header") for position in short.tolist()]
+    return results
+
+
+def _groups(np, keys, positions):
+    """Yields ``(key, positions)`` of each distinct header key, the positions of a key in ascending order."""
+    if len(keys) == 0:
+        return
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    positions = positions[order]
+    firsts = np.flatnonzero(np.diff(keys)) + 1
+    for key, group in zip(keys[np.concatenate(([0], firsts))].tolist(), np.split(positions, firsts)):
+        yield key, group
+
+
+def _decode_vectorized(np, plan, positions, data, starts, lengths):
+    """Decodes the payloads at ``positions`` of the joined buffer ``data`` by byte columns of the buffer."""
+    columns = BatchColumns(plan.sin, plan.min, plan.name, vectorized=True)
+    width = (plan.width + 7) >> 3
+    complete = lengths[positions] >= width
+    if not complete.all():
+        columns.errors = [(position, "Payload too short for SIN {sin} MIN {min}".format(sin=plan.sin, min=plan.min))
+                          for position in positions[~complete].tolist()]
+        positions = positions[complete]
+    columns.indices = positions
+    row_starts = starts[positions]
+    byte_columns = {}
+    eight = np.uint64(8)
+    for name, ftype, offset, bits, items in plan.offsets:
+        first = offset >> 3
+        last = (offset + bits + 7) >> 3
+        word = np.zeros(len(positions), dtype=np.uint64)
+        for byte in range(first, last):
+            column = byte_columns.get(byte)
+            if column is None:
+                column = byte_columns[byte] = data[row_starts + byte]
+            word = (word << eight) | column
+        value = (word >> np.uint64(last * 8 - offset - bits)) & np.uint64((1 << bits) - 1)
+        if ftype == BOOLEAN:
+            value = value.astype(np.bool_)
+        elif ftype == SIGNED:
+            value = value.astype(np.int64)
+            value[value >= 1 << (bits - 1)] -= 1 << bits
+            if bits <= 32:
+                value = value.astype(np.int32)
+        elif bits <= 32:
+            value = value.astype(np.uint32)
+        if ftype == ENUM:
+            columns.items[name] = items
+        columns.columns[name] = value
+    return columns
+
+
+def _decode_each(np, plan, payloads, positions):
+    columns = BatchColumns(plan.sin, plan.min, plan.name)
+    names = [field.name for field in plan.fields]
+    values = dict((name, []) for name in names)
+    rows = []
+    for position in positions:
+        try:
+            decoded = plan.decode(payloads[position])
+        except CodecError as e:
+            columns.errors.append((position, str(e)))
+            continue
+        rows.append(position)
+        for name in names:
+            values[name].append(decoded.get(name))
+    columns.indices = np.asarray(rows, dtype=np.intp)
+    columns.columns = values
+    return columns
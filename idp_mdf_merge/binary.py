@@ -0,0 +1,361 @@
+"""
+Compact binary export of merged message definitions, loaded with ``mmap``.
+
+A decoder that only needs the field layouts of a few messages need not parse the merged XML:
+:func:`write_binary` writes the Services of a merge to a sidecar ``<target>.idpbin`` made of
+fixed-size little-endian records, and :class:`BinaryDefinitions` maps the sidecar into memory and
+reads only the records of the messages looked up. Nothing is read or decoded on opening beyond
+the header.
+
+Layout, each section following the previous one:
+
+    * header - magic ``IDPMSGB``, ``BINARY_VERSION``, the size and modification time of the
+      merged file the sidecar was written from, and the count and offset of each section
+    * Services - ``(sin, name, first_message, message_count)`` in ascending order of SIN
+    * messages - ``(sin, min, direction, flags, name, first_field, field_count)`` in ascending
+      order of SIN, direction (forward first) and MIN, the messages of a Service being contiguous
+    * fields - ``(type, flags, size, name, first, count, sin, pin)``, the fields of a message or
+      the element fields of an Array being contiguous; ``first`` and ``count`` locate the element
+      fields of an Array or the items of an Enum
+    * items - string number of each Enum item
+    * strings - offset of each interned string, and its end, into the UTF-8 string data
+    * string data
+
+A message is found by a binary search of the Services by SIN, then of the messages of the Service
+by direction and MIN. Descriptions and default values are not exported, and a message without a
+MIN is left out.
+
+::
+
+    with BinaryDefinitions('merged.idpbin') as definitions:
+        plan = definitions.plan(sin, min)
+        values = plan.decode(payload)
+
+"""
+
+import os
+import mmap
+import struct
+try:
+    from .codec import ARRAY, compile_definition
+    from .model import Field, Message
+    from .registry import RETURN, DIRECTIONS
+    from .writer import replace_file
+except (ImportError, ValueError):
+    from codec import ARRAY, compile_definition
+    from model import Field, Message
+    from registry import RETURN, DIRECTIONS
+    from writer import replace_file
+
+MAGIC = b'IDPMSGB\x00'
+# Bump when the layout of the binary export changes
+BINARY_VERSION = 1
+
+_HEADER = struct.Struct('<8sHHQdIIIIIIIIIII')
+_SERVICE = struct.Struct('<HxxIII')
+_MESSAGE = struct.Struct('<HHBBxxIII')
+_FIELD = struct.Struct('<BBxxiIIIHH')
+_UINT = struct.Struct('<I')
+
+# String number of an undefined name
+NONE = 0xffffffff
+
+# Message flags
+HIDE = 1
+
+# Field flags
+OPTIONAL = 1
+FIXED = 2
+SIZE = 4
+SIN = 8
+PIN = 16
+
+
+def binary_path(target):
+    """
+    Returns the path/filename of the binary export of a merge.
+
+    :param target: (string) target path/filename of the merge
+    :return: (string) ``<target>.idpbin``
+
+    """
+    return os.path.splitext(target)[0] + '.idpbin'
+
+
+class _Strings(object):
+    """Interned strings numbered in order of first use."""
+
+    def __init__(self):
+        self.numbers = {}
+        self.values = []
+
+    def add(self, text):
+        if text is None:
+            return NONE
+        number = self.numbers.get(text)
+        if number is None:
+            number = self.numbers[text] = len(self.values)
+            self.values.append(text)
+        return number
+
+
+def _add_fields(fields, records, items, strings):
+    """Appends the records of contiguous fields, then those of their element fields; returns (int) the first."""
+    first = len(records)
+    records.extend([None] * len(fields))
+    for n, field in enumerate(fields):
+        flags = ((OPTIONAL if field.optional else 0) | (FIXED if field.fixed else 0) |
+                 (SIZE if field.size is not None else 0) | (SIN if field.sin is not None else 0) |
+                 (PIN if field.pin is not None else 0))
+        if field.type == ARRAY:
+            children = _add_fields(field.fields, records, items, strings)
+            count = len(field.fields)
+        else:
+            children = len(items)
+            count = len(field.items)
+            items.extend(strings.add(item) for item in field.items)
+        records[first + n] = _FIELD.pack(field.type, flags, field.size if field.size is not None else 0,
+                                         strings.add(field.name), children, count,
+                                         field.sin if field.sin is not None else 0,
+                                         field.pin if field.pin is not None else 0)
+    return first
+
+
+def write_binary(services, filename, source=None):
+    """
+    Writes the binary export of Services.
+
+    :param services: (iterable of model.Service) the Services, the first of each SIN being written
+    :param filename: (string) path/filename of the export, replaced once complete
+    :param source: (tuple) ``(size, mtime)`` of the merged file exported, or None
+    :return: (int) number of messages written
+
+    """
+    by_sin = {}
+    for service in services:
+        by_sin.setdefault(service.sin, service)
+    strings = _Strings()
+    service_records = []
+    message_records = []
+    field_records = []
+    items = []
+    for sin in sorted(by_sin):
+        service = by_sin[sin]
+        first_message = len(message_records)
+        for direction_number, direction in enumerate(DIRECTIONS):
+            messages = {}
+            for message in service.messages(direction):
+                if message.min is not None:
+                    messages.setdefault(message.min, message)
+            for min in sorted(messages):
+                message = messages[min]
+                first_field = _add_fields(message.fields, field_records, items, strings)
+                message_records.append(_MESSAGE.pack(sin, min, direction_number, HIDE if message.hide else 0,
+                                                     strings.add(message.name), first_field, len(message.fields)))
+        service_records.append(_SERVICE.pack(sin, strings.add(service.name), first_message,
+                                             len(message_records) - first_message))
+    data = [text.encode('utf-8') for text in strings.values]
+    offsets = [0]
+    for encoded in data:
+        offsets.append(offsets[-1] + len(encoded))
+    service_offset = _HEADER.size
+    message_offset = service_offset + len(service_records) * _SERVICE.size
+    field_offset = message_offset + len(message_records) * _MESSAGE.size
+    item_offset = field_offset + len(field_records) * _FIELD.size
+    string_offset = item_offset + len(items) * _UINT.size
+    data_offset = string_offset + len(offsets) * _UINT.size
+    size, mtime = source if source is not None else (0, 0.0)
+    header = _HEADER.pack(MAGIC, BINARY_VERSION, 0, size, mtime,
+                          len(service_records), service_offset, len(message_records), message_offset,
+                          len(field_records), field_offset, len(items), item_offset,
+                          len(data), string_offset, data_offset)
+    tmp = '{target}.{pid}.tmp'.format(target=filename, pid=os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(b''.join(service_records))
+            f.write(b''.join(message_records))
+            f.write(b''.join(field_records))
+            f.write(struct.pack('<{}I'.format(len(items)), *items))
+            f.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+            f.write(b''.join(data))
+        replace_file(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(message_records)
+
+
+def read_source(filename):
+    """
+    Returns the merged file a binary export was written from, without mapping it.
+
+    :param filename: (string) path/filename of the export
+    :return: (tuple) ``(size, mtime)`` of the merged file, or None if the export is missing,
+       unreadable or of another version
+
+    """
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(_HEADER.size)
+        magic, version, _, size, mtime = _HEADER.unpack(header)[:5]
+    except (IOError, OSError, struct.error):
+        return None
+    if magic != MAGIC or version != BINARY_VERSION:
+        return None
+    return size, mtime
+
+
+class BinaryDefinitions(object):
+    """
+    Message definitions of a binary export, mapped into memory and read on lookup.
+
+    :param filename: (string) path/filename of the export
+    :raises ValueError: if the file is not a binary export of this version
+
+    Attributes:
+
+        * ``source`` - (tuple) ``(size, mtime)`` of the merged file exported
+
+    """
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, _, size, mtime, self._service_count, self._service_offset, self._message_count,
+             self._message_offset, self._field_count, self._field_offset, self._item_count, self._item_offset,
+             self._string_count, self._string_offset, self._data_offset) = _HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != BINARY_VERSION:
+            self._map.close()
+            raise ValueError("{file} is not a binary message definition export of version {version}".format(
+                file=filename, version=BINARY_VERSION))
+        self.source = (size, mtime)
+        self._strings = {}
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._message_count
+
+    def _string(self, number):
+        if number == NONE:
+            return None
+        text = self._strings.get(number)
+        if text is None:
+            start, end = struct.unpack_from('<II', self._map, self._string_offset + number * _UINT.size)
+            text = self._strings[number] = self._map[self._data_offset + start:self._data_offset + end].decode('utf-8')
+        return text
+
+    def _service(self, sin):
+        """Returns (tuple) the record of a Service, or None if not defined."""
+        low, high = 0, self._service_count
+        while low < high:
+            middle = (low + high) // 2
+            record = _SERVICE.unpack_from(self._map, self._service_offset + middle * _SERVICE.size)
+            if record[0] < sin:
+                low = middle + 1
+            elif record[0] > sin:
+                high = middle
+            else:
+                return record
+        return None
+
+    def _message(self, sin, min, direction):
+        """Returns (tuple) the record of a message, or None if not defined."""
+        service = self._service(sin)
+        if service is None:
+            return None
+        key = (DIRECTIONS.index(direction), min)
+        low, high = service[2], service[2] + service[3]
+        while low < high:
+            middle = (low + high) // 2
+            record = _MESSAGE.unpack_from(self._map, self._message_offset + middle * _MESSAGE.size)
+            if (record[2], record[1]) < key:
+                low = middle + 1
+            elif (record[2], record[1]) > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def _fields(self, first, count):
+        fields = []
+        for n in range(first, first + count):
+            ftype, flags, size, name, children, child_count, sin, pin = _FIELD.unpack_from(
+                self._map, self._field_offset + n * _FIELD.size)
+            items = ()
+            element_fields = ()
+            if ftype == ARRAY:
+                element_fields = self._fields(children, child_count)
+            elif child_count > 0:
+                numbers = struct.unpack_from('<{}I'.format(child_count), self._map,
+                                             self._item_offset + children * _UINT.size)
+                items = tuple(self._string(number) for number in numbers)
+            fields.append(Field(self._string(name), ftype, size=size if flags & SIZE else None,
+                                optional=bool(flags & OPTIONAL), fixed=bool(flags & FIXED), items=items,
+                                fields=element_fields, sin=sin if flags & SIN else None,
+                                pin=pin if flags & PIN else None))
+        return tuple(fields)
+
+    def __contains__(self, key):
+        """
+        Returns (Boolean) True if a message is defined.
+
+        :param key: (tuple) ``(sin, direction, min)``
+
+        """
+        sin, direction, min = key
+        return self._message(sin, min, direction) is not None
+
+    def sins(self):
+        """Returns (list of int) the SINs defined, in ascending order."""
+        return [_SERVICE.unpack_from(self._map, self._service_offset + n * _SERVICE.size)[0]
+                for n in range(self._service_count)]
+
+    def service_name(self, sin):
+        """Returns (string) the name of a Service, or None if not defined."""
+        service = self._service(sin)
+        return self._string(service[1]) if service is not None else None
+
+    def keys(self):
+        """Iterates over the ``(sin, direction, min)`` defined, in ascending order."""
+        for n in range(self._message_count):
+            record = _MESSAGE.unpack_from(self._map, self._message_offset + n * _MESSAGE.size)
+            yield record[0], DIRECTIONS[record[2]], record[1]
+
+    def message(self, sin, min, direction=RETURN):
+        """
+        Reads the definition of a single message.
+
+        :param sin: (int) Service Identification Number
+        :param min: (int) Message Identification Number
+        :param direction: ``FORWARD`` or ``RETURN`` (default)
+        :return: (model.Message) without descriptions or default values, or None if not defined
+
+        """
+        record = self._message(sin, min, direction)
+        if record is None:
+            return None
+        return Message(self._string(record[4]), min, fields=self._fields(record[5], record[6]),
+                       hide=bool(record[3] & HIDE))
+
+    def plan(self, sin, min, direction=RETURN):
+        """
+        Compiles the codec plan of a single message.
+
+        :return: (MessagePlan) or None if not defined
+        :raises CodecError: if the message cannot be compiled, see ``compile_definition``
+
+        """
+        message = self.message(sin, min, direction)
+        return compile_definition(message, sin, direction) if message is not None else None
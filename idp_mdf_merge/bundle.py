@@ -0,0 +1,288 @@
+"""
+Batch merge of bundles: several merged outputs, each of its own set of source files.
+
+Bundles typically share most of their sources, e.g. the core modem and LSF definitions merged with
+a few Services of each customer. :func:`merge_bundles` parses and normalizes each distinct source
+file once, in a process pool if ``workers`` is more than 1, and splices its serialized Services into
+every bundle that includes it, with the same duplicate resolution, target and error log as a merge
+of the bundle on its own. Bundles are then written in a thread pool if ``workers`` is more than 1.
+
+Bundles are listed in a JSON manifest, or a YAML manifest if its extension is ``.yaml`` or ``.yml``
+(requires PyYAML, imported on first use)::
+
+    defaults:
+      modem: true
+      lsf: true
+    bundles:
+      - target: out/customer_a.idpmsg
+        files: [customer_a/fleet.idpmsg, common/modbus_proxy.idpmsg]
+      - target: out/customer_b.idpmsg
+        files: [customer_b/fleet.idpmsg]
+        meta: true
+        conflicts: union
+
+Each bundle has a ``target`` and optional ``files``, ``modem``, ``lsf``, ``meta``, ``conflicts``,
+``validate`` and ``binary`` as given to :func:`~idp_mdf_merge.idp_mdf_merge.merge_mdf` from the
+command line, any option not given being taken from ``defaults``. Relative paths are relative to the directory of the manifest. A manifest
+may also be just the list of bundles.
+
+"""
+
+import os
+import json
+import time
+try:
+    from . import idp_mdf_merge as core
+    from .stats import clock
+except (ImportError, ValueError):
+    import idp_mdf_merge as core
+    from stats import clock
+
+BUNDLE_OPTIONS = ('target', 'files', 'modem', 'lsf', 'meta', 'conflicts', 'validate', 'binary')
+YAML_EXTENSIONS = ('.yaml', '.yml')
+
+# Processor time of the current process, unaffected by other worker processes sharing the CPUs
+_cpu_clock = time.process_time if hasattr(time, 'process_time') else time.clock
+
+
+def _yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("YAML bundle manifests require PyYAML (pip install pyyaml)")
+    return yaml
+
+
+class Bundle(object):
+    """
+    A merged output and its source files.
+
+    :param target: (string) target path/filename of the merge
+    :param files: (list of string) source files/paths or URLs, in merge order
+    :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+    :param conflicts: policy resolving a SIN found in more than one Service, one of
+       ``CONFLICT_POLICIES``, as for ``merge_mdf``
+    :param validate: (Boolean) flag to validate each Service, as for ``merge_mdf``
+    :param binary: (Boolean) flag to also write the binary export of the target, as for ``merge_mdf``
+
+    """
+    __slots__ = ('target', 'files', 'meta', 'conflicts', 'validate', 'binary')
+
+    def __init__(self, target, files, meta=False, conflicts=core.FIRST, validate=False, binary=False):
+        self.target = target
+        self.files = list(files)
+        self.meta = meta
+        self.conflicts = conflicts
+        self.validate = validate
+        self.binary = binary
+
+    def __repr__(self):
+        return 'Bundle({!r}, {!r}, meta={!r}, conflicts={!r}, validate={!r}, binary={!r})'.format(
+            self.target, self.files, self.meta, self.conflicts, self.validate, self.binary)
+
+
+class BundleReport(object):
+    """
+    Outcome of :func:`merge_bundles`.
+
+    Attributes:
+
+        * ``errors`` - (list) error description of each bundle, or None if merged without error
+        * ``sources`` - (int) source files parsed
+        * ``parses`` - (int) source files parsed by merging each bundle on its own
+        * ``elapsed`` - (float) seconds taken to merge all bundles
+        * ``saved`` - (float) estimated seconds saved over merging each bundle on its own, as the
+          processor time taken to parse and normalize each source file times the number of other
+          bundles including it
+
+    """
+    def __init__(self):
+        self.errors = []
+        self.sources = 0
+        self.parses = 0
+        self.elapsed = 0.0
+        self.saved = 0.0
+
+
+def _resolve(directory, filename):
+    """Returns a path of a manifest relative to its ``directory``, leaving URLs unchanged."""
+    if 'http://' in filename or 'https://' in filename:
+        return filename
+    return os.path.join(directory, os.path.expanduser(filename))
+
+
+def read_bundles(filename):
+    """
+    Reads the bundles of a manifest.
+
+    :param filename: (string) path/filename of a JSON or YAML manifest
+    :return: (list of Bundle) in manifest order
+    :raises ValueError: if the manifest is not valid
+    :raises ImportError: if the manifest is YAML and PyYAML is not installed
+
+    """
+    with open(filename) as f:
+        if os.path.splitext(filename)[1].lower() in YAML_EXTENSIONS:
+            yaml = _yaml()
+            try:
+                document = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(str(e))
+        else:
+            document = json.load(f)
+    defaults = {}
+    if isinstance(document, dict):
+        defaults = document.get('defaults') or {}
+        document = document.get('bundles')
+    if not isinstance(document, list) or len(document) == 0 or not isinstance(defaults, dict):
+        raise ValueError("no bundles listed")
+    directory = os.path.dirname(os.path.abspath(filename))
+    bundles = []
+    for n, entry in enumerate(document, 1):
+        if not isinstance(entry, dict):
+            raise ValueError("bundle {n} is not a mapping".format(n=n))
+        options = dict(defaults)
+        options.update(entry)
+        unknown = sorted(set(options) - set(BUNDLE_OPTIONS))
+        if len(unknown) > 0:
+            raise ValueError("unknown option(s) {options} in bundle {n}".format(options=', '.join(unknown), n=n))
+        if not options.get('target'):
+            raise ValueError("no target in bundle {n}".format(n=n))
+        conflicts = options.get('conflicts', core.FIRST)
+        if conflicts not in core.CONFLICT_POLICIES:
+            raise ValueError("unknown conflict policy {conflicts} in bundle {n}".format(conflicts=conflicts, n=n))
+        files = options.get('files') or []
+        if not isinstance(files, list):
+            raise ValueError("files of bundle {n} are not a list".format(n=n))
+        files = [_resolve(directory, f) for f in files]
+        if options.get('modem'):
+            files.append(core.CORE_MODEM_PATH + core.CORE_MODEM_FILE)
+        if options.get('lsf'):
+            files.append(core.LSF_CORE_PATH + core.LSF_CORE_AGENTS_FILE)
+        if len(files) == 0:
+            raise ValueError("no files in bundle {n}".format(n=n))
+        bundles.append(Bundle(_resolve(directory, options['target']), files, meta=bool(options.get('meta')),
+                              conflicts=conflicts, validate=bool(options.get('validate')),
+                              binary=bool(options.get('binary'))))
+    return bundles
+
+
+def _load_file_timed(args):
+    """
+    Process pool worker wrapping ``serialize_file`` that also measures the processor time it takes.
+
+    :param args: (tuple) ``(f, pipeline, backend)``
+    :return: (tuple) ``(seconds, serialized)``
+
+    """
+    start = _cpu_clock()
+    serialized = core.serialize_file(*args)
+    return _cpu_clock() - start, serialized
+
+
+def _write_bundle(bundle, backend, exceptions, loaded, pending):
+    """
+    Writes a bundle from the serialized Services of its source files, as ``merge_mdf`` would.
+
+    :param backend: (ElementTreeBackend) XML backend reading the target for its binary export
+    :param exceptions: (list of string) errors and warnings of the bundle so far
+    :param loaded: (list of tuple) ``(f, serialized)`` of each source file in merge order
+    :param pending: (list of string) errors reported after the Services of the source files
+    :return: (string) error description if error, or None if successful
+
+    """
+    target, err_filename, manifest_filename = core.output_paths(bundle.target)
+    if not core.valid_path(target.replace(os.path.basename(target), '')):
+        return "ERROR: Invalid target file/path {target}".format(target=target)
+    services, namespaces = core.resolve_services(loaded, exceptions, conflicts=bundle.conflicts)
+    exceptions.extend(pending)
+    if services is None:
+        core.not_written(target, exceptions)
+    elif len(services) > 0:
+        core.write_services(target, (services[sin] for sin in sorted(services)), namespaces)
+        if bundle.binary:
+            core.export_binary(target, backend, exceptions)
+    else:
+        exceptions.append("ERROR: No Services found in source file set.")
+    if len(exceptions) > 0:
+        return core.write_error_log(err_filename, exceptions)
+    return None
+
+
+def merge_bundles(bundles, workers=None, backend=None, fetcher=None):
+    """
+    Merges bundles, parsing each distinct source file once.
+
+    :param bundles: (list of Bundle) e.g. as returned by ``read_bundles``, with distinct targets
+    :param workers: (int) number of worker processes used to parse source files and of threads used
+       to write bundles, or None to do both serially
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param fetcher: (RemoteFetcher) used to fetch any URLs concurrently, or None to use the default
+       fetcher
+    :return: (BundleReport) the outcome of each bundle and the time taken
+    :raises ValueError: if two bundles have the same target or a bundle has an unknown conflict
+       policy
+
+    """
+    for bundle in bundles:
+        if bundle.conflicts not in core.CONFLICT_POLICIES:
+            raise ValueError("Unknown conflict policy {conflicts}".format(conflicts=bundle.conflicts))
+    targets = [os.path.abspath(core.output_paths(bundle.target)[0]) for bundle in bundles]
+    if len(set(targets)) != len(targets):
+        raise ValueError("Bundles must have distinct targets")
+    report = BundleReport()
+    start = clock()
+    backend = core.get_backend(backend)
+    sources = []
+    for bundle in bundles:
+        sources.extend(f for f in bundle.files if f not in sources)
+    local, remote_diagnostics = core.fetch_diagnostics(sources, fetcher)
+    pending = []
+    checked = []
+    for bundle in bundles:
+        bundle_pending = []
+        checked.append(core.local_paths(bundle.files, local, bundle_pending))
+        pending.append(bundle_pending)
+    parsed = {}
+    seconds = {}
+    # the sources are normalized once for each pipeline, i.e. combination of meta and validate
+    for options in sorted(set((bundle.meta, bundle.validate) for bundle in bundles)):
+        paths = []
+        for bundle, bundle_checked in zip(bundles, checked):
+            if (bundle.meta, bundle.validate) == options:
+                paths.extend(path for f, path in bundle_checked if path not in paths)
+        pipeline = core.merge_pipeline(None, *options)
+        for path, (elapsed, serialized) in core.serialize_files(paths, pipeline, backend, workers=workers,
+                                                                loader=_load_file_timed):
+            parsed[options, path] = serialized
+            seconds[options, path] = elapsed
+    report.sources = len(parsed)
+
+    def write(i):
+        bundle = bundles[i]
+        exceptions = []
+        if len(bundle.files) == 1 and bundle.meta:
+            exceptions.append("WARNING: not merging files only applying metadata tags to single file.")
+        for f in bundle.files:
+            if f in remote_diagnostics and remote_diagnostics[f] not in exceptions:
+                exceptions.append(remote_diagnostics[f])
+        loaded = [(f, parsed[(bundle.meta, bundle.validate), path]) for f, path in checked[i]]
+        return _write_bundle(bundle, backend, exceptions, loaded, pending[i])
+
+    if workers is not None and workers > 1 and len(bundles) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(processes=min(workers, len(bundles)))
+        try:
+            results = pool.map(write, range(len(bundles)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [write(i) for i in range(len(bundles))]
+    report.errors = results
+    for bundle, bundle_checked in zip(bundles, checked):
+        report.parses += len(bundle_checked)
+        report.saved += sum(seconds[(bundle.meta, bundle.validate), path] for f, path in bundle_checked)
+    report.saved -= sum(seconds.values())
+    report.elapsed = clock() - start
+    return report
@@ -0,0 +1,197 @@
+"""
+Cache of normalized Service definitions for message definition files that rarely change, such as
+the bundled core modem and LSF core/agent definitions.
+
+Entries are keyed by file path, size, modification time and a hash of the file content, and hold
+the compact form of each normalized Service so that a hit skips XML parsing completely.
+A :class:`DefinitionCache` keeps recently used entries in memory and persists all entries to
+disk as pickles, evicting the least recently used files once the directory exceeds its size cap.
+
+"""
+
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Bump when the cached representation of a normalized Service changes
+CACHE_VERSION = 2
+
+CACHE_DIR = os.environ.get('IDP_MDF_MERGE_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.idp_mdf_merge', 'cache'))
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_MAX_ENTRIES = 16
+
+_ENTRY_EXT = '.pickle'
+
+
+def file_digest(filename):
+    """
+    Returns the hash of the content of a file.
+
+    :param filename: (string) path/filename of the file
+    :return: (string) SHA-1 hex digest
+
+    """
+    content = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            content.update(chunk)
+    return content.hexdigest()
+
+
+class DefinitionCache(object):
+    """
+    A two-level (in-process LRU and on-disk) cache of normalized Service definitions.
+
+    :param directory: (string) on-disk cache location, or None to cache in memory only
+    :param max_bytes: (int) size cap of the on-disk cache, beyond which old entries are evicted
+    :param max_entries: (int) number of entries kept in the in-process LRU
+
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_entries=CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+
+    def key(self, filename, variant=''):
+        """
+        Returns the cache key of a message definition file.
+
+        :param filename: (string) path/filename of the message definition file
+        :param variant: (string) identifies how the Services were normalized, e.g. the signature
+           of the transform pipeline
+        :return: (string) hex digest identifying the file content and options, or None if the
+           file is not a local file
+
+        """
+        if not os.path.isfile(filename):
+            return None
+        path = os.path.realpath(filename)
+        stat = os.stat(path)
+        identity = u'{version}|{path}|{size}|{mtime}|{digest}|{variant}'.format(
+            version=CACHE_VERSION, path=path, size=stat.st_size, mtime=stat.st_mtime,
+            digest=file_digest(path), variant=variant)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Looks up an entry, first in memory and then on disk.
+
+        :param key: (string) as returned by ``key()``
+        :return: the cached value, or None on a miss
+
+        """
+        if key is None:
+            return None
+        if key in self._memory:
+            value = self._memory.pop(key)
+            self._memory[key] = value
+            self.hits += 1
+            return value
+        value = None
+        path = self._entry_path(key)
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path, None)
+            except Exception:
+                value = None
+                self._remove(path)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Stores an entry in memory and on disk, evicting old entries beyond the size cap.
+
+        :param key: (string) as returned by ``key()``
+        :param value: picklable value to cache
+
+        """
+        if key is None or value is None:
+            return
+        self._remember(key, value)
+        path = self._entry_path(key)
+        if path is None:
+            return
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    return
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(path):
+                self._remove(path)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            if tmp is not None:
+                self._remove(tmp)
+            return
+        self._evict()
+
+    def clear(self):
+        """Removes all entries from memory and disk."""
+        self._memory.clear()
+        for path, size, atime in self._entries():
+            self._remove(path)
+
+    def _remember(self, key, value):
+        self._memory.pop(key, None)
+        self._memory[key] = value
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _entry_path(self, key):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, key + _ENTRY_EXT)
+
+    def _entries(self):
+        """Returns a list of (path, size, last used) of the on-disk entries."""
+        entries = []
+        if self.directory is None or not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if name.endswith(_ENTRY_EXT):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        return entries
+
+    def _evict(self):
+        """Removes least recently used entries until the on-disk cache fits ``max_bytes``."""
+        entries = self._entries()
+        total = sum(size for path, size, used in entries)
+        for path, size, used in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,549 @@
+"""
+Binary payload codec compiled from IDP message definitions.
+
+Each message of a (merged) message definition file is compiled once into a :class:`MessagePlan`.
+Field bit offsets are resolved ahead of time for the leading run of fixed-size integer fields,
+which are extracted from a single integer conversion of the payload, and the remaining fields
+are decoded sequentially from their compiled :class:`FieldPlan`.
+
+Payloads start with the SIN and MIN (8 bits each), followed by the fields packed MSB first
+with no alignment and zero padding to the end of the last byte:
+
+    * Optional fields are preceded by a 1-bit presence flag
+    * Boolean is 1 bit, Enum/Unsigned/Signed are ``Size`` bits (Signed is two's complement), an
+      Enum without a Size the fewest bits numbering its Items, as derived by the gateway
+    * String/Data are ``Size`` characters/bytes if Fixed (zero padded), otherwise a length
+      prefix followed by the characters/bytes
+    * Array is ``Size`` elements if Fixed, otherwise a length prefix followed by the elements,
+      each element being its Fields in order
+    * The length prefix is ``0`` + 7 bits for lengths below 128, or ``1`` + 15 bits, so a String,
+      Data or Array that is not Fixed has a Size of at most ``MAX_LENGTH``
+
+Dynamic, Property and Message fields take their type from outside the message definition, so a
+message using them is not compiled: :class:`Codec` lists it in ``unsupported`` with the reason.
+
+"""
+
+import numbers
+import xml.etree.ElementTree as ET
+from binascii import hexlify, unhexlify
+try:
+    from .registry import RETURN, DIRECTIONS
+except (ImportError, ValueError):
+    from registry import RETURN, DIRECTIONS
+
+# Field types, numbered as in the Terminal API
+ENUM, BOOLEAN, UNSIGNED, SIGNED, STRING, DATA, ARRAY, DYNAMIC, PROPERTY, MESSAGE = range(10)
+
+FIELD_TYPES = {
+    'EnumField': ENUM,
+    'BooleanField': BOOLEAN,
+    'UnsignedIntField': UNSIGNED,
+    'SignedIntField': SIGNED,
+    'StringField': STRING,
+    'DataField': DATA,
+    'ArrayField': ARRAY,
+    'DynamicField': DYNAMIC,
+    'PropertyField': PROPERTY,
+    'MessageField': MESSAGE,
+}
+
+XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+
+_TYPE_NAMES = dict((ftype, name) for name, ftype in FIELD_TYPES.items())
+
+# Maximum length of a variable length String, Data or Array (15-bit length prefix), also used
+# where the definition has no Size or a Size of -1
+MAX_LENGTH = 0x7fff
+
+_HEADER_BITS = 16
+_INT_TYPES = (ENUM, BOOLEAN, UNSIGNED, SIGNED)
+
+
+class CodecError(Exception):
+    """Raised when a message definition cannot be compiled or a payload cannot be coded."""
+    pass
+
+
+class FieldPlan(object):
+    """
+    Compiled definition of a message field.
+
+    Attributes:
+
+        * ``name`` - (string) field name
+        * ``type`` - (int) field type e.g. ``UNSIGNED``
+        * ``size`` - (int) bits, characters, bytes or elements depending on ``type``
+        * ``optional`` - (Boolean) field is preceded by a presence flag
+        * ``fixed`` - (Boolean) String/Data/Array always has ``size`` characters/bytes/elements
+        * ``items`` - (tuple of string) Enum items
+        * ``fields`` - (tuple of FieldPlan) Array element fields
+        * ``width`` - (int) encoded bits including any presence flag, or None if variable
+
+    """
+    __slots__ = ('name', 'type', 'size', 'optional', 'fixed', 'items', 'fields', 'width')
+
+    def __init__(self, name, type, size, optional=False, fixed=False, items=(), fields=()):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.optional = optional
+        self.fixed = fixed
+        self.items = tuple(items)
+        self.fields = tuple(fields)
+        self.width = None if optional else self._width()
+
+    def _width(self):
+        if self.type in _INT_TYPES:
+            return self.size
+        if self.type in (STRING, DATA) and self.fixed:
+            return self.size * 8
+        if self.type == ARRAY and self.fixed:
+            element = 0
+            for field in self.fields:
+                if field.width is None:
+                    return None
+                element += field.width
+            return self.size * element
+        return None
+
+
+class MessagePlan(object):
+    """
+    Compiled definition of a message.
+
+    Attributes:
+
+        * ``sin``, ``min`` - (int) Service and Message Identification Numbers
+        * ``direction`` - ``FORWARD`` or ``RETURN``
+        * ``name`` - (string) message name
+        * ``fields`` - (tuple of FieldPlan) all fields in order
+        * ``offsets`` - (tuple) ``(name, type, offset, bits, items)`` of the leading run of
+          fixed-size integer fields, with bit offsets from the start of the payload
+        * ``width`` - (int) payload bits if every field has a fixed size, otherwise None
+
+    """
+    __slots__ = ('sin', 'min', 'direction', 'name', 'fields', 'offsets', 'width',
+                 '_fixed', '_fixed_bytes', '_fixed_end', '_rest')
+
+    def __init__(self, sin, min, direction, name, fields):
+        self.sin = sin
+        self.min = min
+        self.direction = direction
+        self.name = name
+        self.fields = tuple(fields)
+        offsets = []
+        offset = _HEADER_BITS
+        for field in self.fields:
+            if field.type not in _INT_TYPES or field.optional:
+                break
+            offsets.append((field.name, field.type, offset, field.size, field.items))
+            offset += field.size
+        self.offsets = tuple(offsets)
+        self._rest = self.fields[len(offsets):]
+        self._fixed_end = offset
+        self._fixed_bytes = (offset + 7) >> 3
+        self._fixed = tuple((name, ftype, self._fixed_bytes * 8 - bit - bits, (1 << bits) - 1, bits, items)
+                            for name, ftype, bit, bits, items in offsets)
+        width = _HEADER_BITS
+        for field in self.fields:
+            if field.width is None:
+                width = None
+                break
+            width += field.width
+        self.width = width
+
+    def decode(self, payload):
+        """
+        Decodes the fields of a payload, including its SIN/MIN header.
+
+        :param payload: (bytes or bytearray) the message payload
+        :return: (dict) field values by name; absent Optional fields are omitted
+        :raises CodecError: if the payload is too short
+
+        """
+        buf = payload if isinstance(payload, bytearray) else bytearray(payload)
+        if len(buf) < self._fixed_bytes:
+            raise CodecError("Payload too short for SIN {sin} MIN {min}".format(sin=self.sin, min=self.min))
+        values = {}
+        if self._fixed:
+            word = int(hexlify(buf[:self._fixed_bytes]), 16)
+            for name, ftype, shift, mask, bits, items in self._fixed:
+                value = (word >> shift) & mask
+                if ftype == UNSIGNED:
+                    values[name] = value
+                elif ftype == SIGNED:
+                    values[name] = value - (1 << bits) if value >> (bits - 1) else value
+                elif ftype == BOOLEAN:
+                    values[name] = value == 1
+                else:
+                    values[name] = items[value] if value < len(items) else value
+        if self._rest:
+            _decode_fields(self._rest, buf, self._fixed_end, values)
+        return values
+
+    def encode(self, values):
+        """
+        Encodes field values into a payload, including its SIN/MIN header.
+
+        :param values: (dict) field values by name; Optional fields may be omitted or None
+        :return: (bytes) the message payload
+        :raises CodecError: if a value is missing or out of range
+
+        """
+        writer = _BitWriter()
+        writer.write(self.sin, 8)
+        writer.write(self.min, 8)
+        _encode_fields(self.fields, values, writer)
+        return writer.getvalue()
+
+
+def enum_size(count):
+    """
+    Returns the Size of an Enum defined without one.
+
+    :param count: (int) number of Items of the Enum
+    :return: (int) the fewest bits numbering ``count`` Items, at least 1
+
+    """
+    return max(1, (count - 1).bit_length())
+
+
+def _flag(field, tag):
+    return (field.findtext(tag) or '').strip().lower() == 'true'
+
+
+def compile_field(field):
+    """
+    Compiles a ``Field`` element.
+
+    :param field: (ElementTree.Element) the Field
+    :return: (FieldPlan)
+    :raises CodecError: if the field type is unknown or a Size is missing or not an integer
+
+    """
+    type_name = field.get(XSI_TYPE)
+    name = field.findtext('Name')
+    ftype = FIELD_TYPES.get(type_name)
+    if ftype is None:
+        raise CodecError("Unknown field type {type} of {name}".format(type=type_name, name=name))
+    size = field.findtext('Size') if ftype != BOOLEAN else None
+    try:
+        size = int(size) if size else None
+    except ValueError:
+        raise CodecError("{type} {name} Size {size} is not an integer".format(type=type_name, name=name,
+                                                                               size=size.strip()))
+    return _field_plan(name, ftype, size, _flag(field, 'Optional'), _flag(field, 'Fixed'),
+                       lambda: [item.text for item in field.findall('Items/string')],
+                       lambda: [compile_field(child) for child in field.findall('Fields/Field')])
+
+
+def _field_plan(name, ftype, size, optional, fixed, items, fields):
+    """
+    Compiles a field definition.
+
+    :param items: (function) returning the Enum items, called only for an Enum
+    :param fields: (function) returning the compiled Array element fields, called only for an Array
+    :return: (FieldPlan)
+    :raises CodecError: if the type has no static layout or a Size is missing or beyond the length prefix
+
+    """
+    type_name = _TYPE_NAMES[ftype]
+    if ftype in (DYNAMIC, PROPERTY, MESSAGE):
+        raise CodecError("{type} {name} has no static layout".format(type=type_name, name=name))
+    enum_items = ()
+    element_fields = ()
+    if ftype == BOOLEAN:
+        size = 1
+    elif ftype == ENUM:
+        enum_items = items()
+        if size is None:
+            size = enum_size(len(enum_items))
+    elif ftype in (UNSIGNED, SIGNED):
+        if size is None:
+            raise CodecError("{type} {name} has no Size".format(type=type_name, name=name))
+    else:
+        if size is None or size < 0:
+            if fixed:
+                raise CodecError("Fixed {type} {name} has no Size".format(type=type_name, name=name))
+            size = MAX_LENGTH
+        elif size > MAX_LENGTH and not fixed:
+            raise CodecError("{type} {name} Size {size} exceeds the length prefix".format(type=type_name, name=name,
+                                                                                       size=size))
+        if ftype == ARRAY:
+            element_fields = fields()
+    return FieldPlan(name, ftype, size, optional=optional, fixed=fixed, items=enum_items, fields=element_fields)
+
+
+def compile_definition(message, sin, direction=RETURN):
+    """
+    Compiles a message of the object model of :mod:`~idp_mdf_merge.model`.
+
+    :param message: (model.Message) the Message
+    :param sin: (int) the Service Identification Number
+    :param direction: ``FORWARD`` or ``RETURN``
+    :return: (MessagePlan)
+    :raises CodecError: if any field cannot be compiled
+
+    """
+    def compile_model_field(field):
+        return _field_plan(field.name, field.type, field.size, field.optional, field.fixed,
+                           lambda: field.items, lambda: [compile_model_field(child) for child in field.fields])
+
+    return MessagePlan(int(sin), message.min, direction, message.name,
+                       [compile_model_field(field) for field in message.fields])
+
+
+def compile_message(message, sin, direction=RETURN):
+    """
+    Compiles a ``Message`` element.
+
+    :param message: (ElementTree.Element) the Message
+    :param sin: (int) the Service Identification Number
+    :param direction: ``FORWARD`` or ``RETURN``
+    :return: (MessagePlan)
+    :raises CodecError: if any field cannot be compiled
+
+    """
+    fields = [compile_field(field) for field in message.findall('Fields/Field')]
+    return MessagePlan(int(sin), int(message.findtext('MIN')), direction, message.findtext('Name'), fields)
+
+
+class Codec(object):
+    """
+    Encoder/decoder of the messages of a set of Services.
+
+    :param services: iterable of Service elements, e.g. a ``ServiceRegistry``
+
+    Attributes:
+
+        * ``plans`` - (dict) MessagePlan by ``(sin, direction, min)``
+        * ``unsupported`` - (dict) reason a message could not be compiled by ``(sin, direction, min)``
+
+    """
+    def __init__(self, services=()):
+        self.plans = {}
+        self.unsupported = {}
+        for service in services:
+            self.add_service(service)
+
+    @classmethod
+    def from_file(cls, filename):
+        """Returns a Codec of the Services in a message definition file."""
+        services = ET.parse(filename).getroot().find('Services')
+        return cls(services if services is not None else ())
+
+    def add_service(self, service):
+        """Compiles the messages of a Service element with an integer MIN, replacing any of the same SIN and MIN."""
+        sin = int(service.findtext('SIN'))
+        for direction in DIRECTIONS:
+            for message in service.findall(direction + '/Message'):
+                min_text = message.findtext('MIN')
+                if not min_text or not min_text.strip().isdigit():
+                    continue
+                key = (sin, direction, int(min_text))
+                try:
+                    self.plans[key] = compile_message(message, sin, direction)
+                    self.unsupported.pop(key, None)
+                except CodecError as e:
+                    self.plans.pop(key, None)
+                    self.unsupported[key] = str(e)
+
+    def plan(self, sin, min, direction=RETURN):
+        """
+        Returns the compiled plan of a message.
+
+        :raises CodecError: if the message is not defined or could not be compiled
+
+        """
+        key = (sin, direction, min)
+        try:
+            return self.plans[key]
+        except KeyError:
+            reason = self.unsupported.get(key, "not defined")
+            raise CodecError("Message SIN {sin} MIN {min} {direction}: {reason}".format(
+                sin=sin, min=min, direction=direction, reason=reason))
+
+    def decode(self, payload, direction=RETURN):
+        """
+        Decodes a payload.
+
+        :param payload: (bytes or bytearray) the message payload starting with SIN and MIN
+        :param direction: ``RETURN`` (default) for mobile-originated or ``FORWARD`` for
+           mobile-terminated messages
+        :return: (tuple) ``(sin, min, values)`` with values a dict of field values by name
+        :raises CodecError: if the message is unknown or the payload is invalid
+
+        """
+        buf = payload if isinstance(payload, bytearray) else bytearray(payload)
+        if len(buf) < 2:
+            raise CodecError("Payload too short for SIN/MIN header")
+        return buf[0], buf[1], self.plan(buf[0], buf[1], direction).decode(buf)
+
+    def encode(self, sin, min, values, direction=RETURN):
+        """
+        Encodes a payload.
+
+        :param sin: (int) Service Identification Number
+        :param min: (int) Message Identification Number
+        :param values: (dict) field values by name
+        :param direction: ``RETURN`` (default) or ``FORWARD``
+        :return: (bytes) the message payload
+        :raises CodecError: if the message is unknown or a value is invalid
+
+        """
+        return self.plan(sin, min, direction).encode(values)
+
+
+def _read(buf, pos, bits):
+    """Returns the unsigned integer of ``bits`` bits at bit offset ``pos`` of ``buf``."""
+    end = pos + bits
+    if end > len(buf) << 3:
+        raise CodecError("Payload too short")
+    if bits == 0:
+        return 0
+    first = pos >> 3
+    last = (end + 7) >> 3
+    return (int(hexlify(buf[first:last]), 16) >> ((last << 3) - end)) & ((1 << bits) - 1)
+
+
+def _read_bytes(buf, pos, count):
+    """Returns ``count`` bytes at bit offset ``pos`` of ``buf``."""
+    if pos & 7 == 0:
+        first = pos >> 3
+        if first + count > len(buf):
+            raise CodecError("Payload too short")
+        return bytes(buf[first:first + count])
+    if count == 0:
+        return b''
+    return unhexlify('{:0{width}x}'.format(_read(buf, pos, count * 8), width=count * 2))
+
+
+def _read_length(buf, pos):
+    if _read(buf, pos, 1):
+        return _read(buf, pos + 1, 15), pos + 16
+    return _read(buf, pos + 1, 7), pos + 8
+
+
+def _decode_fields(fields, buf, pos, values):
+    """Decodes ``fields`` from bit offset ``pos`` into ``values`` and returns the next offset."""
+    for field in fields:
+        if field.optional:
+            pos += 1
+            if not _read(buf, pos - 1, 1):
+                continue
+        ftype = field.type
+        if ftype == UNSIGNED:
+            values[field.name] = _read(buf, pos, field.size)
+            pos += field.size
+        elif ftype == SIGNED:
+            value = _read(buf, pos, field.size)
+            values[field.name] = value - (1 << field.size) if value >> (field.size - 1) else value
+            pos += field.size
+        elif ftype == BOOLEAN:
+            values[field.name] = _read(buf, pos, 1) == 1
+            pos += 1
+        elif ftype == ENUM:
+            value = _read(buf, pos, field.size)
+            values[field.name] = field.items[value] if value < len(field.items) else value
+            pos += field.size
+        elif ftype in (STRING, DATA):
+            if field.fixed:
+                count = field.size
+            else:
+                count, pos = _read_length(buf, pos)
+            data = _read_bytes(buf, pos, count)
+            pos += count * 8
+            if ftype == DATA:
+                values[field.name] = data
+            elif field.fixed:
+                values[field.name] = data.rstrip(b'\0').decode('latin-1')
+            else:
+                values[field.name] = data.decode('latin-1')
+        elif ftype == ARRAY:
+            if field.fixed:
+                count = field.size
+            else:
+                count, pos = _read_length(buf, pos)
+            elements = []
+            for _ in range(count):
+                element = {}
+                pos = _decode_fields(field.fields, buf, pos, element)
+                elements.append(element)
+            values[field.name] = elements
+    return pos
+
+
+class _BitWriter(object):
+    """Accumulates bit fields MSB first."""
+    __slots__ = ('value', 'bits')
+
+    def __init__(self):
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        self.value = (self.value << bits) | value
+        self.bits += bits
+
+    def write_bytes(self, data):
+        if data:
+            self.write(int(hexlify(data), 16), len(data) * 8)
+
+    def write_length(self, length):
+        if length < 128:
+            self.write(length, 8)
+        else:
+            self.write(0x8000 | length, 16)
+
+    def getvalue(self):
+        pad = -self.bits % 8
+        count = (self.bits + pad) >> 3
+        if count == 0:
+            return b''
+        return unhexlify('{:0{width}x}'.format(self.value << pad, width=count * 2))
+
+
+def _encode_fields(fields, values, writer):
+    """Encodes ``fields`` taking values by name from ``values``."""
+    for field in fields:
+        value = values.get(field.name)
+        if field.optional:
+            writer.write(0 if value is None else 1, 1)
+            if value is None:
+                continue
+        elif value is None:
+            raise CodecError("Missing value for field {name}".format(name=field.name))
+        ftype = field.type
+        if ftype == BOOLEAN:
+            writer.write(1 if value else 0, 1)
+            continue
+        if ftype == ENUM and not isinstance(value, numbers.Integral):
+            try:
+                value = field.items.index(value)
+            except ValueError:
+                raise CodecError("Invalid item {value} for field {name}".format(value=value, name=field.name))
+        if ftype in (ENUM, UNSIGNED):
+            if not 0 <= value < 1 << field.size:
+                raise CodecError("Value {value} out of range for field {name}".format(value=value, name=field.name))
+            writer.write(value, field.size)
+        elif ftype == SIGNED:
+            if not -(1 << (field.size - 1)) <= value < 1 << (field.size - 1):
+                raise CodecError("Value {value} out of range for field {name}".format(value=value, name=field.name))
+            writer.write(value & ((1 << field.size) - 1), field.size)
+        elif ftype in (STRING, DATA):
+            data = value.encode('latin-1') if ftype == STRING else bytes(value)
+            if len(data) > field.size:
+                raise CodecError("Value too long for field {name}".format(name=field.name))
+            if field.fixed:
+                data += b'\0' * (field.size - len(data))
+            else:
+                writer.write_length(len(data))
+            writer.write_bytes(data)
+        elif ftype == ARRAY:
+            if len(value) > field.size or (field.fixed and len(value) != field.size):
+                raise CodecError("Invalid number of elements for field {name}".format(name=field.name))
+            if not field.fixed:
+                writer.write_length(len(value))
+            for element in value:
+                _encode_fields(field.fields, element, writer)
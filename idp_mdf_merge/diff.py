@@ -0,0 +1,274 @@
+"""
+Structural diff of two versions of message definitions.
+
+A :class:`Snapshot` indexes the Services of a version by SIN with a content digest of each Message
+and of each Service, the digest of a Service covering its own elements and the digests of its
+Messages. :func:`diff` compares the digests of two snapshots: a Service or Message whose digest is
+unchanged is skipped without comparing its content, and only the Messages of a changed Service whose
+digest changed are compared field by field. A snapshot also has a digest of the whole version, so
+identical versions are compared in O(1).
+
+Formatting, the order of Services and the order of Messages are not content, as they do not change
+how a message is coded; the order of Fields and of Enum items are. Each difference is reported as a
+:class:`Change`, e.g. for a Field whose size changed::
+
+    modified SIN 20 ReturnMessages MIN 1 field heading: size 9 -> 10
+
+"""
+
+import hashlib
+try:
+    from .model import load, TYPE_NAMES
+    from .registry import DIRECTIONS
+except (ImportError, ValueError):
+    from model import load, TYPE_NAMES
+    from registry import DIRECTIONS
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# Field attributes compared by name, in the order they are reported
+_FIELD_ATTRIBUTES = ('type', 'size', 'optional', 'fixed', 'default', 'items', 'sin', 'pin')
+
+
+# repr rather than marshal or pickle, whose output also depends on the identity and interning of strings
+def _digest(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def _field_key(field, descriptions):
+    return (field.name, field.type, field.description if descriptions else None, field.size, field.optional,
+            field.fixed, field.default, field.items, tuple(_field_key(child, descriptions) for child in field.fields),
+            field.sin, field.pin)
+
+
+class Change(object):
+    """
+    A difference between two versions of message definitions.
+
+    Attributes:
+
+        * ``kind`` - ``ADDED``, ``REMOVED`` or ``MODIFIED``
+        * ``sin`` - (int) Service Identification Number
+        * ``direction`` - ``FORWARD`` or ``RETURN`` of a Message or Field, or None for a Service
+        * ``min`` - (int) Message Identification Number of a Message or Field, or None for a Service
+        * ``field`` - (string) path of a Field, with the names of any enclosing ArrayFields
+          separated by ``.``, or None for a Service or Message
+        * ``detail`` - (string) what was modified, or None
+
+    """
+    __slots__ = ('kind', 'sin', 'direction', 'min', 'field', 'detail')
+
+    def __init__(self, kind, sin, direction=None, min=None, field=None, detail=None):
+        self.kind = kind
+        self.sin = sin
+        self.direction = direction
+        self.min = min
+        self.field = field
+        self.detail = detail
+
+    def __str__(self):
+        text = '{kind} SIN {sin}'.format(kind=self.kind, sin=self.sin)
+        if self.direction is not None:
+            text += ' {direction} MIN {min}'.format(direction=self.direction, min=self.min)
+        if self.field is not None:
+            text += ' field {field}'.format(field=self.field)
+        if self.detail is not None:
+            text += ': ' + self.detail
+        return text
+
+    def __repr__(self):
+        return 'Change({!r})'.format(str(self))
+
+    def as_dict(self):
+        """Returns (dict) the attributes of the change, e.g. to serialize as JSON."""
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__)
+
+
+def _sin_order(sin):
+    """Returns (tuple) the sort key of a SIN in ascending order, a Service without a SIN last."""
+    return sin is None, sin
+
+
+def _message_order(key):
+    """Returns (tuple) the sort key of a ``(direction, min)`` in order of direction and MIN, a MIN-less Message last."""
+    return DIRECTIONS.index(key[0]), key[1] is None, key[1]
+
+
+class Snapshot(object):
+    """
+    Services of one version of message definitions with the content digest of each Service and Message.
+
+    The first Service of a SIN and the first Message of a direction and MIN are kept, as in a merge.
+
+    :param services: (iterable of Service) model Services, e.g. as returned by ``model.load``
+    :param descriptions: (Boolean) flag to include Descriptions in the content compared
+
+    Attributes:
+
+        * ``services`` - (dict) Service by SIN
+        * ``messages`` - (dict) by SIN of (dict) Message by ``(direction, min)``
+        * ``digests`` - (dict) content digest of each Service by SIN
+        * ``message_digests`` - (dict) by SIN of (dict) content digest of each Message by
+          ``(direction, min)``
+        * ``digest`` - (string) content digest of the version
+
+    """
+    def __init__(self, services, descriptions=True):
+        self.descriptions = descriptions
+        self.services = {}
+        self.messages = {}
+        self.digests = {}
+        self.message_digests = {}
+        for service in services:
+            if service.sin in self.services:
+                continue
+            messages = {}
+            message_digests = {}
+            for direction in DIRECTIONS:
+                for message in service.messages(direction):
+                    key = (direction, message.min)
+                    if key in messages:
+                        continue
+                    messages[key] = message
+                    message_digests[key] = _digest((
+                        message.name, message.min, message.description if descriptions else None, message.hide,
+                        tuple(_field_key(field, descriptions) for field in message.fields)))
+            self.services[service.sin] = service
+            self.messages[service.sin] = messages
+            self.message_digests[service.sin] = message_digests
+            ordered = sorted(message_digests.items(), key=lambda item: _message_order(item[0]))
+            self.digests[service.sin] = _digest((service.name, service.sin,
+                                                 service.description if descriptions else None, ordered))
+        self.digest = _digest(sorted(self.digests.items(), key=lambda item: _sin_order(item[0])))
+
+    @classmethod
+    def from_file(cls, filename, backend=None, descriptions=True):
+        """
+        Reads a snapshot of a message definition file.
+
+        :param filename: (string) path/filename of the message definition file
+        :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+        :param descriptions: (Boolean) flag to include Descriptions in the content compared
+        :return: (Snapshot)
+
+        """
+        return cls(load(filename, backend), descriptions)
+
+
+def _diff_fields(old_fields, new_fields, sin, direction, min, path, changes, descriptions):
+    """Appends the changes between two sequences of Fields, matched by name."""
+    old_names = [field.name for field in old_fields]
+    new_names = [field.name for field in new_fields]
+    old_by_name = dict(zip(old_names, old_fields))
+    new_by_name = dict(zip(new_names, new_fields))
+    for name in old_names:
+        if name not in new_by_name:
+            changes.append(Change(REMOVED, sin, direction, min, path + name))
+    for name in new_names:
+        if name not in old_by_name:
+            changes.append(Change(ADDED, sin, direction, min, path + name))
+    for name in old_names:
+        new = new_by_name.get(name)
+        if new is None:
+            continue
+        old = old_by_name[name]
+        details = []
+        for attribute in _FIELD_ATTRIBUTES:
+            before = getattr(old, attribute)
+            after = getattr(new, attribute)
+            if before != after:
+                if attribute == 'type':
+                    before, after = TYPE_NAMES[before], TYPE_NAMES[after]
+                elif attribute == 'items':
+                    before, after = list(before), list(after)
+                details.append('{attribute} {before} -> {after}'.format(attribute=attribute, before=before,
+                                                                         after=after))
+        if descriptions and old.description != new.description:
+            details.append('description')
+        if details:
+            changes.append(Change(MODIFIED, sin, direction, min, path + name, ', '.join(details)))
+        if old.fields or new.fields:
+            _diff_fields(old.fields, new.fields, sin, direction, min, path + name + '.', changes, descriptions)
+    common = [name for name in old_names if name in new_by_name]
+    if common != [name for name in new_names if name in old_by_name]:
+        changes.append(Change(MODIFIED, sin, direction, min, path.rstrip('.') or None,
+                              'fields reordered'))
+
+
+def _diff_message(old, new, sin, direction, min, changes, descriptions):
+    """Appends the changes between two versions of a Message."""
+    details = []
+    if old.name != new.name:
+        details.append('name {before} -> {after}'.format(before=old.name, after=new.name))
+    if descriptions and old.description != new.description:
+        details.append('description')
+    if old.hide != new.hide:
+        details.append('hide {before} -> {after}'.format(before=old.hide, after=new.hide))
+    if details:
+        changes.append(Change(MODIFIED, sin, direction, min, detail=', '.join(details)))
+    _diff_fields(old.fields, new.fields, sin, direction, min, '', changes, descriptions)
+
+
+def diff(old, new):
+    """
+    Compares two versions of message definitions.
+
+    :param old: (Snapshot) the previous version
+    :param new: (Snapshot) the new version
+    :return: (list of Change) in ascending order of SIN, Services added or removed being reported
+       without their Messages and Messages added or removed without their Fields
+    :raises ValueError: if the snapshots do not compare the same content
+
+    """
+    if old.descriptions != new.descriptions:
+        raise ValueError("Snapshots must both include or both exclude Descriptions")
+    changes = []
+    if old.digest == new.digest:
+        return changes
+    for sin in sorted(set(old.digests) | set(new.digests), key=_sin_order):
+        if sin not in new.digests:
+            changes.append(Change(REMOVED, sin))
+            continue
+        if sin not in old.digests:
+            changes.append(Change(ADDED, sin))
+            continue
+        if old.digests[sin] == new.digests[sin]:
+            continue
+        old_service = old.services[sin]
+        new_service = new.services[sin]
+        details = []
+        if old_service.name != new_service.name:
+            details.append('name {before} -> {after}'.format(before=old_service.name, after=new_service.name))
+        if old.descriptions and old_service.description != new_service.description:
+            details.append('description')
+        if details:
+            changes.append(Change(MODIFIED, sin, detail=', '.join(details)))
+        old_digests = old.message_digests[sin]
+        new_digests = new.message_digests[sin]
+        for key in sorted(set(old_digests) | set(new_digests), key=_message_order):
+            direction, min = key
+            if key not in new_digests:
+                changes.append(Change(REMOVED, sin, direction, min))
+            elif key not in old_digests:
+                changes.append(Change(ADDED, sin, direction, min))
+            elif old_digests[key] != new_digests[key]:
+                _diff_message(old.messages[sin][key], new.messages[sin][key], sin, direction, min, changes,
+                              old.descriptions)
+    return changes
+
+
+def diff_files(old_filename, new_filename, backend=None, descriptions=True):
+    """
+    Compares two message definition files.
+
+    :param old_filename: (string) path/filename of the previous version
+    :param new_filename: (string) path/filename of the new version
+    :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+    :param descriptions: (Boolean) flag to report changes of Descriptions
+    :return: (list of Change) as returned by ``diff``
+
+    """
+    return diff(Snapshot.from_file(old_filename, backend, descriptions),
+                Snapshot.from_file(new_filename, backend, descriptions))
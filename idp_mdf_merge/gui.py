@@ -0,0 +1,225 @@
+"""
+Tkinter dialog for confirming and modifying merge parameters.
+
+Imported by :func:`idp_mdf_merge.idp_mdf_merge.get_merge_parameters` only when a UI is displayed,
+so that the merge core can run headless.
+
+"""
+
+import os
+import sys
+import ntpath
+try:
+    import Tkinter as tk
+    import tkFileDialog
+except ImportError:
+    import tkinter as tk
+    from tkinter import filedialog as tkFileDialog
+try:
+    from .idp_mdf_merge import (CORE_MODEM_PATH, CORE_MODEM_FILE, LSF_CORE_PATH, LSF_CORE_AGENTS_FILE,
+                                OUTPUT_PATH, OUTPUT_FILE, valid_path)
+except (ImportError, ValueError):
+    from idp_mdf_merge import (CORE_MODEM_PATH, CORE_MODEM_FILE, LSF_CORE_PATH, LSF_CORE_AGENTS_FILE,
+                               OUTPUT_PATH, OUTPUT_FILE, valid_path)
+
+# ''' Workaround suggested on https://github.com/RedFantom/gsf-parser/issues/17   # DID NOT WORK!
+try:
+    tcl_lib = os.path.join(sys._MEIPASS, "lib")
+    tcl_new_lib = os.path.join(os.path.dirname(os.path.dirname(tcl_lib)), os.path.basename(tcl_lib))
+    import shutil
+    shutil.copytree(src=tcl_lib, dst=tcl_new_lib)
+except:
+    pass
+# '''
+
+enable_smart_tags = False
+
+
+class MergeDialog(tk.Frame):
+    """
+    A class to handle file selections for Message Definition mergers.
+
+    :param master: the Tkinter root frame
+    :param parameters: a dictionary structure containing merge parameters
+
+        * ``files`` - (list of string) file/path names to merge
+        * ``target`` - (string) output file/path name
+        * ``modem`` - (Boolean) flag to include core modem definitions
+        * ``lsf`` - (Boolead) flag to include SkyWave LSF core/agent definitions
+        * ``meta`` - (Boolean) flag to include XML tag metadata (Service and Message)
+        * ``error`` - (None) if no errors or (list of string) any processing errors
+
+    """
+    def __init__(self, master, parameters):
+        tk.Frame.__init__(self, master)
+        self.master = master
+        self.parameters = parameters
+
+        self.master.title("IDP Message Definition Merge Tool")
+
+        entry_label_width = 33
+
+        self.input_label = tk.Label(master, text="Files to merge:")
+        self.input_label.grid(row=0, column=0, sticky=tk.E)
+
+        self.file_list = tk.Listbox(master,
+                                    selectmode='extended',
+                                    height=5,
+                                    width=entry_label_width)
+        self.file_path_list = []
+        if self.parameters['files'] is not None:
+            for f in self.parameters['files']:
+                self.file_list.insert(tk.END, ntpath.basename(f))
+                self.file_path_list.append(f)
+        self.file_list.grid(row=0, column=1, rowspan=2, sticky=tk.W)
+
+        self.add_button = tk.Button(master,
+                                    text="Add File(s)...",
+                                    command=self.add_message_definition_files)
+        self.add_button.grid(row=0, column=2, sticky=tk.W)
+
+        self.rem_button = tk.Button(master,
+                                    text="Remove File(s)...",
+                                    command=self.remove_message_definition_files)
+        self.rem_button.grid(row=1, column=2, sticky=tk.W)
+
+        self.output_label = tk.Label(master, text="Target output file:")
+        self.output_label.grid(row=3, column=0, sticky=tk.E)
+
+        self.var_target = tk.StringVar(value=OUTPUT_FILE)
+        self.parameters['target'] = OUTPUT_PATH + '\\' + OUTPUT_FILE
+        self.target = tk.Entry(master, textvariable=self.var_target, width=entry_label_width)
+        self.target.grid(row=3, column=1, sticky=tk.W)
+
+        self.add_target_button = tk.Button(master, text="Add Target...", command=self.add_target)
+        self.add_target_button.grid(row=3, column=2, sticky=tk.W)
+
+        self.var_modem = tk.IntVar(value=self.parameters['modem'])
+        self.modem_check = tk.Checkbutton(master,
+                                          text="Merge Core Modem definitions",
+                                          variable=self.var_modem)
+        self.modem_check.grid(row=4, column=1, sticky=tk.W)
+
+        self.var_lsf = tk.IntVar(value=self.parameters['lsf'])
+        self.lsf_core_check = tk.Checkbutton(master,
+                                             text="Merge LSF Core/Agent definitions",
+                                             variable=self.var_lsf)
+        self.lsf_core_check.grid(row=5, column=1, sticky=tk.W)
+
+        if enable_smart_tags:
+            self.var_meta = tk.IntVar(value=self.parameters['meta'])
+            self.meta_check = tk.Checkbutton(master,
+                                             text="Apply metadata tags",
+                                             variable=self.var_meta)
+            self.meta_check.grid(row=6, column=1, sticky=tk.W)
+        else:
+            self.var_meta = tk.IntVar(value=False)
+
+        self.ok_button = tk.Button(master, text="OK", command=self.ok_quit)
+        self.ok_button.grid(row=8, column=1)
+
+    def add_message_definition_files(self):
+        """Opens a dialog box to import the target XML files."""
+        filters = {
+            # ('all files', '*.*'),
+            ('idpmsg files', '*.idpmsg')
+        }
+        title = "Select Source File(s) to Merge..."
+        file_names = tkFileDialog.askopenfilenames(title=title, filetypes=filters)
+        if len(file_names) > 0:
+            if self.parameters['files'] is not None:
+                self.parameters['files'] = self.parameters['files'] + file_names
+            else:
+                self.parameters['files'] = file_names
+        for f in file_names:
+            self.file_list.insert(tk.END, ntpath.basename(f))
+            self.file_path_list.append(f)
+
+    def remove_message_definition_files(self):
+        """Removes selected message definition files from ``files`` list."""
+        for i in self.file_list.curselection():
+            self.file_list.delete(i)
+            self.file_path_list.pop(i)
+
+    def add_target(self):
+        """Opens a dialog box to save the target merged XML file."""
+        filters = {
+            # ('all files', '*.*'),
+            ('idpmsg files', '*.idpmsg')
+        }
+        title = "Select Target File..."
+        filename = ''
+        while filename == '':
+            filename = tkFileDialog.asksaveasfilename(title=title,
+                                                      filetypes=filters,
+                                                      initialdir=OUTPUT_PATH,
+                                                      initialfile=OUTPUT_FILE)
+        if filename is not None and filename != '':
+            self.var_target.set(ntpath.basename(filename))
+            self.parameters['target'] = filename
+
+    def ok_quit(self):
+        """Parses parameters to edit by reference to calling function/object."""
+        self.parameters['modem'] = True if self.var_modem.get() else False
+        if self.parameters['modem']:
+            modem_file = CORE_MODEM_PATH + CORE_MODEM_FILE
+            self.file_path_list.append(modem_file)
+        self.parameters['lsf'] = True if self.var_lsf.get() else False
+        if self.parameters['lsf']:
+            lsf_file = LSF_CORE_PATH + LSF_CORE_AGENTS_FILE
+            self.file_path_list.append(lsf_file)
+        self.parameters['meta'] = True if self.var_meta.get() else False
+        for f in self.file_path_list:
+            if not valid_path(f):
+                if self.parameters['error'] is None:
+                    self.parameters['error'] = []
+                self.parameters['error'].append("ERROR: Invalid path {path}".format(path=f))
+        self.parameters['files'] = self.file_path_list
+        self.quit()
+
+
+def _on_closing():
+    """Graceful program exit if user closes the window."""
+    sys.exit("Operation cancelled.")
+
+
+def get_merge_parameters(files, target, modem, lsf, meta):
+    """
+    Displays a UI confirming merge setup and allowing modification.
+
+    :param files: a list of file names to merge
+    :param target: the target merged file name
+    :param modem: (Boolean) to include core modem definitions
+    :param lsf: (Boolean) to include SkyWave LSF Core+Agent Services
+    :param meta: (Boolean) to include metadata tags in merged XML output
+    :return: a dictionary consisting of
+
+        * ``files`` - (list of string) file/path names to merge
+        * ``target`` - (string) output file/path name
+        * ``modem`` - (Boolean) flag to include core modem definitions
+        * ``lsf`` - (Boolead) flag to include SkyWave LSF core/agent definitions
+        * ``meta`` - (Boolean) flag to include XML tag metadata (Service and Message)
+        * ``error`` - (None) if no errors or (list of string) any processing errors
+
+    """
+    error = None
+    merge_parameters = {
+        'files': files,
+        'target': target,
+        'modem': modem,
+        'lsf': lsf,
+        'meta': meta,
+        'error': error
+    }
+    root = tk.Tk()
+    dialog = MergeDialog(root, merge_parameters)
+    root.protocol('WM_DELETE_WINDOW', _on_closing)
+    root.mainloop()
+    merge_parameters = dialog.parameters
+    if len(merge_parameters['files']) < 1:
+        err = "ERROR: No files selected to merge."
+        if merge_parameters['error'] is None:
+            merge_parameters['error'] = [err]
+        else:
+            merge_parameters['error'].append(err)
+    return merge_parameters
@@ -3,6 +3,18 @@
 Tool for merging Message Definition Files for Inmarsat IsatData Pro Message Gateway System.
 Imports two or more XML files with extension ``.idpmsg``.
 
+Besides :func:`merge_mdf`, the phases of a merge of serialized Services are public for the other
+merges of the package, e.g. bundles, shards and the merge service:
+
+    * sources - :func:`output_paths`, :func:`fetch_sources`, :func:`fetch_diagnostics` and
+      :func:`local_paths`
+    * parse and normalize - :func:`merge_pipeline`, :func:`serialize_file` and
+      :func:`serialize_files`
+    * resolve - :func:`resolve_services`, reporting with :func:`not_written` a merge not written
+      under the ``ERROR`` conflict policy
+    * write - :func:`root_declarations`, :func:`write_services`, :func:`export_binary`,
+      :func:`target_stamp` and :func:`write_error_log`
+
 .. table:: Data Types
 
     +--------------+------------------+-------------+------------------------+
@@ -51,22 +63,30 @@ Imports two or more XML files with extension ``.idpmsg``.
 __version__ = "1.1.0"
 
 import sys
-import argparse
 import os
-import httplib
+import struct
+import tempfile
 import xml.etree.ElementTree as ET
-import Tkinter as tk
-import tkFileDialog
-import ntpath
-# ''' Workaround suggested on https://github.com/RedFantom/gsf-parser/issues/17   # DID NOT WORK!
 try:
-    tcl_lib = os.path.join(sys._MEIPASS, "lib")
-    tcl_new_lib = os.path.join(os.path.dirname(os.path.dirname(tcl_lib)), os.path.basename(tcl_lib))
-    import shutil
-    shutil.copytree(src=tcl_lib, dst=tcl_new_lib)
-except:
-    pass
-# '''
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from .cache import DefinitionCache, file_digest
+    from .registry import ServiceRegistry, message_keys, FIRST, LAST, ERROR, CONFLICT_POLICIES
+    from .stats import MergeStats, clock
+    from .transform import Pipeline, PruneStage, MetaStage, DescriptionStage, ValidateStage
+    from .validate import ErrorLog
+    from .writer import MdfWriter, adopt_service, serialize_service
+    from .backend import BACKENDS, backend_error, get_backend
+except (ImportError, ValueError):
+    from cache import DefinitionCache, file_digest
+    from registry import ServiceRegistry, message_keys, FIRST, LAST, ERROR, CONFLICT_POLICIES
+    from stats import MergeStats, clock
+    from transform import Pipeline, PruneStage, MetaStage, DescriptionStage, ValidateStage
+    from validate import ErrorLog
+    from writer import MdfWriter, adopt_service, serialize_service
+    from backend import BACKENDS, backend_error, get_backend
 
 # GLOBAL DEFAULTS
 CORE_MODEM_PATH = os.path.dirname(os.path.realpath(__file__)) + '/mdf/'   # TODO: insert evergreen URL
@@ -76,211 +96,950 @@ LSF_CORE_AGENTS_FILE = 'skywave_lsf_core_agents.idpmsg'
 OUTPUT_PATH = os.path.dirname(os.path.realpath(__file__)) + '/mdf/'
 OUTPUT_FILE = 'merged.idpmsg'
 
-# Namespace used by SkyWave SDK
+# Namespaces used by SkyWave SDK, declared on the root of a merged file
 NS = {
-    # 'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
     'xsd': 'http://www.w3.org/2001/XMLSchema'
 }
 
-enable_smart_tags = False
+# Service child elements retained in the merged output
+SUPPORTED_TAGS = ['Name', 'SIN', 'ForwardMessages', 'ReturnMessages']
 
+# Bump when the manifest of an incremental merge changes
+MANIFEST_VERSION = 4
 
-class MergeDialog(tk.Frame):
+
+def clean_desc(desc):
     """
-    A class to handle file selections for Message Definition mergers.
+    Removes line feeds from description tag
 
-    :param master: the Tkinter root frame
-    :param parameters: a dictionary structure containing merge parameters
+    :param desc: (string) value from the Description tag to clean up
+    :return: (string) cleaned up Description with no line feeds
+
+    """
+    return desc.replace('\n', ' ')
 
-        * ``files`` - (list of string) file/path names to merge
-        * ``target`` - (string) output file/path name
-        * ``modem`` - (Boolean) flag to include core modem definitions
-        * ``lsf`` - (Boolead) flag to include SkyWave LSF core/agent definitions
-        * ``meta`` - (Boolean) flag to include XML tag metadata (Service and Message)
-        * ``error`` - (None) if no errors or (list of string) any processing errors
 
+def _remote():
+    """Imports the remote source support on first use."""
+    try:
+        from . import remote
+    except (ImportError, ValueError):
+        import remote
+    return remote
+
+
+def fetch_sources(files, fetcher, exceptions):
     """
-    global enable_smart_tags
-
-    def __init__(self, master, parameters):
-        tk.Frame.__init__(self, master)
-        self.master = master
-        self.parameters = parameters
-
-        self.master.title("IDP Message Definition Merge Tool")
-
-        entry_label_width = 33
-
-        self.input_label = tk.Label(master, text="Files to merge:")
-        self.input_label.grid(row=0, column=0, sticky=tk.E)
-
-        self.file_list = tk.Listbox(master,
-                                    selectmode='extended',
-                                    height=5,
-                                    width=entry_label_width)
-        self.file_path_list = []
-        if self.parameters['files'] is not None:
-            for f in self.parameters['files']:
-                self.file_list.insert(tk.END, ntpath.basename(f))
-                self.file_path_list.append(f)
-        self.file_list.grid(row=0, column=1, rowspan=2, sticky=tk.W)
-
-        self.add_button = tk.Button(master,
-                                    text="Add File(s)...",
-                                    command=self.add_message_definition_files)
-        self.add_button.grid(row=0, column=2, sticky=tk.W)
-
-        self.rem_button = tk.Button(master,
-                                    text="Remove File(s)...",
-                                    command=self.remove_message_definition_files)
-        self.rem_button.grid(row=1, column=2, sticky=tk.W)
-
-        self.output_label = tk.Label(master, text="Target output file:")
-        self.output_label.grid(row=3, column=0, sticky=tk.E)
-
-        self.var_target = tk.StringVar(value=OUTPUT_FILE)
-        self.parameters['target'] = OUTPUT_PATH + '\\' + OUTPUT_FILE
-        self.target = tk.Entry(master, textvariable=self.var_target, width=entry_label_width)
-        self.target.grid(row=3, column=1, sticky=tk.W)
-
-        self.add_target_button = tk.Button(master, text="Add Target...", command=self.add_target)
-        self.add_target_button.grid(row=3, column=2, sticky=tk.W)
-
-        self.var_modem = tk.IntVar(value=self.parameters['modem'])
-        self.modem_check = tk.Checkbutton(master,
-                                          text="Merge Core Modem definitions",
-                                          variable=self.var_modem)
-        self.modem_check.grid(row=4, column=1, sticky=tk.W)
-
-        self.var_lsf = tk.IntVar(value=self.parameters['lsf'])
-        self.lsf_core_check = tk.Checkbutton(master,
-                                             text="Merge LSF Core/Agent definitions",
-                                             variable=self.var_lsf)
-        self.lsf_core_check.grid(row=5, column=1, sticky=tk.W)
-
-        if enable_smart_tags:
-            self.var_meta = tk.IntVar(value=self.parameters['meta'])
-            self.meta_check = tk.Checkbutton(master,
-                                             text="Apply metadata tags",
-                                             variable=self.var_meta)
-            self.meta_check.grid(row=6, column=1, sticky=tk.W)
-        else:
-            self.var_meta = tk.IntVar(value=False)
+    Fetches any URLs in ``files`` concurrently.
 
-        self.ok_button = tk.Button(master, text="OK", command=self.ok_quit)
-        self.ok_button.grid(row=8, column=1)
+    :param fetcher: (RemoteFetcher) or None to use the default fetcher
+    :param exceptions: (list of string) to which the diagnostic of each URL not fetched or whose
+       local copy is used offline is appended
+    :return: (dict) local path of each URL, or None if it could not be fetched
 
-    def add_message_definition_files(self):
-        """Opens a dialog box to import the target XML files."""
-        filters = {
-            # ('all files', '*.*'),
-            ('idpmsg files', '*.idpmsg')
-        }
-        title = "Select Source File(s) to Merge..."
-        file_names = tkFileDialog.askopenfilenames(title=title, filetypes=filters)
-        if len(file_names) > 0:
-            if self.parameters['files'] is not None:
-                self.parameters['files'] = self.parameters['files'] + file_names
-            else:
-                self.parameters['files'] = file_names
-        for f in file_names:
-            self.file_list.insert(tk.END, ntpath.basename(f))
-            self.file_path_list.append(f)
-
-    def remove_message_definition_files(self):
-        """Removes selected message definition files from ``files`` list."""
-        for i in self.file_list.curselection():
-            self.file_list.delete(i)
-            self.file_path_list.pop(i)
-
-    def add_target(self):
-        """Opens a dialog box to save the target merged XML file."""
-        filters = {
-            # ('all files', '*.*'),
-            ('idpmsg files', '*.idpmsg')
-        }
-        title = "Select Target File..."
-        filename = ''
-        while filename == '':
-            filename = tkFileDialog.asksaveasfilename(title=title,
-                                                      filetypes=filters,
-                                                      initialdir=OUTPUT_PATH,
-                                                      initialfile=OUTPUT_FILE)
-        if filename is not None and filename != '':
-            self.var_target.set(ntpath.basename(filename))
-            self.parameters['target'] = filename
-
-    def ok_quit(self):
-        """Parses parameters to edit by reference to calling function/object."""
-        cur_dir = os.path.dirname(os.path.realpath(__file__))
-        sep = '/' if '/' in cur_dir else '\\'
-        self.parameters['modem'] = True if self.var_modem.get() else False
-        if self.parameters['modem']:
-            modem_file = CORE_MODEM_PATH + CORE_MODEM_FILE
-            self.file_path_list.append(modem_file)
-        self.parameters['lsf'] = True if self.var_lsf.get() else False
-        if self.parameters['lsf']:
-            lsf_file = LSF_CORE_PATH + LSF_CORE_AGENTS_FILE
-            self.file_path_list.append(lsf_file)
-        self.parameters['meta'] = True if self.var_meta.get() else False
-        for f in self.file_path_list:
-            if not valid_path(f):
-                if self.parameters['error'] is None:
-                    self.parameters['error'] = []
-                self.parameters['error'].append("ERROR: Invalid path {path}".format(path=f))
-        self.parameters['files'] = self.file_path_list
-        self.quit()
+    """
+    paths, diagnostics = fetch_diagnostics(files, fetcher)
+    exceptions.extend(diagnostics[url] for url in paths if url in diagnostics)
+    return paths
 
 
-def clean_desc(desc):
+def fetch_diagnostics(files, fetcher):
     """
-    Removes line feeds from description tag
+    Fetches any URLs in ``files`` concurrently, returning the diagnostic of each URL for a caller
+    reporting them in more than one merge.
 
-    :param desc: (string) value from the Description tag to clean up
-    :return: (string) cleaned up Description with no line feeds
+    :param fetcher: (RemoteFetcher) or None to use the default fetcher
+    :return: (tuple) ``(paths, diagnostics)``: (dict) local path of each URL in order of ``files``,
+       or None if it could not be fetched, and (dict) an error of each URL not fetched and a
+       warning of each URL whose local copy is used because its server cannot be reached
 
     """
-    return desc.replace('\n', ' ')
+    urls = [f for f in files if 'http://' in f or 'https://' in f]
+    if len(urls) == 0:
+        return {}, {}
+    if fetcher is None:
+        fetcher = _remote().default_fetcher()
+    fetched, errors = fetcher.fetch_all(urls)
+    paths = {}
+    diagnostics = {}
+    for url in urls:
+        if url in fetched:
+            paths[url] = fetched[url]
+            if url in fetcher.offline:
+                diagnostics[url] = "WARNING: {reason} - using the local copy".format(reason=fetcher.offline[url])
+        else:
+            paths[url] = None
+            diagnostics[url] = "ERROR: {reason}".format(reason=errors[url])
+    return paths, diagnostics
 
 
 def valid_path(filename):
     """
     Validates a file path on local os or URL-based
 
+    URLs are only checked to be well formed, not fetched: the merge fetches them concurrently and
+    reports any that cannot be fetched, so an unchanged URL costs a single conditional GET.
+
     :param filename: (string) to be validated
     :return: {Boolean} result
 
     """
     if 'http://' in filename or 'https://' in filename:
-        if 'http://' in filename:
-            c = httplib.HTTPConnection(filename)
-        else:
-            c = httplib.HTTPSConnection(filename)
-        c.request('HEAD', '')
-        if c.getresponse().status == 200:
-            return True
-        else:
-            return False
+        return _remote().is_url(filename)
     if os.path.exists(filename):
         return True
     else:
         return False
 
 
-def merge_mdf(files, target, meta=False):
+def iter_services(filename, backend=None):
+    """
+    Yields each Service of a message definition file as soon as its subtree is complete.
+
+    The file is walked with ``iterparse`` and each Service is detached from the document before
+    it is yielded, so only the Service(s) still referenced by the caller are held in memory.
+
+    :param filename: (string) path/filename of the message definition file
+    :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+    :return: generator of (Element) Service
+
+    """
+    if backend is None:
+        backend = get_backend()
+    depth = 0
+    services = None
+    in_services = False
+    for event, elem in backend.iterparse(filename, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == 'Services' and services is None:
+                services = elem
+                in_services = True
+        else:
+            depth -= 1
+            if in_services and depth == 2:
+                services.remove(elem)
+                yield elem
+            elif elem is services:
+                in_services = False
+
+
+def default_pipeline(meta=False, validate=False):
+    """
+    Returns the transform pipeline of a merge, applying the options of ``merge_mdf``.
+
+    Custom stages registered on the returned pipeline run after the default stages.
+
+    :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+    :param validate: (Boolean) flag to add a ``ValidateStage``, validating each Service as loaded,
+       see :mod:`~idp_mdf_merge.validate`; the metadata tags then leave a Message without a MIN to
+       the validation to report
+    :return: (Pipeline) pruning unsupported tags, applying any metadata tags, cleaning up
+       descriptions and validating if requested
+
+    """
+    stages = [PruneStage(SUPPORTED_TAGS)]
+    if meta:
+        stages.append(MetaStage(missing_min=not validate))
+    stages.append(DescriptionStage(clean_desc))
+    if validate:
+        stages.append(ValidateStage())
+    return Pipeline(stages)
+
+
+def merge_pipeline(pipeline, meta, validate=False):
+    """
+    Returns the transform pipeline of a merge.
+
+    :param pipeline: (Pipeline) given in place of the default pipeline, or None
+    :param validate: (Boolean) flag to validate each Service as loaded, adding a ``ValidateStage``
+       to ``pipeline`` unless it has one
+    :return: (Pipeline)
+
+    """
+    if pipeline is None:
+        return default_pipeline(meta, validate)
+    if validate and not any(isinstance(stage, ValidateStage) for stage in pipeline.stages):
+        return Pipeline(pipeline.stages + [ValidateStage()])
+    return pipeline
+
+
+def _element_to_tuple(elem):
+    """
+    Converts an Element subtree to compact nested tuples that pickle quickly.
+
+    :param elem: (ElementTree.Element) the subtree
+    :return: (tuple) ``(tag, attrib, text, tail, children)`` where attrib is None if empty
+
+    """
+    return (elem.tag,
+            dict(elem.attrib) if elem.attrib else None,
+            elem.text,
+            elem.tail,
+            tuple(_element_to_tuple(child) for child in elem))
+
+
+def _tuple_to_element(node):
+    """
+    Rebuilds an Element subtree from the output of ``_element_to_tuple``.
+
+    :param node: (tuple) ``(tag, attrib, text, tail, children)``
+    :return: (ElementTree.Element) the subtree
+
+    """
+    tag, attrib, text, tail, children = node
+    elem = ET.Element(tag, attrib) if attrib else ET.Element(tag)
+    elem.text = text
+    elem.tail = tail
+    if children:
+        _extend_from_tuples(elem, children)
+    return elem
+
+
+def _extend_from_tuples(parent, children):
+    """Appends the subtrees of ``_element_to_tuple`` nodes to ``parent``."""
+    for tag, attrib, text, tail, grandchildren in children:
+        elem = ET.SubElement(parent, tag, attrib) if attrib else ET.SubElement(parent, tag)
+        elem.text = text
+        elem.tail = tail
+        if grandchildren:
+            _extend_from_tuples(elem, grandchildren)
+
+
+def _load_file(f, pipeline, backend, stats=None, filename=None):
+    """
+    Parses a message definition file and normalizes each of its Services.
+
+    :param f: (string) path/filename of the message definition file
+    :param pipeline: (Pipeline) transform pipeline applied to each Service
+    :param backend: (ElementTreeBackend) XML backend parsing the file
+    :param stats: (MergeStats) to which the time of each phase is added, or None
+    :param filename: (string) the input file/path as given to the merge, for ``stats``
+    :return: (list) of ``(sin, Service, exceptions)`` in file order, or None if no Services, where
+       sin and Service are None for a Service left out of the merge by ``pipeline``
+
+    """
+    if stats is None:
+        branch = backend.parse(f)
+    else:
+        with stats.timer('parse', filename):
+            branch = backend.parse(f)
+        stats.count(filename, elements=sum(1 for elem in branch.iter()))
+    if not branch.findall('Services'):
+        return None
+    loaded = []
+    for limb in branch[0]:
+        limb_exceptions = []
+        service = pipeline.run(limb, limb_exceptions, stats, filename)
+        loaded.append((service, limb if service is not None else None, limb_exceptions))
+    if stats is not None:
+        stats.count(filename, services=len(loaded))
+    return loaded
+
+
+def _load_file_compact(args):
+    """
+    Process pool worker wrapping ``_load_file`` that returns compact tuples in place of Elements.
+
+    :param args: (tuple) ``(f, pipeline, backend)``
+    :return: (list) of ``(sin, tuple, exceptions)`` in file order, or None if no Services
+
+    """
+    f, pipeline, backend = args
+    loaded = _load_file(f, pipeline, backend)
+    if loaded is None:
+        return None
+    return [(service, _element_to_tuple(limb) if limb is not None else None, limb_exceptions)
+            for service, limb, limb_exceptions in loaded]
+
+
+def serialize_file(f, pipeline, backend):
+    """
+    Parses a message definition file, normalizes each of its Services and serializes it.
+
+    :param f: (string) path/filename of the message definition file
+    :param pipeline: (Pipeline) transform pipeline applied to each Service, see ``merge_pipeline``
+    :param backend: (ElementTreeBackend) XML backend parsing the file and serializing its Services
+    :return: (list) of ``(sin, xml, exceptions, duplicate_mins, namespaces)`` in file order, or
+       None if no Services, where ``duplicate_mins`` lists the ``(sin, direction, min)`` found more
+       than once in the Service and ``namespaces`` is as updated by ``backend.serialize``
+
+    """
+    loaded = _load_file(f, pipeline, backend)
+    if loaded is None:
+        return None
+    serialized = []
+    for service, limb, limb_exceptions in loaded:
+        if service is None:
+            serialized.append((None, None, limb_exceptions, [], {}))
+            continue
+        seen = set()
+        duplicate_mins = []
+        for key, message in message_keys(int(service), limb):
+            if key in seen:
+                duplicate_mins.append(key)
+            else:
+                seen.add(key)
+        namespaces = {}
+        xml = backend.serialize(limb, namespaces)
+        serialized.append((service, xml, limb_exceptions, duplicate_mins, namespaces))
+    return serialized
+
+
+def _load_file_serialized(args):
+    """Process pool worker wrapping ``serialize_file``, with args ``(f, pipeline, backend)``."""
+    return serialize_file(*args)
+
+
+def _iter_compact(files, pipeline, backend, workers=None, cache=None, loader=_load_file_compact):
+    """
+    Yields the compact normalized Services of each file in the order of ``files``.
+
+    Files found in ``cache`` are not parsed. The remaining files are loaded in a process pool if
+    ``workers`` is more than 1, and results are yielded in input order whichever order the
+    workers finish in.
+
+    :param loader: (function) worker loading one ``(f, pipeline, backend)``, by default ``_load_file_compact``
+    :return: generator of ``(f, compact)`` with compact as returned by ``loader``
+
+    """
+    keys = [cache.key(f, pipeline.signature) if cache is not None else None for f in files]
+    hits = [cache.get(key) if cache is not None else None for key in keys]
+    misses = [f for f, hit in zip(files, hits) if hit is None]
+    pool = None
+    if workers is not None and workers > 1 and len(misses) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes=min(workers, len(misses)))
+        results = pool.imap(loader, [(f, pipeline, backend) for f in misses])
+    else:
+        results = (loader((f, pipeline, backend)) for f in misses)
+    try:
+        for f, key, compact in zip(files, keys, hits):
+            if compact is None:
+                compact = next(results)
+                if cache is not None:
+                    cache.put(key, compact)
+            yield f, compact
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def serialize_files(paths, pipeline, backend, workers=None, loader=_load_file_serialized):
+    """
+    Yields the serialized Services of each file in the order of ``paths``.
+
+    :param paths: (list of string) local path/filename of each file, see ``local_paths``
+    :param workers: (int) number of worker processes serializing the files, or None to serialize
+       them serially
+    :param loader: (function) picklable worker called with ``(f, pipeline, backend)``, by default
+       returning ``serialize_file(f, pipeline, backend)``
+    :return: generator of ``(path, serialized)`` with serialized as returned by ``loader``
+
+    """
+    return _iter_compact(paths, pipeline, backend, workers=workers, loader=loader)
+
+
+def local_paths(files, local, exceptions):
+    """
+    Returns the local path of each file up to the first file/path that does not exist.
+
+    :param local: (dict) local path of fetched URLs, None if a URL could not be fetched
+    :return: (list of tuple) ``(f, path)``
+
+    """
+    checked = []
+    for f in files:
+        path = local.get(f, f) if local else f
+        if path is None or (path == f and not valid_path(f)):
+            exceptions.append("ERROR: Source file/path {file} does not exist".format(file=f))
+            break
+        checked.append((f, path))
+    return checked
+
+
+def _iter_loaded(files, pipeline, backend, exceptions, workers=None, cache=None, local=None, stats=None):
+    """
+    Yields the normalized Services of each file in the order of ``files``.
+
+    Loading stops before the first file/path that does not exist.
+
+    :param workers: (int) number of worker processes used to load files, see ``_iter_compact``
+    :param cache: (DefinitionCache) normalized Services cache, see ``_iter_compact``
+    :param local: (dict) local path of fetched URLs, see ``fetch_sources``
+    :param stats: (MergeStats) to which the time of each phase is added, or None
+    :return: generator of ``(f, loaded)`` with loaded as returned by ``_load_file``
+
+    """
+    pending = []
+    checked = local_paths(files, local, pending)
+    if cache is None and (workers is None or workers <= 1 or len(checked) <= 1):
+        for f, path in checked:
+            if stats is not None:
+                stats.file(f, path)
+            yield f, _load_file(path, pipeline, backend, stats, f)
+    else:
+        compacts = _iter_compact([path for f, path in checked], pipeline, backend, workers=workers, cache=cache)
+        try:
+            for f, path in checked:
+                if stats is not None:
+                    stats.file(f, path)
+                    start = clock()
+                path, compact = next(compacts)
+                if compact is None:
+                    loaded = None
+                else:
+                    loaded = [(service, _tuple_to_element(node) if node is not None else None, limb_exceptions)
+                              for service, node, limb_exceptions in compact]
+                if stats is not None:
+                    stats.add('load', clock() - start, f)
+                    stats.count(f, services=len(loaded) if loaded else 0)
+                yield f, loaded
+        finally:
+            compacts.close()
+    exceptions.extend(pending)
+
+
+def _merge_tree(files, target, pipeline, backend, exceptions, workers=None, cache=None, registry=None,
+                local=None, stats=None, conflicts=FIRST):
+    """
+    Merges message definition files by parsing each into memory, then writes ``target``.
+
+    :return: (int) number of Services written, or None if not written for conflicts
+
+    """
+    if registry is None:
+        registry = ServiceRegistry()
+    for f, loaded in _iter_loaded(files, pipeline, backend, exceptions, workers=workers, cache=cache, local=local,
+                                  stats=stats):
+        if loaded is None:
+            exceptions.append("WARNING: Invalid Message Definition File - no Services in {file}".format(file=f))
+        else:
+            start = clock()
+            _register_loaded(registry, f, loaded, exceptions, conflicts)
+            if stats is not None:
+                stats.add('index', clock() - start, f)
+        if stats is not None:
+            stats.file_done(f)
+    if conflicts == ERROR and len(registry.conflicts) > 0:
+        return not_written(target, exceptions)
+    if len(registry) > 0:
+        start = clock()
+        _write_tree(target, registry, backend)
+        if stats is not None:
+            stats.add('write', clock() - start)
+    return len(registry)
+
+
+def _register_loaded(registry, f, loaded, exceptions, conflicts=FIRST):
+    """Adds the Services loaded from file ``f`` to ``registry``, warning of duplicate SINs and MINs."""
+    for service, limb, limb_exceptions in loaded:
+        exceptions.extend(limb_exceptions)
+        if service is None:
+            continue
+        marks = _duplicate_marks(registry)
+        registry.add(limb, conflicts)
+        _report_duplicates(registry, marks, f, conflicts, exceptions)
+
+
+def _duplicate_marks(registry):
+    """Returns (tuple) the number of duplicate MINs, duplicate SINs and conflicts found by ``registry``."""
+    return len(registry.duplicate_mins), len(registry.duplicate_sins), len(registry.conflicts)
+
+
+def _duplicate_sin(sin, f, conflicts):
+    """Returns (string) the warning of a duplicate SIN found in file ``f`` under the ``FIRST`` or ``LAST`` policy."""
+    return "WARNING: Found duplicate SIN in \"{file}\" Services - {action} SIN {sin}".format(
+        file=f, action='ignoring' if conflicts == FIRST else 'replacing', sin=sin)
+
+
+def _report_duplicates(registry, marks, f, conflicts, exceptions):
+    """
+    Appends a warning of each duplicate MIN and SIN and conflicting MIN found by ``registry`` since
+    ``marks`` were taken, conflicts being errors under the ``ERROR`` policy.
+
+    :param marks: (tuple) as returned by ``_duplicate_marks``
+    :param f: (string) file the Services were loaded from
+    :param conflicts: conflict policy the Services were added with
+
+    """
+    duplicate_mins, duplicate_sins, conflicting = marks
+    for sin, direction, min in registry.duplicate_mins[duplicate_mins:]:
+        exceptions.append("WARNING: Found duplicate MIN {min} in {direction} of SIN {sin} "
+                          "in \"{file}\"".format(min=min, direction=direction, sin=sin, file=f))
+    if conflicts in (FIRST, LAST):
+        for sin in registry.duplicate_sins[duplicate_sins:]:
+            exceptions.append(_duplicate_sin(sin, f, conflicts))
+    for sin, direction, min in registry.conflicts[conflicting:]:
+        if conflicts == ERROR:
+            exceptions.append("ERROR: Found conflicting MIN {min} in {direction} of SIN {sin} "
+                              "in \"{file}\"".format(min=min, direction=direction, sin=sin, file=f))
+        else:
+            exceptions.append("WARNING: Found conflicting MIN {min} in {direction} of SIN {sin} "
+                              "in \"{file}\" - keeping the first".format(min=min, direction=direction, sin=sin,
+                                                                          file=f))
+
+
+def not_written(target, exceptions):
+    """Reports that ``target`` is not written for conflicting messages under the ``ERROR`` policy."""
+    exceptions.append("ERROR: Conflicting message definitions - {target} not written".format(target=target))
+    return None
+
+
+def _write_tree(target, registry, backend):
+    """Writes the Services of ``registry`` to ``target`` as a merged message definition file."""
+    services = registry.by_sin()
+    namespaces = backend.namespaces(services)
+    with MdfWriter(target, root_declarations(namespaces)) as out:
+        for limb in services:
+            out.write(backend.serialize(limb, namespaces))
+
+
+def _merge_stream(files, target, pipeline, backend, exceptions, local=None, stats=None, conflicts=FIRST):
+    """
+    Merges message definition files one Service at a time, then writes ``target``.
+
+    Each Service is normalized and serialized to a temporary spool file as soon as it has been
+    parsed, so peak memory is bounded by the largest single Service plus a (SIN, offset) index.
+    The spooled Services are copied to ``target`` in ascending order of SIN. A duplicate SIN is
+    resolved against the spooled Service, and the resolved Service spooled again if changed.
+
+    :return: (int) number of Services written, or None if not written for conflicts
+
+    """
+    services = {}
+    index = []
+    namespaces = {}
+    conflicting = False
+    spool = tempfile.TemporaryFile()
+    try:
+        for f, path in local_paths(files, local, exceptions):
+            found = False
+            if stats is not None:
+                stats.file(f, path)
+                resumed = clock()
+            for limb in iter_services(path, backend):
+                found = True
+                if stats is not None:
+                    stats.add('parse', clock() - resumed, f)
+                    stats.count(f, services=1, elements=sum(1 for elem in limb.iter()))
+                service = pipeline.run(limb, exceptions, stats, f)
+                if service is not None:
+                    conflicting = _spool_service(service, limb, spool, services, index, namespaces, f, backend,
+                                                 exceptions, stats, conflicts) or conflicting
+                if stats is not None:
+                    resumed = clock()
+            if stats is not None:
+                stats.add('parse', clock() - resumed, f)
+                stats.file_done(f)
+            if not found:
+                exceptions.append("WARNING: Invalid Message Definition File - no Services in {file}".format(file=f))
+        if conflicting:
+            return not_written(target, exceptions)
+        if len(index) > 0:
+            start = clock()
+            index.sort(key=lambda entry: entry[0])
+            if stats is not None:
+                stats.add('index', clock() - start)
+
+            def spooled():
+                for sin, offset, length in index:
+                    spool.seek(offset)
+                    yield spool.read(length)
+
+            start = clock()
+            write_services(target, spooled(), namespaces)
+            if stats is not None:
+                stats.add('write', clock() - start)
+    finally:
+        spool.close()
+    return len(index)
+
+
+def _spool_service(service, limb, spool, services, index, namespaces, f, backend, exceptions, stats, conflicts):
+    """
+    Serializes a Service to the spool of a streamed merge, resolving a duplicate SIN against the
+    Service spooled.
+
+    :param services: (dict) position in ``index`` of each SIN spooled
+    :param index: (list of tuple) ``(sin, offset, length)`` of each Service spooled
+    :return: (Boolean) True if a conflict is an error under the ``ERROR`` policy
+
+    """
+    start = clock()
+    limb_namespaces = dict(namespaces)
+    xml = backend.serialize(limb, limb_namespaces)
+    if stats is not None:
+        stats.add('serialize', clock() - start, f)
+    if service not in services:
+        namespaces.update(limb_namespaces)
+        services[service] = len(index)
+        index.append((int(service), spool.tell(), len(xml)))
+        spool.write(xml)
+        return False
+    sin, offset, length = index[services[service]]
+    spool.seek(offset)
+    registered = spool.read(length)
+    spool.seek(0, os.SEEK_END)
+    resolved, conflict = _resolve_serialized(sin, registered, xml, namespaces, limb_namespaces, f, conflicts,
+                                             exceptions)
+    if resolved is not registered:
+        index[services[service]] = (sin, spool.tell(), len(resolved))
+        spool.write(resolved)
+    return conflict
+
+
+def root_declarations(namespaces):
+    """
+    Returns the namespaces declared on the root of a merged document.
+
+    :param namespaces: (dict) ``{prefix: uri}`` used by the Services
+    :return: (list of tuple) ``(prefix, uri)`` used by the Services in order of prefix, followed by
+       those of ``NS`` not used
+
+    """
+    declarations = sorted(namespaces.items(), key=lambda item: item[0])
+    return declarations + sorted((prefix, uri) for prefix, uri in NS.items()
+                                 if prefix not in namespaces and uri not in namespaces.values())
+
+
+def write_services(target, services, namespaces):
+    """
+    Writes serialized Services to ``target`` as a merged message definition file.
+
+    :param target: (string) path/filename of the merged output
+    :param services: (iterable of bytes) serialized Services in ascending order of SIN
+    :param namespaces: (dict) ``{prefix: uri}`` declared by the Services
+
+    """
+    with MdfWriter(target, root_declarations(namespaces)) as out:
+        for xml in services:
+            out.write(xml)
+
+
+def _load_manifest(filename, pipeline):
+    """
+    Reads the manifest of a previous incremental merge.
+
+    :param filename: (string) path/filename of the manifest
+    :param pipeline: (Pipeline) transform pipeline the Services are normalized with
+    :return: (dict) the manifest, or an empty dict if missing, unreadable or made with other options
+
+    """
+    try:
+        with open(filename, 'rb') as f:
+            manifest = pickle.load(f)
+    except Exception:
+        return {}
+    if (not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION or
+            manifest.get('pipeline') != pipeline.signature):
+        return {}
+    return manifest
+
+
+def _save_manifest(filename, manifest):
+    """Replaces the manifest of an incremental merge, ignoring any failure to write it."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp, filename)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def target_stamp(target):
+    """Returns (tuple) the size and modification time of ``target``, or None if it does not exist."""
+    try:
+        stat = os.stat(target)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _parse_serialized(xml, namespaces):
+    """Parses a serialized Service, declaring the namespaces it may use."""
+    declared = ''.join(' xmlns:{prefix}="{uri}"'.format(prefix=prefix, uri=uri)
+                       for prefix, uri in root_declarations(namespaces))
+    return ET.fromstring(b'<Services' + declared.encode('utf-8') + b'>' + xml + b'</Services>')[0]
+
+
+def _resolve_serialized(sin, registered, xml, namespaces, limb_namespaces, f, conflicts, exceptions):
+    """
+    Resolves a Service serialized with the SIN of a Service already merged.
+
+    :param sin: (int) the SIN
+    :param registered: (bytes) the Service already merged
+    :param xml: (bytes) the Service of the same SIN from file ``f``
+    :param namespaces: (dict) ``{prefix: uri}`` used by the merged Services, updated with those of
+       the resolved Service
+    :param limb_namespaces: (dict) ``{prefix: uri}`` used by ``xml``
+    :param conflicts: conflict policy, one of ``CONFLICT_POLICIES``
+    :param exceptions: (list of string) to which any warning or error is appended
+    :return: (tuple) ``(resolved, conflicting)``: (bytes) the Service merged, which is
+       ``registered`` itself if unchanged, and (Boolean) True if a conflict is an error
+
+    """
+    if conflicts == FIRST or (conflicts == LAST and xml == registered):
+        exceptions.append(_duplicate_sin(sin, f, conflicts))
+        return registered, False
+    if xml == registered:
+        return registered, False
+    registry = ServiceRegistry()
+    registry.add(_parse_serialized(registered, namespaces))
+    marks = _duplicate_marks(registry)
+    limb = _parse_serialized(xml, limb_namespaces)
+    changed = registry.add(limb, conflicts)
+    _report_duplicates(registry, marks, f, conflicts, exceptions)
+    conflicting = conflicts == ERROR and len(registry.conflicts) > 0
+    if not changed:
+        return registered, conflicting
+    if conflicts == LAST:
+        return adopt_service(xml, limb_namespaces, namespaces), conflicting
+    return serialize_service(registry.service(limb.findtext('SIN')), namespaces), conflicting
+
+
+def resolve_services(loaded, exceptions, stats=None, conflicts=FIRST):
+    """
+    Resolves the Services of each SIN among serialized Services by a conflict policy, warning of
+    duplicate SINs and MINs.
+
+    :param loaded: (iterable of tuple) ``(f, serialized)`` in input order, with serialized as
+       returned by ``serialize_file``
+    :param stats: (MergeStats) to which the Services of each file are counted, or None
+    :param conflicts: conflict policy, one of ``CONFLICT_POLICIES``, ``FIRST`` by default
+    :return: (tuple) ``(services, namespaces)``, the serialized Services by SIN, or None if a
+       conflict is an error under the ``ERROR`` policy, and the ``{prefix: uri}`` they use
+
+    """
+    services = {}
+    namespaces = {}
+    conflicting = False
+    for f, serialized in loaded:
+        if stats is not None:
+            stats.count(f, services=len(serialized) if serialized else 0)
+            stats.file_done(f)
+        if serialized is None:
+            exceptions.append("WARNING: Invalid Message Definition File - no Services in {file}".format(file=f))
+            continue
+        for service, xml, limb_exceptions, duplicate_mins, limb_namespaces in serialized:
+            exceptions.extend(limb_exceptions)
+            if service is None:
+                continue
+            if int(service) not in services:
+                services[int(service)] = adopt_service(xml, limb_namespaces, namespaces)
+                for sin, direction, min in duplicate_mins:
+                    exceptions.append("WARNING: Found duplicate MIN {min} in {direction} of SIN {sin} "
+                                      "in \"{file}\"".format(min=min, direction=direction, sin=sin, file=f))
+            else:
+                resolved, conflict = _resolve_serialized(int(service), services[int(service)], xml, namespaces,
+                                                         limb_namespaces, f, conflicts, exceptions)
+                services[int(service)] = resolved
+                conflicting = conflicting or conflict
+    return None if conflicting else services, namespaces
+
+
+def _merge_incremental(files, target, pipeline, backend, exceptions, manifest_filename, workers=None,
+                       local=None, manifest=None, stats=None, conflicts=FIRST):
+    """
+    Merges message definition files reparsing only the files changed since the last merge.
+
+    The manifest records the content hash of each input file and the serialized Services it
+    contributed. Unchanged files are taken from the manifest, changed files are reparsed (in a
+    process pool if ``workers`` is more than 1), and the Services of all files are spliced in
+    input order with the same duplicate resolution as a full merge. ``target`` is not rewritten
+    if neither the inputs nor the target changed since the last merge.
+
+    :param manifest_filename: (string) path/filename of the manifest, rewritten after the merge
+    :param manifest: (dict) manifest kept in memory by the caller and updated in place, used
+       instead of ``manifest_filename`` if not None
+    :return: (int) number of Services written, or None if not written for conflicts
+
+    """
+    resident = manifest
+    if resident is None:
+        manifest = _load_manifest(manifest_filename, pipeline)
+    elif resident.get('version') != MANIFEST_VERSION or resident.get('pipeline') != pipeline.signature:
+        manifest = {}
+    recorded = manifest.get('inputs', {})
+    pending = []
+    checked = local_paths(files, local, pending)
+    inputs = {}
+    changed = []
+    for f, path in checked:
+        if f in inputs:
+            continue
+        if stats is not None:
+            stats.file(f, path)
+        start = clock()
+        digest = file_digest(path)
+        if stats is not None:
+            stats.add('hash', clock() - start, f)
+        entry = recorded.get(f)
+        if entry is not None and entry['digest'] == digest:
+            inputs[f] = entry
+        else:
+            inputs[f] = None
+            changed.append((f, path, digest))
+    loaded = serialize_files([path for f, path, digest in changed], pipeline, backend, workers=workers)
+    try:
+        for f, path, digest in changed:
+            start = clock()
+            loaded_path, serialized = next(loaded)
+            inputs[f] = {'digest': digest, 'services': serialized}
+            if stats is not None:
+                stats.add('load', clock() - start, f)
+    finally:
+        loaded.close()
+    start = clock()
+    services, namespaces = resolve_services([(f, inputs[f]['services']) for f, path in checked], exceptions,
+                                              stats, conflicts)
+    exceptions.extend(pending)
+    if stats is not None:
+        stats.add('index', clock() - start)
+    if services is None:
+        return not_written(target, exceptions)
+    order = [f for f, path in checked]
+    rewrite = (len(changed) > 0 or manifest.get('files') != order or manifest.get('conflicts', FIRST) != conflicts or
+               manifest.get('target') != target_stamp(target))
+    if rewrite:
+        if len(services) > 0:
+            start = clock()
+            write_services(target, (services[sin] for sin in sorted(services)), namespaces)
+            if stats is not None:
+                stats.add('write', clock() - start)
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'pipeline': pipeline.signature,
+            'files': order,
+            'conflicts': conflicts,
+            'inputs': inputs,
+            'target': target_stamp(target),
+        }
+        if resident is None:
+            _save_manifest(manifest_filename, manifest)
+        else:
+            resident.clear()
+            resident.update(manifest)
+    return len(services)
+
+
+def output_paths(target):
+    """
+    Returns the files written by a merge to ``target``.
+
+    :param target: (string) target path/filename of the merge
+    :return: (tuple) ``(target, err_filename, manifest_filename)``: the target with extension
+       ``.idpmsg``, and its error log and incremental merge manifest
+
+    """
+    base_filename, ext = os.path.splitext(target)
+    if ext != '.idpmsg':
+        target = target.replace(ext, '.idpmsg')
+    return target, base_filename + '_ERR.log', base_filename + '_MANIFEST.pickle'
+
+
+def export_binary(target, backend, exceptions):
+    """
+    Writes the binary export of the merged file ``target`` next to it, unless up to date.
+
+    :param backend: (ElementTreeBackend) XML backend reading ``target``
+    :param exceptions: (list of string) to which a warning is appended if not exported
+
+    """
+    try:
+        from .binary import binary_path, read_source, write_binary
+        from .model import iter_load
+    except (ImportError, ValueError):
+        from binary import binary_path, read_source, write_binary
+        from model import iter_load
+    filename = binary_path(target)
+    stamp = target_stamp(target)
+    if stamp is None or read_source(filename) == stamp:
+        return
+    try:
+        write_binary(iter_load(target, backend), filename, stamp)
+    except (ValueError, struct.error) as e:
+        exceptions.append("WARNING: Binary export {file} not written - {error}".format(file=filename, error=e))
+
+
+def write_error_log(err_filename, exceptions):
+    """
+    Writes the errors and warnings of a merge to its error log.
+
+    :param err_filename: (string) path/filename of the error log
+    :param exceptions: (list of string) errors and warnings of the merge
+    :return: (string) error description written to the log, see ``ErrorLog``
+
+    """
+    with ErrorLog(err_filename) as log:
+        log.extend(exceptions)
+    return log.text
+
+
+def merge_mdf(files, target, meta=False, stream=False, workers=None, cache=None, registry=None, fetcher=None,
+              incremental=False, stats=None, pipeline=None, backend=None, conflicts=FIRST, binary=False,
+              validate=False):
     """
     Merges message definition files, sorted in ascending order of SIN.
 
+    The merged output is streamed to a temporary file which replaces ``target`` once complete.
+    Errors and warnings are written to ``<target>_ERR.log`` as they are found, at most
+    ``MAX_REPEATS`` repeats of a warning followed by the number omitted, see :mod:`~idp_mdf_merge.validate`.
+
     .. note::
        Potential issue with XML namespaces.
 
     :param files: (list of string) with each full path/filename to merge
     :param target: (string) target path/filename result of the merge
     :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+    :param stream: (Boolean) flag to parse and spool one Service at a time, bounding memory use
+       by the largest Service rather than the total size of the input files
+    :param workers: (int) number of worker processes used to parse and normalize the input
+       files in parallel, or None to load them serially; not used when ``stream`` is set
+    :param cache: (DefinitionCache) cache of normalized Services used to skip parsing unchanged
+       files, or None; not used when ``stream`` is set
+    :param registry: (ServiceRegistry) an empty registry to populate with the merged Services for
+       further queries, or None; not used when ``stream`` is set
+    :param fetcher: (RemoteFetcher) used to fetch any URLs in ``files`` concurrently, or None to
+       use the default fetcher
+    :param incremental: (Boolean) flag to reparse only the files changed since the last merge to
+       ``target``, as recorded in a manifest ``<target>_MANIFEST.pickle`` next to the error log,
+       or (dict) a manifest kept in memory between merges by a long-running caller, initially
+       empty; ``stream``, ``cache`` and ``registry`` are not used when set
+    :param stats: (MergeStats) to populate with the time of each phase, elements processed, bytes
+       read and written and peak memory of the merge and of each input file, or None
+    :param pipeline: (Pipeline) transform pipeline applied to each Service in place of
+       ``default_pipeline(meta)``, e.g. with custom stages registered
+    :param backend: (string) XML backend parsing and serializing the files, one of ``BACKENDS``, or
+       None for the standard library; lxml not being installed is an error
+    :param conflicts: policy resolving a SIN found in more than one Service, one of
+       ``CONFLICT_POLICIES``: ``'first'`` (default) keeps the first Service, ``'last'`` the last,
+       ``'union'`` merges their messages keeping the first of each conflicting MIN and ``'error'``
+       merges their messages but does not write ``target`` if any MIN conflicts
+    :param binary: (Boolean) flag to also write the merged definitions to a compact binary export
+       ``<target>.idpbin``, see :mod:`~idp_mdf_merge.binary`; not rewritten if up to date with
+       ``target``
+    :param validate: (Boolean) flag to validate each Service as it is loaded, adding a
+       ``ValidateStage`` to the pipeline, reporting missing mandatory elements, SINs and MINs out of
+       range, Sizes beyond their limits and Enum items exceeding their Size in the error log, see
+       :mod:`~idp_mdf_merge.validate`
     :return: (string) error description if error, or None if successful
 
     """
-    SUPPORTED_TAGS = ['Name', 'SIN', 'ForwardMessages', 'ReturnMessages']
     error_string = ''
     if files is None:
         error_string = "No files to merge."
@@ -289,112 +1048,75 @@ def merge_mdf(files, target, meta=False):
     elif target is None:
         error_string = "No target file to output."
         # TODO: consider using the current active directory and a default filename "merged.idpmsg"
+    elif conflicts not in CONFLICT_POLICIES:
+        error_string = "Unknown conflict policy {conflicts}".format(conflicts=conflicts)
+    elif backend_error(backend) is not None:
+        error_string = "ERROR: {reason}".format(reason=backend_error(backend))
     else:
-        base_filename, ext = os.path.splitext(target)
-        if ext != '.idpmsg':
-            target = target.replace(ext, '.idpmsg')
+        target, err_filename, manifest_filename = output_paths(target)
         if not valid_path(target.replace(os.path.basename(target), '')):
             return "ERROR: Invalid target file/path {target}".format(target=target)
-        err_filename = base_filename + '_ERR.log'
-        services = []
-        exceptions = []
-        if len(files) == 1 and meta:
-            exceptions.append("WARNING: not merging files only applying metadata tags to single file.")
-        root = ET.Element('MessageDefinition')
-        root.tail = '\n'
-        root.text = '\n  '
-        trunk = ET.SubElement(parent=root, tag='Services')
-        trunk.tail = '\n'
-        trunk.text = '\n    '
-        tree = ET.ElementTree(root)
-        for f in files:
-            if not valid_path(f):
-                exceptions.append("ERROR: Source file/path {file} does not exist".format(file=f))
-                break
-            branch = ET.parse(f).getroot()
-            '''
-            # TODO: method for removing xml namespaces
-            with open(f) as r:
-                xmlstring = r.read()
-            for key, value in NS.iteritems():
-                xmlstring = xmlstring.replace(' xmlns:'+key+'=', '').replace('\"'+value+'\"', '')
-                xmlstring = xmlstring.replace(key+':', '')
-            branch = ET.fromstring(xmlstring)
-            '''
-            if branch.findall('Services'):
-                for limb in branch[0]:
-                    # TODO: validation of mandatory elements e.g. SIN
-                    service = limb.find('SIN').text
-                    for twig in limb:
-                        if twig.tag not in SUPPORTED_TAGS:
-                            limb.remove(twig)
-                            exceptions.append("WARNING: Found/removed unsupported tag {tag} "
-                                              "in {service}".format(tag=twig.tag, service=service))
-                    if meta:
-                        limb.set('sin', service)
-                        if limb.find('Name').text:
-                            limb.set('name', limb.find('Name').text)
-                        else:
-                            limb.set('name', "*undefined*")
-                    for msg in limb.iter('Message'):
-                        if meta:
-                            if msg.find('MIN').text:
-                                msg.set('min', msg.find('MIN').text)
-                            else:
-                                exceptions.append("ERROR: MIN not specified in SIN {sin}".format(sin=service))
-                            if msg.find('Name').text:
-                                msg.set('name', msg.find('Name').text)
-                            else:
-                                msg.set('name', '*undefined*')
-                    for desc in limb.iter('Description'):
-                        desc.text = clean_desc(desc.text)
-                    if service not in services:
-                        services.append(service)
-                        next_indent = '\n    '
-                        if limb.tail != next_indent:
-                            limb.tail = next_indent
-                        trunk.append(limb)
-                    else:
-                        exceptions.append("WARNING: Found duplicate SIN in \"{file}\" Services "
-                                          "- ignoring SIN {sin}".format(file=f, sin=service))
-            else:
-                exceptions.append("WARNING: Invalid Message Definition File - no Services in {file}".format(file=f))
-        if len(services) > 0:
-            container = tree.find("Services")
-            data = []
-            for elem in container:
-                key = elem.findtext("SIN")
-                data.append((int(key), elem))
-            data.sort(key=lambda tup: tup[0])
-            container[:] = [item[-1] for item in data]
-            last_element_index = len(services) - 1
-            trunk[last_element_index].tail = '\n  '
-            for prefix, uri in NS.iteritems():
-                # TODO: investigate why xsi is already in the namespace (had to comment out of NS above)
-                root.set('xmlns:' + prefix, uri)
-            tree.write(target, encoding='utf-8', xml_declaration=True)
-        else:
-            exceptions.append("ERROR: No Services found in source file set.")
-        if len(exceptions) > 0:
-            error_file = open(err_filename, 'w')
-            for e in exceptions:
-                if error_string != '':
-                    error_string += '\n'
-                error_string += e
-            error_file.write(error_string)
-            error_file.close()
+        with ErrorLog(err_filename) as exceptions:
+            if len(files) == 1 and meta:
+                exceptions.append("WARNING: not merging files only applying metadata tags to single file.")
+            pipeline = merge_pipeline(pipeline, meta, validate)
+            backend = get_backend(backend)
+            if stats is not None:
+                stats.start()
+            try:
+                start = clock()
+                local = fetch_sources(files, fetcher, exceptions)
+                if stats is not None and len(local) > 0:
+                    stats.add('fetch', clock() - start)
+                if incremental or isinstance(incremental, dict):
+                    resident = incremental if isinstance(incremental, dict) else None
+                    merged = _merge_incremental(files, target, pipeline, backend, exceptions, manifest_filename,
+                                                workers=workers, local=local, manifest=resident, stats=stats,
+                                                conflicts=conflicts)
+                elif stream:
+                    merged = _merge_stream(files, target, pipeline, backend, exceptions, local=local, stats=stats,
+                                           conflicts=conflicts)
+                else:
+                    merged = _merge_tree(files, target, pipeline, backend, exceptions, workers=workers, cache=cache,
+                                         registry=registry, local=local, stats=stats, conflicts=conflicts)
+            finally:
+                if stats is not None:
+                    stats.stop(target)
+            if stats is not None:
+                stats.services = merged or 0
+            if merged == 0:
+                exceptions.append("ERROR: No Services found in source file set.")
+            elif merged is not None and binary:
+                export_binary(target, backend, exceptions)
+        error_string = exceptions.text
     return error_string if error_string != '' else None
 
 
-def _on_closing():
-    """Graceful program exit if user closes the window."""
-    sys.exit("Operation cancelled.")
-
-
 def get_merge_parameters(files, target, modem, lsf, meta):
     """
     Displays a UI confirming merge setup and allowing modification.
 
+    The Tkinter UI is imported on first use.
+
+    :param files: a list of file names to merge
+    :param target: the target merged file name
+    :param modem: (Boolean) to include core modem definitions
+    :param lsf: (Boolean) to include SkyWave LSF Core+Agent Services
+    :param meta: (Boolean) to include metadata tags in merged XML output
+    :return: a dictionary as returned by ``get_batch_parameters``
+
+    """
+    try:
+        from . import gui
+    except (ImportError, ValueError):
+        import gui
+    return gui.get_merge_parameters(files, target, modem, lsf, meta)
+
+
+def get_batch_parameters(files, target, modem, lsf, meta):
+    """
+    Validates the merge setup given on the command line without displaying a UI.
+
     :param files: a list of file names to merge
     :param target: the target merged file name
     :param modem: (Boolean) to include core modem definitions
@@ -410,27 +1132,27 @@ def get_merge_parameters(files, target, modem, lsf, meta):
         * ``error`` - (None) if no errors or (list of string) any processing errors
 
     """
-    error = None
-    merge_parameters = {
-        'files': files,
+    errors = []
+    file_list = list(files) if files is not None else []
+    if modem:
+        file_list.append(CORE_MODEM_PATH + CORE_MODEM_FILE)
+    if lsf:
+        file_list.append(LSF_CORE_PATH + LSF_CORE_AGENTS_FILE)
+    for f in file_list:
+        if not valid_path(f):
+            errors.append("ERROR: Invalid path {path}".format(path=f))
+    if len(file_list) < 1:
+        errors.append("ERROR: No files selected to merge.")
+    if target is None:
+        errors.append("ERROR: No target file specified.")
+    return {
+        'files': file_list,
         'target': target,
         'modem': modem,
         'lsf': lsf,
         'meta': meta,
-        'error': error
+        'error': errors if len(errors) > 0 else None
     }
-    root = tk.Tk()
-    dialog = MergeDialog(root, merge_parameters)
-    root.protocol('WM_DELETE_WINDOW', _on_closing)
-    root.mainloop()
-    merge_parameters = dialog.parameters
-    if len(merge_parameters['files']) < 1:
-        err = "ERROR: No files selected to merge."
-        if merge_parameters['error'] is None:
-            merge_parameters['error'] = [err]
-        else:
-            merge_parameters['error'].append(err)
-    return merge_parameters
 
 
 def parse_args(argv):
@@ -445,9 +1167,33 @@ def parse_args(argv):
         * ``lsf`` - (Boolean) flag to include SkyWave LSF core/agent definitions
         * ``files`` - (list of string) input files to merge
         * ``target`` - (string) output file
+        * ``stream`` - (Boolean) flag to merge one Service at a time with bounded memory
+        * ``jobs`` - (int) number of worker processes used to load input files
+        * ``no_cache`` - (Boolean) flag to disable the cache of parsed definitions
+        * ``clear_cache`` - (Boolean) flag to empty the cache of parsed definitions before merging
+        * ``no_gui`` - (Boolean) flag to merge the files given on the command line without a UI
+        * ``incremental`` - (Boolean) flag to reparse only the source files changed since the last merge
+        * ``watch`` - (string) directory of source files to merge again each time one changes, or None
+        * ``profile`` - (string) ``-`` to print merge statistics, a JSON file to write them to, or None
+        * ``profile_cpu`` - (Boolean) flag to include a ``cProfile`` CPU profile in the statistics
+        * ``profile_memory`` - (Boolean) flag to trace memory allocations with ``tracemalloc``
+        * ``backend`` - (string) XML backend, one of ``BACKENDS``, or None for the default
+        * ``bundles`` - (string) JSON or YAML manifest of bundles to merge, or None
+        * ``diff`` - (list of string) previous and new message definition files to compare, or None
+        * ``sizes`` - (string) message definition file whose message sizes are listed, or None
+        * ``size_limit`` - (int) bytes above which a message size is reported, or None
+        * ``shard_bytes`` - (int) largest size of each file of a merge split into shards, or None
+        * ``shard_services`` - (int) largest number of Services of each file of a merge split into shards, or None
+        * ``serve`` - (string) ``[HOST:]PORT`` to serve merges over HTTP on, or None
+        * ``conflicts`` - (string) policy resolving a SIN found in more than one Service, one of ``CONFLICT_POLICIES``
+        * ``binary`` - (Boolean) flag to also write a binary export of the merged definitions
+        * ``validate`` - (Boolean) flag to validate each Service, reporting problems in the error log
+        * ``replay`` - (list of string) log of recorded messages and merged definitions to decode it with, or None
+        * ``replay_output`` - (string) file to which each decoded record is written as JSON, or None
+        * ``replay_counts`` - (string) file to which the counts of each SIN and MIN are written as JSON, or None
 
     """
-    global enable_smart_tags
+    import argparse
     parser = argparse.ArgumentParser(description='Merge IDP Message Definition Files')
     parser.add_argument('-m', '--modem', required=False, dest='modem', action='store_true',
                         help=str("Import IDP Core Modem definitions."))
@@ -461,29 +1207,439 @@ def parse_args(argv):
                                  " NOTE: use double-quoted path name."))
     parser.add_argument('--meta', required=False, dest='meta', action='store_true',
                         help=str("Add metadata tags in XML attributes. NOTE: may not be supported by IDP gateway."))
-    return vars(parser.parse_args(args=argv[1:]))
+    parser.add_argument('--stream', required=False, dest='stream', action='store_true',
+                        help=str("Parse and merge one Service at a time to limit memory use on very large files."))
+    parser.add_argument('-j', '--jobs', required=False, dest='jobs', type=int, default=None,
+                        help=str("Number of worker processes used to parse source files in parallel."))
+    parser.add_argument('--no-cache', required=False, dest='no_cache', action='store_true',
+                        help=str("Always parse source files instead of using cached definitions."))
+    parser.add_argument('--clear-cache', required=False, dest='clear_cache', action='store_true',
+                        help=str("Empty the cache of parsed definitions before merging."))
+    parser.add_argument('--no-gui', required=False, dest='no_gui', action='store_true',
+                        help=str("Merge the files given on the command line without displaying the dialog. \n"
+                                 " Requires --target."))
+    parser.add_argument('--incremental', required=False, dest='incremental', action='store_true',
+                        help=str("Reparse only the source files changed since the last merge to the same target."))
+    parser.add_argument('--watch', required=False, dest='watch', metavar='DIR', default=None,
+                        help=str("Merge the source files (*.idpmsg) in DIR, then merge again each time one changes, \n"
+                                 " until interrupted. Requires --target."))
+    parser.add_argument('--profile', required=False, dest='profile', metavar='FILE', nargs='?', const='-',
+                        default=None,
+                        help=str("Print the time of each merge phase and per source file statistics, \n"
+                                 " or write them to FILE as JSON."))
+    parser.add_argument('--profile-cpu', required=False, dest='profile_cpu', action='store_true',
+                        help=str("Profile the merge with cProfile (implies --profile; saved to FILE.prof with FILE)."))
+    parser.add_argument('--profile-memory', required=False, dest='profile_memory', action='store_true',
+                        help=str("Trace memory allocations with tracemalloc (implies --profile)."))
+    parser.add_argument('--backend', required=False, dest='backend', choices=BACKENDS, default=None,
+                        help=str("XML library used to parse and write files (default: etree; lxml if installed and "
+                                 "requested)."))
+    parser.add_argument('--bundles', required=False, dest='bundles', metavar='MANIFEST', default=None,
+                        help=str("Merge each bundle (target and source files) listed in a JSON or YAML MANIFEST, \n"
+                                 " parsing each source file once."))
+    parser.add_argument('--diff', required=False, dest='diff', nargs=2, metavar=('OLD', 'NEW'), default=None,
+                        help=str("List the Services, Messages and Fields added, removed or modified from OLD to NEW \n"
+                                 " (*.idpmsg), exiting with status 1 if they differ."))
+    parser.add_argument('--sizes', required=False, dest='sizes', metavar='FILE', default=None,
+                        help=str("List the minimum and maximum encoded size of each message of FILE (*.idpmsg)."))
+    parser.add_argument('--size-limit', required=False, dest='size_limit', metavar='BYTES', type=int, default=None,
+                        help=str("With --sizes, list only the messages that may exceed BYTES, \n"
+                                 " exiting with status 1 if any."))
+    parser.add_argument('--shard-bytes', required=False, dest='shard_bytes', metavar='BYTES', type=int, default=None,
+                        help=str("Split the merge into files of at most BYTES, listed in <target>_SHARDS.json."))
+    parser.add_argument('--shard-services', required=False, dest='shard_services', metavar='COUNT', type=int,
+                        default=None,
+                        help=str("Split the merge into files of at most COUNT Services, \n"
+                                 " listed in <target>_SHARDS.json."))
+    parser.add_argument('--serve', required=False, dest='serve', metavar='[HOST:]PORT', default=None,
+                        help=str("Serve merges over HTTP (POST /merge with a JSON body), keeping parsed \n"
+                                 " source files in memory, until interrupted. Requires Python 3.7+."))
+    parser.add_argument('--conflicts', required=False, dest='conflicts', choices=CONFLICT_POLICIES, default=FIRST,
+                        help=str("Resolve a SIN found in more than one source file by keeping the first (default) \n"
+                                 " or last Service, by merging their messages (union), or by merging their \n"
+                                 " messages unless a MIN conflicts (error)."))
+    parser.add_argument('--binary', required=False, dest='binary', action='store_true',
+                        help=str("Also write the merged definitions to <target>.idpbin, a compact binary file \n"
+                                 " that decoders can load without parsing XML."))
+    parser.add_argument('--validate', required=False, dest='validate', action='store_true',
+                        help=str("Validate each Service as it is loaded (mandatory elements, SIN/MIN ranges, \n"
+                                 " field Sizes and Enum items), reporting problems in the error log."))
+    parser.add_argument('--replay', required=False, dest='replay', nargs=2, metavar=('LOG', 'MDF'), default=None,
+                        help=str("Decode each line (SIN, MIN, hex payload) of LOG with the merged definitions MDF, \n"
+                                 " exiting with status 1 if any message fails to decode."))
+    parser.add_argument('--replay-output', required=False, dest='replay_output', metavar='FILE', default=None,
+                        help=str("With --replay, write each decoded message or error to FILE as JSON lines \n"
+                                 " (- for standard output)."))
+    parser.add_argument('--replay-counts', required=False, dest='replay_counts', metavar='FILE', default=None,
+                        help=str("With --replay, write the messages decoded and failed by SIN and MIN to FILE \n"
+                                 " as JSON lines."))
+    options = vars(parser.parse_args(args=argv[1:]))
+    if options['backend'] is not None and backend_error(options['backend']) is not None:
+        parser.error(backend_error(options['backend']))
+    return options
+
+
+def watch(directory, target, files=None, modem=False, lsf=False, meta=False, workers=None, backend=None,
+          conflicts=FIRST, binary=False, validate=False):
+    """
+    Merges the source files of a directory each time one changes, until interrupted.
+
+    :param directory: (string) directory of the ``.idpmsg`` source files to watch
+    :param target: (string) the target merged file name
+    :param files: (list of string) other source files to merge, which are not watched
+    :param modem: (Boolean) to include core modem definitions
+    :param lsf: (Boolean) to include SkyWave LSF Core+Agent Services
+    :param meta: (Boolean) to include metadata tags in merged XML output
+    :param workers: (int) number of worker processes used to parse changed files
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param conflicts: policy resolving a SIN found in more than one Service, one of
+       ``CONFLICT_POLICIES``
+    :param binary: (Boolean) to also write the compact binary export of the target
+    :param validate: (Boolean) to validate each Service as it is loaded
+
+    """
+    try:
+        from .watch import Watcher
+    except (ImportError, ValueError):
+        from watch import Watcher
+    if not os.path.isdir(directory):
+        print("ERROR: Invalid watch directory {dir}".format(dir=directory))
+        return
+    if target is None:
+        print("ERROR: No target file specified.")
+        return
+    file_list = list(files) if files is not None else []
+    if modem:
+        file_list.append(CORE_MODEM_PATH + CORE_MODEM_FILE)
+    if lsf:
+        file_list.append(LSF_CORE_PATH + LSF_CORE_AGENTS_FILE)
+
+    def report(error, elapsed):
+        if error is None:
+            print("Merged {target} in {ms:.1f} ms.".format(target=target, ms=elapsed * 1000))
+        else:
+            print(error)
+
+    watcher = Watcher(directory, target, files=file_list, meta=meta, workers=workers, backend=backend,
+                      conflicts=conflicts, binary=binary, validate=validate, callback=report)
+    print("Watching {dir} (Ctrl+C to stop)...".format(dir=directory))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def serve_merges(address, workers=None, backend=None):
+    """
+    Serves merges over HTTP until interrupted.
+
+    :param address: (string) ``[HOST:]PORT`` to listen on, on the local host if HOST is omitted
+    :param workers: (int) number of worker processes parsing source files
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+
+    """
+    if sys.version_info < (3, 7):
+        print("ERROR: Serving merges requires Python 3.7 or later")
+        return
+    try:
+        from .service import SERVICE_HOST, serve
+    except (ImportError, ValueError):
+        from service import SERVICE_HOST, serve
+    host, sep, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        print("ERROR: Invalid port {port}".format(port=port))
+        return
+
+    def listening(address):
+        print("Serving merges on http://{host}:{port}/merge (Ctrl+C to stop)...".format(host=address[0],
+                                                                                      port=address[1]))
+
+    serve(host or SERVICE_HOST, port, workers=workers, backend=backend, callback=listening)
+
+
+def merge_bundle_manifest(filename, workers=None, backend=None):
+    """
+    Merges the bundles of a manifest, printing the outcome of each and the time saved.
+
+    :param filename: (string) path/filename of a JSON or YAML bundle manifest
+    :param workers: (int) number of worker processes used to parse source files, and of threads
+       used to write bundles
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+
+    """
+    try:
+        from .bundle import read_bundles, merge_bundles
+    except (ImportError, ValueError):
+        from bundle import read_bundles, merge_bundles
+    try:
+        bundles = read_bundles(filename)
+    except (IOError, OSError, ImportError, ValueError) as e:
+        print("ERROR: Invalid bundle manifest {file}: {reason}".format(file=filename, reason=e))
+        return
+    report = merge_bundles(bundles, workers=workers, backend=backend)
+    for bundle, error in zip(bundles, report.errors):
+        print("{target}: {result}".format(target=bundle.target,
+                                          result="Operation completed." if error is None else error))
+    print("Merged {bundles} bundles parsing {sources} of {parses} source files in {elapsed:.2f} s "
+          "(estimated {saved:.2f} s saved).".format(bundles=len(bundles), sources=report.sources,
+                                                    parses=report.parses, elapsed=report.elapsed,
+                                                    saved=report.saved))
+
+
+def merge_shard_parameters(merge_parameters, max_bytes=None, max_services=None, workers=None, backend=None,
+                           conflicts=FIRST, validate=False):
+    """
+    Merges into shards within a budget of bytes and/or Services, printing the outcome and each shard.
+
+    :param merge_parameters: (dict) as returned by ``get_merge_parameters``
+    :param max_bytes: (int) largest size of a shard, or None for no limit
+    :param max_services: (int) largest number of Services of a shard, or None for no limit
+    :param workers: (int) number of worker processes used to parse source files, and of threads
+       used to write shards
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param conflicts: policy resolving a SIN found in more than one Service, one of ``CONFLICT_POLICIES``
+    :param validate: (Boolean) flag to validate each Service
+
+    """
+    try:
+        from .shard import merge_shards
+    except (ImportError, ValueError):
+        from shard import merge_shards
+    shards, error = merge_shards(merge_parameters['files'], merge_parameters['target'], max_bytes=max_bytes,
+                                 max_services=max_services, meta=merge_parameters['meta'], workers=workers,
+                                 backend=backend, conflicts=conflicts, validate=validate)
+    for shard in shards:
+        print("{file}: {services} Services, {size} bytes".format(file=shard.filename, services=len(shard.sins),
+                                                                size=shard.size))
+    print("Operation completed." if error is None else error)
+
+
+def diff_mdf(old_filename, new_filename, backend=None):
+    """
+    Prints the Services, Messages and Fields added, removed or modified between two message
+    definition files.
+
+    :param old_filename: (string) path/filename of the previous version
+    :param new_filename: (string) path/filename of the new version
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :return: (list of Change) the differences, or None if a file could not be read
+
+    """
+    try:
+        from .diff import diff_files
+    except (ImportError, ValueError):
+        from diff import diff_files
+    for f in (old_filename, new_filename):
+        if not os.path.isfile(f):
+            print("ERROR: Invalid path {path}".format(path=f))
+            return None
+    try:
+        changes = diff_files(old_filename, new_filename, backend=get_backend(backend))
+    # the parse errors of ElementTree and lxml are both SyntaxErrors
+    except (SyntaxError, ValueError) as e:
+        print("ERROR: {reason}".format(reason=e))
+        return None
+    for change in changes:
+        print(change)
+    if len(changes) == 0:
+        print("No changes.")
+    return changes
+
+
+def sizes_mdf(filename, limit=None, backend=None, cache=None):
+    """
+    Prints the minimum and maximum encoded size of the messages of a message definition file.
+
+    :param filename: (string) path/filename of the message definition file, e.g. a merged file
+    :param limit: (int) bytes above which a message is reported, or None to report every message
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param cache: (DefinitionCache) to reuse the sizes of an unchanged file, or None
+    :return: (list of tuple) ``(sin, direction, min)`` of each message reported, or None if the
+       file could not be read
+
+    """
+    try:
+        from .sizes import SizeIndex, message_order
+    except (ImportError, ValueError):
+        from sizes import SizeIndex, message_order
+    if not os.path.isfile(filename):
+        print("ERROR: Invalid path {path}".format(path=filename))
+        return None
+    try:
+        index = SizeIndex.from_file(filename, backend=get_backend(backend), cache=cache)
+    # the parse errors of ElementTree and lxml are both SyntaxErrors
+    except (SyntaxError, ValueError) as e:
+        print("ERROR: {reason}".format(reason=e))
+        return None
+    # every message has at least the SIN and MIN
+    keys = index.exceeding(0 if limit is None else limit)
+    for key in keys:
+        low, high = index.bounds[key]
+        print("SIN {sin} {direction} MIN {min} {name}: {low} to {high} bytes".format(
+            sin=key[0], direction=key[1], min=key[2], name=index.names[key], low=low,
+            high='unbounded' if high is None else high))
+    for key in sorted(index.errors, key=message_order):
+        print("WARNING: SIN {sin} {direction} MIN {min} size unknown: {reason}".format(
+            sin=key[0], direction=key[1], min=key[2], reason=index.errors[key]))
+    if limit is not None:
+        print("{count} of {total} messages may exceed {limit} bytes.".format(count=len(keys), total=len(index),
+                                                                             limit=limit))
+    return keys
+
+
+def replay_mdf(log, definitions, output=None, counts=None, workers=None):
+    """
+    Decodes each recorded message of a log with merged message definitions, printing the number
+    of messages decoded and failed.
+
+    :param log: (string) path/filename of the log, one SIN, MIN and hexadecimal payload per line
+    :param definitions: (string) path/filename of the merged message definition file, or of its
+       binary export
+    :param output: (string) path/filename to which each record is written as a line of JSON,
+       ``-`` for the standard output, or None
+    :param counts: (string) path/filename to which the counts of each SIN and MIN are written as
+       lines of JSON, or None to print them
+    :param workers: (int) number of worker processes decoding the log, or None to decode serially
+    :return: (ReplayReport) or None if a file could not be read or written
+
+    """
+    try:
+        from .replay import replay_log
+    except (ImportError, ValueError):
+        from replay import replay_log
+    for f in (log, definitions):
+        if not os.path.isfile(f):
+            print("ERROR: Invalid path {path}".format(path=f))
+            return None
+    try:
+        report = replay_log(log, definitions, output=output, workers=workers)
+        if counts is not None:
+            with open(counts, 'w') as f:
+                report.write_counts(f)
+    # the parse errors of ElementTree and lxml are both SyntaxErrors
+    except (IOError, OSError, SyntaxError, ValueError) as e:
+        print("ERROR: {reason}".format(reason=e))
+        return None
+    # the records may be written to the standard output
+    summary = sys.stderr if output == '-' else sys.stdout
+    if counts is None:
+        for sin, min in sorted(report.counts):
+            decoded, failed = report.counts[sin, min]
+            summary.write("SIN {sin} MIN {min}: {decoded} decoded, {failed} failed\n".format(
+                sin=sin, min=min, decoded=decoded, failed=failed))
+    summary.write("{decoded} of {total} messages decoded, {failed} failed, {malformed} malformed lines.\n".format(
+        decoded=report.decoded, total=report.decoded + report.failed, failed=report.failed,
+        malformed=report.malformed))
+    return report
+
+
+def report_stats(stats, filename=None):
+    """
+    Prints or saves the statistics of a merge.
+
+    :param stats: (MergeStats) of the merge
+    :param filename: (string) JSON file to write to, or None or ``-`` to print a table; a CPU
+       profile is printed, or saved to ``<filename>.prof``
+
+    """
+    if filename is None or filename == '-':
+        print(stats.format_table())
+        if stats.profile is not None:
+            stats.profile.sort_stats('cumulative').print_stats(20)
+    else:
+        import json
+        with open(filename, 'w') as f:
+            json.dump(stats.as_dict(), f, indent=2, sort_keys=True)
+        if stats.profile is not None:
+            stats.profile.dump_stats(filename + '.prof')
 
 
 def main():
     user_options = parse_args(sys.argv)
+    if user_options['watch'] is not None:
+        watch(user_options['watch'],
+              target=user_options['target'],
+              files=user_options['files'],
+              modem=user_options['modem'],
+              lsf=user_options['lsf'],
+              meta=user_options['meta'],
+              workers=user_options['jobs'],
+              backend=user_options['backend'],
+              conflicts=user_options['conflicts'],
+              binary=user_options['binary'],
+              validate=user_options['validate'])
+        return
+    if user_options['serve'] is not None:
+        serve_merges(user_options['serve'], workers=user_options['jobs'], backend=user_options['backend'])
+        return
+    if user_options['diff'] is not None:
+        changes = diff_mdf(user_options['diff'][0], user_options['diff'][1], backend=user_options['backend'])
+        sys.exit(2 if changes is None else 1 if len(changes) > 0 else 0)
+    if user_options['sizes'] is not None:
+        cache = None if user_options['no_cache'] else DefinitionCache()
+        keys = sizes_mdf(user_options['sizes'], limit=user_options['size_limit'], backend=user_options['backend'],
+                         cache=cache)
+        sys.exit(2 if keys is None else 1 if user_options['size_limit'] is not None and len(keys) > 0 else 0)
+    if user_options['replay'] is not None:
+        report = replay_mdf(user_options['replay'][0], user_options['replay'][1], output=user_options['replay_output'],
+                            counts=user_options['replay_counts'], workers=user_options['jobs'])
+        sys.exit(2 if report is None else 1 if report.failed > 0 else 0)
+    if user_options['bundles'] is not None:
+        merge_bundle_manifest(user_options['bundles'], workers=user_options['jobs'], backend=user_options['backend'])
+        return
+    cache = DefinitionCache()
+    if user_options['clear_cache']:
+        cache.clear()
+    if user_options['no_cache']:
+        cache = None
     files = user_options['files']
-    merge_parameters = get_merge_parameters(files=files,
-                                            target=user_options['target'],
-                                            modem=user_options['modem'],
-                                            lsf=user_options['lsf'],
-                                            meta=user_options['meta'])
-    if merge_parameters['error'] is None:
+    if user_options['no_gui']:
+        get_parameters = get_batch_parameters
+    else:
+        get_parameters = get_merge_parameters
+    merge_parameters = get_parameters(files=files,
+                                      target=user_options['target'],
+                                      modem=user_options['modem'],
+                                      lsf=user_options['lsf'],
+                                      meta=user_options['meta'])
+    stats = None
+    profile = user_options['profile']
+    if profile is not None or user_options['profile_cpu'] or user_options['profile_memory']:
+        stats = MergeStats(memory=user_options['profile_memory'], profile=user_options['profile_cpu'])
+        if user_options['profile_memory'] and not stats.memory:
+            print("WARNING: tracemalloc is not available, reporting the peak resident set size instead")
+    if merge_parameters['error'] is None and (user_options['shard_bytes'] is not None or
+                                              user_options['shard_services'] is not None):
+        merge_shard_parameters(merge_parameters, user_options['shard_bytes'], user_options['shard_services'],
+                               workers=user_options['jobs'], backend=user_options['backend'],
+                               conflicts=user_options['conflicts'], validate=user_options['validate'])
+    elif merge_parameters['error'] is None:
         error = merge_mdf(files=merge_parameters['files'],
                           target=merge_parameters['target'],
-                          meta=merge_parameters['meta'])
+                          meta=merge_parameters['meta'],
+                          stream=user_options['stream'],
+                          workers=user_options['jobs'],
+                          cache=cache,
+                          incremental=user_options['incremental'],
+                          stats=stats,
+                          backend=user_options['backend'],
+                          conflicts=user_options['conflicts'],
+                          binary=user_options['binary'],
+                          validate=user_options['validate'])
         if error is None:
             print("Operation completed.")
         else:
             print(error)
+        if stats is not None and stats.elapsed is not None:
+            report_stats(stats, profile)
     else:
         for e in merge_parameters['error']:
             print(e)
 
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
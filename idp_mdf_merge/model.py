@@ -0,0 +1,414 @@
+"""
+Compact object model of message definitions.
+
+:class:`Service`, :class:`Message` and :class:`Field` hold a definition in ``__slots__`` objects in
+place of a tree of ElementTree Elements: SIN, MIN, Size and PIN are integers, field types are the
+small integers of the Terminal API (``ENUM`` to ``MESSAGE`` of :mod:`~idp_mdf_merge.codec`), flags
+are Booleans, and names and Enum items are interned. A Field takes a single object where its Element
+takes one per child element, and attributes are read without a ``findtext`` lookup or conversion.
+
+:func:`load` reads the Services of a message definition file, :func:`iter_load` reads them one at
+a time to bound memory use by the largest Service, and :func:`dump` writes Services to a message
+definition file, indented with two spaces per level, with the child elements of each definition in
+a fixed order and Optional, Fixed and Hide only where true. Elements outside the model are dropped,
+as well as the metadata attributes of a merge with ``meta``, which :func:`dump` can add again.
+
+"""
+
+import xml.etree.ElementTree as ET
+try:
+    from sys import intern
+except ImportError:
+    pass
+try:
+    from .codec import FIELD_TYPES, XSI_TYPE
+    from .registry import FORWARD, RETURN
+    from .writer import MdfWriter, serialize_service
+    from .backend import get_backend
+except (ImportError, ValueError):
+    from codec import FIELD_TYPES, XSI_TYPE
+    from registry import FORWARD, RETURN
+    from writer import MdfWriter, serialize_service
+    from backend import get_backend
+
+# Field type name of each field type, e.g. 'UnsignedIntField' of UNSIGNED
+TYPE_NAMES = dict((ftype, name) for name, ftype in FIELD_TYPES.items())
+
+_INDENT = '  '
+
+_XSI_URI = XSI_TYPE[1:XSI_TYPE.index('}')]
+_XSI_PREFIX = 'xsi'
+
+
+def _name(text):
+    return intern(text) if text else text
+
+
+def _flag(text):
+    return (text or '').strip().lower() == 'true'
+
+
+def _int(text):
+    return int(text) if text else None
+
+
+def _sub(parent, tag, text):
+    child = ET.SubElement(parent, tag)
+    child.text = text
+    return child
+
+
+def _indent(elem, level):
+    """Indents the subtree of an element at depth ``level`` with ``_INDENT`` per level."""
+    if len(elem):
+        inner = '\n' + _INDENT * (level + 1)
+        elem.text = inner
+        for child in elem:
+            _indent(child, level + 1)
+            child.tail = inner
+        child.tail = '\n' + _INDENT * level
+
+
+class _Definition(object):
+    """Equality and representation of definitions by their slots."""
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, slot) == getattr(other, slot)
+                                                 for slot in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{cls}({name!r})'.format(cls=type(self).__name__, name=self.name)
+
+
+class Field(_Definition):
+    """
+    Definition of a message field.
+
+    :param name: (string) field name
+    :param type: (int) field type e.g. ``UNSIGNED``
+    :param description: (string) or None
+    :param size: (int) bits, characters, bytes or elements depending on ``type``, or None
+    :param optional: (Boolean) field is preceded by a presence flag
+    :param fixed: (Boolean) String/Data/Array always has ``size`` characters/bytes/elements
+    :param default: (string) default value as written in the definition, or None
+    :param items: (tuple of string) Enum items
+    :param fields: (tuple of Field) Array element fields
+    :param sin: (int) Service of a PropertyField, or None
+    :param pin: (int) Property Identification Number of a PropertyField, or None
+
+    """
+    __slots__ = ('name', 'type', 'description', 'size', 'optional', 'fixed', 'default', 'items', 'fields',
+                 'sin', 'pin')
+
+    def __init__(self, name, type, description=None, size=None, optional=False, fixed=False, default=None,
+                 items=(), fields=(), sin=None, pin=None):
+        self.name = name
+        self.type = type
+        self.description = description
+        self.size = size
+        self.optional = optional
+        self.fixed = fixed
+        self.default = default
+        self.items = tuple(items)
+        self.fields = tuple(fields)
+        self.sin = sin
+        self.pin = pin
+
+    @property
+    def type_name(self):
+        """(string) field type name, e.g. ``UnsignedIntField``."""
+        return TYPE_NAMES[self.type]
+
+    @classmethod
+    def from_element(cls, elem):
+        """
+        Builds a Field from a ``Field`` element.
+
+        :param elem: (Element) the Field
+        :return: (Field)
+        :raises ValueError: if the field type is unknown or a number is not an integer
+
+        """
+        type_name = elem.get(XSI_TYPE)
+        ftype = FIELD_TYPES.get(type_name)
+        name = description = size = default = sin = pin = None
+        optional = fixed = False
+        items = fields = ()
+        for child in elem:
+            tag = child.tag
+            if tag == 'Name':
+                name = _name(child.text)
+            elif tag == 'Description':
+                description = child.text
+            elif tag == 'Size':
+                size = _int(child.text)
+            elif tag == 'Optional':
+                optional = _flag(child.text)
+            elif tag == 'Fixed':
+                fixed = _flag(child.text)
+            elif tag == 'Default':
+                default = child.text
+            elif tag == 'Items':
+                items = tuple(_name(item.text) for item in child)
+            elif tag == 'Fields':
+                fields = tuple(cls.from_element(field) for field in child)
+            elif tag == 'SIN':
+                sin = _int(child.text)
+            elif tag == 'PIN':
+                pin = _int(child.text)
+        if ftype is None:
+            raise ValueError("Unknown field type {type} of {name}".format(type=type_name, name=name))
+        return cls(name, ftype, description, size, optional, fixed, default, items, fields, sin, pin)
+
+    def to_element(self):
+        """Returns (Element) the ``Field`` element of the definition, without indentation."""
+        elem = ET.Element('Field', {XSI_TYPE: TYPE_NAMES[self.type]})
+        _sub(elem, 'Name', self.name)
+        if self.description is not None:
+            _sub(elem, 'Description', self.description)
+        if self.sin is not None:
+            _sub(elem, 'SIN', str(self.sin))
+        if self.pin is not None:
+            _sub(elem, 'PIN', str(self.pin))
+        if self.optional:
+            _sub(elem, 'Optional', 'true')
+        if self.items:
+            items = ET.SubElement(elem, 'Items')
+            for item in self.items:
+                _sub(items, 'string', item)
+        if self.fields:
+            fields = ET.SubElement(elem, 'Fields')
+            fields.extend(field.to_element() for field in self.fields)
+        if self.fixed:
+            _sub(elem, 'Fixed', 'true')
+        if self.size is not None:
+            _sub(elem, 'Size', str(self.size))
+        if self.default is not None:
+            _sub(elem, 'Default', self.default)
+        return elem
+
+
+class Message(_Definition):
+    """
+    Definition of a message.
+
+    :param name: (string) message name
+    :param min: (int) Message Identification Number, or None if not specified
+    :param description: (string) or None
+    :param fields: (tuple of Field) fields in order
+    :param hide: (Boolean) message is hidden
+
+    """
+    __slots__ = ('name', 'min', 'description', 'fields', 'hide')
+
+    def __init__(self, name, min, description=None, fields=(), hide=False):
+        self.name = name
+        self.min = min
+        self.description = description
+        self.fields = tuple(fields)
+        self.hide = hide
+
+    @classmethod
+    def from_element(cls, elem):
+        """
+        Builds a Message from a ``Message`` element.
+
+        :param elem: (Element) the Message
+        :return: (Message)
+        :raises ValueError: if a field type is unknown or a number is not an integer
+
+        """
+        name = min = description = None
+        fields = ()
+        hide = False
+        for child in elem:
+            tag = child.tag
+            if tag == 'Name':
+                name = _name(child.text)
+            elif tag == 'MIN':
+                min = _int(child.text)
+            elif tag == 'Description':
+                description = child.text
+            elif tag == 'Fields':
+                fields = tuple(Field.from_element(field) for field in child)
+            elif tag == 'Hide':
+                hide = _flag(child.text)
+        return cls(name, min, description, fields, hide)
+
+    def to_element(self, meta=False):
+        """
+        Returns the ``Message`` element of the definition, without indentation.
+
+        :param meta: (Boolean) flag to add ``min``/``name`` metadata attributes
+        :return: (Element)
+
+        """
+        elem = ET.Element('Message')
+        if meta:
+            if self.min is not None:
+                elem.set('min', str(self.min))
+            elem.set('name', self.name if self.name else '*undefined*')
+        _sub(elem, 'Name', self.name)
+        if self.description is not None:
+            _sub(elem, 'Description', self.description)
+        if self.min is not None:
+            _sub(elem, 'MIN', str(self.min))
+        if self.fields:
+            fields = ET.SubElement(elem, 'Fields')
+            fields.extend(field.to_element() for field in self.fields)
+        if self.hide:
+            _sub(elem, 'Hide', 'true')
+        return elem
+
+
+class Service(_Definition):
+    """
+    Definition of a Service.
+
+    :param name: (string) Service name
+    :param sin: (int) Service Identification Number
+    :param description: (string) or None
+    :param forward_messages: (tuple of Message) forward (to-mobile) messages, or None if the
+       Service has no ``ForwardMessages``
+    :param return_messages: (tuple of Message) return (from-mobile) messages, or None if the
+       Service has no ``ReturnMessages``
+
+    """
+    __slots__ = ('name', 'sin', 'description', 'forward_messages', 'return_messages')
+
+    def __init__(self, name, sin, description=None, forward_messages=None, return_messages=None):
+        self.name = name
+        self.sin = sin
+        self.description = description
+        self.forward_messages = None if forward_messages is None else tuple(forward_messages)
+        self.return_messages = None if return_messages is None else tuple(return_messages)
+
+    def messages(self, direction=RETURN):
+        """
+        Returns the messages of a direction.
+
+        :param direction: ``FORWARD`` or ``RETURN`` (default)
+        :return: (tuple of Message)
+
+        """
+        messages = self.forward_messages if direction == FORWARD else self.return_messages
+        return messages if messages is not None else ()
+
+    @classmethod
+    def from_element(cls, elem):
+        """
+        Builds a Service from a ``Service`` element.
+
+        :param elem: (Element) the Service
+        :return: (Service)
+        :raises ValueError: if a field type is unknown or a number is not an integer
+
+        """
+        name = sin = description = forward_messages = return_messages = None
+        for child in elem:
+            tag = child.tag
+            if tag == 'Name':
+                name = _name(child.text)
+            elif tag == 'SIN':
+                sin = _int(child.text)
+            elif tag == 'Description':
+                description = child.text
+            elif tag == FORWARD:
+                forward_messages = tuple(Message.from_element(message) for message in child)
+            elif tag == RETURN:
+                return_messages = tuple(Message.from_element(message) for message in child)
+        return cls(name, sin, description, forward_messages, return_messages)
+
+    def to_element(self, meta=False):
+        """
+        Returns the ``Service`` element of the definition, without indentation.
+
+        :param meta: (Boolean) flag to add ``sin``/``name`` metadata attributes to the Service and
+           ``min``/``name`` to each Message
+        :return: (Element)
+
+        """
+        elem = ET.Element('Service')
+        if meta:
+            elem.set('sin', str(self.sin))
+            elem.set('name', self.name if self.name else '*undefined*')
+        _sub(elem, 'Name', self.name)
+        if self.description is not None:
+            _sub(elem, 'Description', self.description)
+        _sub(elem, 'SIN', str(self.sin))
+        for tag, messages in ((FORWARD, self.forward_messages), (RETURN, self.return_messages)):
+            if messages is not None:
+                parent = ET.SubElement(elem, tag)
+                parent.extend(message.to_element(meta) for message in messages)
+        return elem
+
+
+def iter_load(filename, backend=None):
+    """
+    Yields the Services of a message definition file, parsing one Service at a time.
+
+    :param filename: (string) path/filename of the message definition file
+    :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+    :return: generator of (Service)
+    :raises ValueError: if a field type is unknown or a number is not an integer
+
+    """
+    try:
+        from .idp_mdf_merge import iter_services
+    except (ImportError, ValueError):
+        from idp_mdf_merge import iter_services
+    for limb in iter_services(filename, backend):
+        yield Service.from_element(limb)
+
+
+def load(filename, backend=None):
+    """
+    Reads the Services of a message definition file.
+
+    The file is parsed as a whole before its Services are converted, which is faster than
+    ``iter_load``.
+
+    :param filename: (string) path/filename of the message definition file
+    :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+    :return: (list of Service) in file order
+    :raises ValueError: if a field type is unknown or a number is not an integer
+
+    """
+    if backend is None:
+        backend = get_backend()
+    services = backend.parse(filename).find('Services')
+    return [Service.from_element(limb) for limb in services] if services is not None else []
+
+
+def dump(services, filename, meta=False):
+    """
+    Writes Services to a message definition file.
+
+    :param services: (iterable of Service) in the order written
+    :param filename: (string) path/filename of the file, replaced once complete
+    :param meta: (Boolean) flag to add metadata attributes, as a merge with ``meta``
+    :return: (int) number of Services written
+
+    """
+    try:
+        from .idp_mdf_merge import root_declarations
+    except (ImportError, ValueError):
+        from idp_mdf_merge import root_declarations
+    services = list(services)
+    namespaces = {}
+    # The field type attribute is the only qualified name of a definition
+    if any(message.fields for service in services for direction in (FORWARD, RETURN)
+           for message in service.messages(direction)):
+        namespaces[_XSI_PREFIX] = _XSI_URI
+    with MdfWriter(filename, root_declarations(namespaces)) as out:
+        for service in services:
+            limb = service.to_element(meta)
+            _indent(limb, 2)
+            out.write(serialize_service(limb, {}))
+    return out.services
@@ -0,0 +1,253 @@
+"""
+In-memory index of merged Service definitions by SIN and by (SIN, direction, MIN).
+
+Forward (to-mobile) and return (from-mobile) messages of a Service have independent MIN
+numbering, so messages are indexed per direction.
+
+A Service whose SIN is already registered is resolved by a conflict policy:
+
+    * ``FIRST`` - the registered Service is kept (default)
+    * ``LAST`` - the registered Service is replaced
+    * ``UNION`` - the messages of the Service are added to the registered Service, unless
+      registered with the same SIN, direction and MIN, in which case the registered message is
+      kept as a conflict
+    * ``ERROR`` - as ``UNION``, with each conflict an error of the merge
+
+A Service whose SIN is registered is always a duplicate SIN, but one identical by content to the
+registered Service does not replace it, and a message identical to the one registered is not a
+conflict. Content is compared by a hash of the tags, attributes and text of each element, so
+differences of indentation alone do not count.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+FORWARD = 'ForwardMessages'
+RETURN = 'ReturnMessages'
+DIRECTIONS = (FORWARD, RETURN)
+
+FIRST = 'first'
+LAST = 'last'
+UNION = 'union'
+ERROR = 'error'
+CONFLICT_POLICIES = (FIRST, LAST, UNION, ERROR)
+
+
+def message_keys(sin, service):
+    """
+    Yields the messages of a Service that have an integer MIN, forward messages first.
+
+    :param sin: (int) Service Identification Number
+    :param service: (ElementTree.Element) the Service
+    :return: generator of ``((sin, direction, min), Message)``
+
+    """
+    for direction in DIRECTIONS:
+        messages = service.find(direction)
+        if messages is None:
+            continue
+        for message in messages:
+            min_text = message.findtext('MIN')
+            if not min_text or not min_text.strip().isdigit():
+                continue
+            yield (sin, direction, int(min_text)), message
+
+
+def _content(elem):
+    return (elem.tag, sorted(elem.attrib.items()), (elem.text or '').strip(),
+            [_content(child) for child in elem])
+
+
+def content_digest(elem):
+    """
+    Returns a hash of the content of an element, ignoring whitespace around text.
+
+    :param elem: (ElementTree.Element) e.g. a Service or Message
+    :return: (string) hex digest, equal for elements with the same tags, attributes and text
+
+    """
+    return hashlib.sha1(repr(_content(elem)).encode('utf-8')).hexdigest()
+
+
+def _append(parent, child):
+    """Appends ``child`` to ``parent``, indented as the existing last child."""
+    if len(parent) > 0:
+        last = parent[-1]
+        child.tail = last.tail
+        last.tail = parent[-2].tail if len(parent) > 1 else parent.text
+    parent.append(child)
+
+
+def _container(service, direction, source):
+    """Returns the ``direction`` messages of ``service``, added as an empty copy of ``source`` if missing."""
+    messages = service.find(direction)
+    if messages is None:
+        messages = service.makeelement(direction, {})
+        messages.text = source.text
+        returned = service.find(RETURN) if direction == FORWARD else None
+        if returned is None:
+            _append(service, messages)
+        else:
+            index = list(service).index(returned)
+            messages.tail = service[index - 1].tail if index > 0 else service.text
+            service.insert(index, messages)
+    return messages
+
+
+class ServiceRegistry(object):
+    """
+    Registry of Service elements with O(1) duplicate SIN/MIN detection, iterated in the order the
+    SINs were first registered. ``by_sin()`` returns the Services in ascending order of SIN, as a
+    merged file lists them.
+
+    Attributes:
+
+        * ``duplicate_mins`` - (list of tuple) ``(sin, direction, min)`` of each MIN that was
+          found more than once in a registered Service
+        * ``duplicate_sins`` - (list of int) SIN of each Service added with a SIN already
+          registered
+        * ``conflicts`` - (list of tuple) ``(sin, direction, min)`` of each message added by the
+          ``UNION`` or ``ERROR`` policy that differs from the message registered
+
+    """
+    def __init__(self):
+        self._services = OrderedDict()
+        self._sins = None
+        self._messages = {}
+        self._digests = {}
+        self._service_digests = {}
+        self.duplicate_mins = []
+        self.duplicate_sins = []
+        self.conflicts = []
+
+    def __len__(self):
+        return len(self._services)
+
+    def __contains__(self, sin):
+        return int(sin) in self._services
+
+    def __iter__(self):
+        """Iterates over the Service elements in the order their SINs were first registered."""
+        return iter(list(self._services.values()))
+
+    def by_sin(self):
+        """Returns (list of Element) the registered Services in ascending order of SIN, sorted once per SIN added."""
+        if self._sins is None:
+            self._sins = sorted(self._services)
+        return [self._services[sin] for sin in self._sins]
+
+    def add(self, service, policy=FIRST):
+        """
+        Registers a Service, resolving a SIN already registered by a conflict policy.
+
+        :param service: (ElementTree.Element) the Service
+        :param policy: one of ``CONFLICT_POLICIES``, ``FIRST`` by default
+        :return: (Boolean) True if the Service or any of its messages was registered, False if
+           the SIN is a duplicate ignored or the Service is identical to the one registered, in
+           which case the SIN is still counted in ``duplicate_sins``
+
+        """
+        if policy not in CONFLICT_POLICIES:
+            raise ValueError("Unknown conflict policy {policy}".format(policy=policy))
+        sin = int(service.findtext('SIN'))
+        registered = self._services.get(sin)
+        if registered is not None:
+            if policy in (UNION, ERROR):
+                self.duplicate_sins.append(sin)
+                return self._merge(sin, registered, service)
+            self.duplicate_sins.append(sin)
+            if policy == FIRST:
+                return False
+            digest = content_digest(service)
+            if self._service_digest(sin) == digest:
+                return False
+            for key, message in message_keys(sin, registered):
+                if self._messages.get(key) is message:
+                    del self._messages[key]
+                    self._digests.pop(key, None)
+            self._service_digests[sin] = digest
+        else:
+            self._sins = None
+        self._services[sin] = service
+        for key, message in message_keys(sin, service):
+            if key in self._messages:
+                self.duplicate_mins.append(key)
+            else:
+                self._messages[key] = message
+        return True
+
+    def _service_digest(self, sin):
+        """Returns the content digest of a registered Service, computed once."""
+        digest = self._service_digests.get(sin)
+        if digest is None:
+            digest = self._service_digests[sin] = content_digest(self._services[sin])
+        return digest
+
+    def _digest(self, key):
+        """Returns the content digest of a registered message, computed once."""
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = content_digest(self._messages[key])
+        return digest
+
+    def _merge(self, sin, registered, service):
+        """Adds the messages of ``service`` to the ``registered`` Service of the same SIN."""
+        added = False
+        for direction in DIRECTIONS:
+            messages = service.find(direction)
+            if messages is None:
+                continue
+            for message in list(messages):
+                min_text = message.findtext('MIN')
+                if not min_text or not min_text.strip().isdigit():
+                    continue
+                key = (sin, direction, int(min_text))
+                if key in self._messages:
+                    if self._digest(key) != content_digest(message):
+                        self.conflicts.append(key)
+                    continue
+                _append(_container(registered, direction, messages), message)
+                self._messages[key] = message
+                added = True
+        if added:
+            self._service_digests.pop(sin, None)
+        return added
+
+    def sins(self):
+        """Returns (list of int) the registered SINs in the order they were first registered."""
+        return list(self._services)
+
+    def service(self, sin):
+        """
+        Returns the Service registered for a SIN.
+
+        :param sin: (int) Service Identification Number
+        :return: (ElementTree.Element) the Service, or None if not registered
+
+        """
+        return self._services.get(int(sin))
+
+    def message(self, sin, min, direction=RETURN):
+        """
+        Returns a message definition of a registered Service.
+
+        :param sin: (int) Service Identification Number
+        :param min: (int) Message Identification Number
+        :param direction: ``FORWARD`` or ``RETURN`` (default)
+        :return: (ElementTree.Element) the Message, or None if not registered
+
+        """
+        return self._messages.get((int(sin), direction, int(min)))
+
+    def messages(self, direction=None):
+        """
+        Iterates over the registered messages in ascending order of SIN, direction and MIN.
+
+        :param direction: ``FORWARD`` or ``RETURN`` to iterate only one direction, or None for both
+        :return: generator of ``(sin, direction, min, Message)``
+
+        """
+        for key in sorted(self._messages):
+            if direction is None or key[1] == direction:
+                yield key + (self._messages[key],)
@@ -0,0 +1,272 @@
+"""
+Fetching of remote (``http://`` / ``https://``) message definition files.
+
+A :class:`RemoteFetcher` downloads sources concurrently over pooled keep-alive connections and
+keeps a local copy of each with its ``ETag`` / ``Last-Modified`` validators, so that an unchanged
+source costs a single conditional GET answered with ``304 Not Modified``. Each fetch revalidates
+the local copy, so a fetcher kept by a resident process (e.g. a merge service or a watcher) picks
+up a source changed on its server; a URL repeated within a ``fetch_all`` is requested once. If the
+server of a source fetched before cannot be reached, e.g. offline, the local copy is used and
+listed in ``RemoteFetcher.offline``, so the merge reports a warning rather than an error.
+
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+try:
+    import httplib
+    from urlparse import urlsplit, urljoin
+except ImportError:
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin
+
+REMOTE_CACHE_DIR = os.environ.get('IDP_MDF_MERGE_REMOTE_CACHE',
+                                  os.path.join(os.path.expanduser('~'), '.idp_mdf_merge', 'remote'))
+REMOTE_TIMEOUT = 30
+REMOTE_WORKERS = 8
+
+_MAX_REDIRECTS = 5
+
+
+def is_url(filename):
+    """Returns True if ``filename`` is an ``http://`` or ``https://`` URL with a host."""
+    return (filename.startswith('http://') or filename.startswith('https://')) and urlsplit(filename).netloc != ''
+
+
+class RemoteError(Exception):
+    """Raised when a remote source cannot be fetched."""
+    pass
+
+
+class _ConnectionPool(object):
+    """Thread-safe pool of idle keep-alive connections by (scheme, host:port)."""
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+            self.opened += 1
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def release(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+class RemoteFetcher(object):
+    """
+    Concurrent fetcher of remote sources with a revalidating local cache.
+
+    :param directory: (string) location of the local copies and their validators
+    :param workers: (int) maximum number of concurrent requests
+    :param timeout: (int) connection timeout in seconds
+
+    Attributes:
+
+        * ``requests`` - (int) number of HTTP requests sent
+        * ``not_modified`` - (int) number of ``304 Not Modified`` responses
+        * ``offline`` - (dict) reason the server could not be reached by URL of each source whose
+          local copy was used instead
+
+    """
+    def __init__(self, directory=REMOTE_CACHE_DIR, workers=REMOTE_WORKERS, timeout=REMOTE_TIMEOUT):
+        self.directory = directory
+        self.workers = workers
+        self.requests = 0
+        self.not_modified = 0
+        self.offline = {}
+        self._pool = _ConnectionPool(timeout)
+        self._lock = threading.Lock()
+
+    @property
+    def connections(self):
+        """(int) number of connections opened."""
+        return self._pool.opened
+
+    def close(self):
+        """Closes the idle pooled connections."""
+        self._pool.close()
+
+    def local_path(self, url):
+        """Returns the path of the local copy of ``url``, whether or not it exists yet."""
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.idpmsg')
+
+    def fetch(self, url):
+        """
+        Returns the path of an up-to-date local copy of ``url``, or of the local copy fetched before
+        if the server cannot be reached. The local copy is revalidated on each call.
+
+        :raises RemoteError: if the source cannot be fetched and there is no local copy
+
+        """
+        return self._fetch(url)
+
+    def fetch_all(self, urls):
+        """
+        Fetches URLs concurrently.
+
+        :param urls: (list of string) URLs to fetch
+        :return: (tuple) ``(paths, errors)`` dicts of local path and of failure reason by URL
+
+        """
+        pending = []
+        for url in urls:
+            if url not in pending:
+                pending.append(url)
+        if len(pending) > 1 and self.workers > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(processes=min(self.workers, len(pending)))
+            try:
+                results = pool.map(self._try_fetch, pending)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self._try_fetch(url) for url in pending]
+        paths = {}
+        errors = {}
+        for url, (path, error) in zip(pending, results):
+            if error is None:
+                paths[url] = path
+            else:
+                errors[url] = error
+        return paths, errors
+
+    def exists(self, url):
+        """Returns True if ``url`` can be fetched, fetching it."""
+        return self._try_fetch(url)[1] is None
+
+    def _try_fetch(self, url):
+        try:
+            return self.fetch(url), None
+        except RemoteError as e:
+            return None, str(e)
+
+    def _fetch(self, url):
+        path = self.local_path(url)
+        meta_path = path + '.json'
+        validators = {}
+        cached = os.path.isfile(path) and os.path.isfile(meta_path)
+        if cached:
+            try:
+                with open(meta_path) as f:
+                    validators = json.load(f)
+            except ValueError:
+                validators = {}
+        headers = {'Accept-Encoding': 'identity'}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        location = url
+        try:
+            for _ in range(_MAX_REDIRECTS + 1):
+                status, response_headers, body = self._request(location, headers)
+                if status in (301, 302, 303, 307, 308) and response_headers.get('location'):
+                    location = urljoin(location, response_headers['location'])
+                    continue
+                break
+        except RemoteError as e:
+            if not cached:
+                raise
+            with self._lock:
+                self.offline[url] = str(e)
+            return path
+        with self._lock:
+            self.offline.pop(url, None)
+        if status == 304 and os.path.isfile(path):
+            with self._lock:
+                self.not_modified += 1
+            return path
+        if status != 200:
+            raise RemoteError("HTTP {status} fetching {url}".format(status=status, url=url))
+        self._store(path, body, {
+            'url': url,
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified'),
+        })
+        return path
+
+    def _request(self, url, headers):
+        """
+        Sends a GET on a pooled connection, retrying once if a kept-alive connection dropped.
+
+        :raises RemoteError: if the server cannot be reached or the connection fails, e.g. times out
+
+        """
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        for attempt in (1, 2):
+            connection = self._pool.acquire(parts.scheme, parts.netloc)
+            try:
+                with self._lock:
+                    self.requests += 1
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, IOError, OSError) as e:
+                connection.close()
+                if attempt == 2:
+                    raise RemoteError("{error} fetching {url}".format(error=e, url=url))
+                continue
+            response_headers = dict((key.lower(), value) for key, value in response.getheaders())
+            if response_headers.get('connection', '').lower() == 'close' or response.version < 11:
+                connection.close()
+            else:
+                self._pool.release(parts.scheme, parts.netloc, connection)
+            return response.status, response_headers, body
+
+    def _store(self, path, body, validators):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise RemoteError("Cannot create remote cache {dir}".format(dir=self.directory))
+        for filename, data, mode in ((path, body, 'wb'), (path + '.json', json.dumps(validators), 'w')):
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, mode) as f:
+                    f.write(data)
+                if os.path.exists(filename):
+                    os.remove(filename)
+                os.rename(tmp, filename)
+            except (IOError, OSError) as e:
+                if tmp is not None:
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+                raise RemoteError("Cannot write remote cache {dir}: {error}".format(dir=self.directory, error=e))
+
+
+_default_fetcher = None
+
+
+def default_fetcher():
+    """Returns the RemoteFetcher shared within this process."""
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = RemoteFetcher()
+    return _default_fetcher
@@ -0,0 +1,322 @@
+"""
+Replay of recorded message logs through merged message definitions.
+
+A log has one recorded message per line: its SIN, MIN and payload in hexadecimal as sent by the
+gateway, i.e. starting with the SIN and MIN, separated by commas or whitespace::
+
+    128,1,80010a0b0c
+    128 2 8002ff
+
+Blank lines and lines starting with ``#`` are skipped. :func:`replay_log` reads a log in chunks of
+``chunk_lines`` lines and decodes each chunk with a :class:`ReplayDecoder`, in a process pool if
+``workers`` is more than 1. Each worker loads the definitions once, from the binary export of
+:mod:`~idp_mdf_merge.binary` if it is up to date with the merged file, compiling the plan of each
+message on first use. At most two chunks per worker are read ahead of the chunk being written, so
+memory use does not grow with the size of the log.
+
+Each record replayed may be written as a line of JSON, in the order of the log::
+
+    {"line": 1, "sin": 128, "min": 1, "fields": {"speed": 10, "data": "0b0c"}}
+    {"line": 2, "sin": 128, "min": 2, "error": "Payload too short"}
+
+Data fields are written in hexadecimal. The number of records decoded and failed by SIN and MIN is
+kept in the :class:`ReplayReport`, and :meth:`ReplayReport.write_counts` writes them as lines of
+JSON::
+
+    {"sin": 128, "min": 1, "decoded": 9812, "failed": 0}
+
+"""
+
+import os
+import sys
+import json
+import itertools
+from binascii import hexlify, unhexlify, Error as HexError
+from collections import deque
+try:
+    from . import idp_mdf_merge as core
+    from .binary import BinaryDefinitions, binary_path, read_source
+    from .codec import Codec, CodecError
+    from .registry import RETURN
+except (ImportError, ValueError):
+    import idp_mdf_merge as core
+    from binary import BinaryDefinitions, binary_path, read_source
+    from codec import Codec, CodecError
+    from registry import RETURN
+
+# Lines of a log decoded per chunk
+REPLAY_CHUNK = 5000
+
+
+def _jsonable(value):
+    """Returns a decoded value with any Data field in hexadecimal."""
+    if isinstance(value, dict):
+        return dict((name, _jsonable(item)) for name, item in value.items())
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, bytes):
+        return hexlify(value).decode('ascii')
+    return value
+
+
+def parse_line(line):
+    """
+    Parses a line of a log.
+
+    :param line: (bytes) the line
+    :return: (tuple) ``(sin, min, payload)``, or None if blank or a comment
+    :raises ValueError: if the line is not a SIN, MIN and hexadecimal payload
+
+    """
+    parts = line.replace(b',', b' ').split()
+    if len(parts) == 0 or parts[0].startswith(b'#'):
+        return None
+    if len(parts) != 3:
+        raise ValueError("Expected SIN, MIN and payload")
+    if not (parts[0].isdigit() and parts[1].isdigit()):
+        raise ValueError("SIN and MIN are not integers")
+    try:
+        return int(parts[0]), int(parts[1]), unhexlify(parts[2])
+    except (TypeError, HexError):
+        raise ValueError("Payload is not hexadecimal")
+
+
+class ReplayDecoder(object):
+    """
+    Decoder of the lines of a log, compiling the plan of each message on first use.
+
+    :param definitions: (string) path/filename of a merged message definition file, or of its
+       binary export ``.idpbin``
+    :param direction: ``RETURN`` (default) or ``FORWARD`` messages are replayed
+
+    """
+    def __init__(self, definitions, direction=RETURN):
+        self.direction = direction
+        self._binary = None
+        self._codec = None
+        self._plans = {}
+        exported = definitions if definitions.endswith('.idpbin') else binary_path(definitions)
+        if exported == definitions or read_source(exported) == core.target_stamp(definitions):
+            self._binary = BinaryDefinitions(exported)
+        else:
+            self._codec = Codec.from_file(definitions)
+
+    def close(self):
+        if self._binary is not None:
+            self._binary.close()
+
+    def plan(self, sin, min):
+        """
+        Returns the compiled plan of a message.
+
+        :raises CodecError: if the message is not defined or could not be compiled
+
+        """
+        key = (sin, min)
+        plan = self._plans.get(key)
+        if plan is None:
+            try:
+                if self._codec is not None:
+                    plan = self._codec.plan(sin, min, self.direction)
+                else:
+                    plan = self._binary.plan(sin, min, self.direction)
+                    if plan is None:
+                        raise CodecError("not defined")
+            except CodecError as e:
+                plan = e if self._codec is not None else CodecError(
+                    "Message SIN {sin} MIN {min} {direction}: {reason}".format(sin=sin, min=min,
+                                                                               direction=self.direction, reason=e))
+            self._plans[key] = plan
+        if isinstance(plan, CodecError):
+            raise plan
+        return plan
+
+    def decode(self, sin, min, payload):
+        """
+        Decodes a recorded payload.
+
+        :return: (dict) field values by name
+        :raises CodecError: if the message is unknown or the payload is invalid
+
+        """
+        header = bytearray(payload[:2])
+        if len(header) < 2 or header[0] != sin or header[1] != min:
+            raise CodecError("Payload does not start with SIN {sin} MIN {min}".format(sin=sin, min=min))
+        return self.plan(sin, min).decode(payload)
+
+    def decode_lines(self, first, lines, records=True):
+        """
+        Decodes the lines of a chunk of a log.
+
+        :param first: (int) line number of the first line
+        :param lines: (list of bytes) the lines
+        :param records: (Boolean) flag to return the record of each line
+        :return: (tuple) ``(counts, malformed, text)``: (dict) ``[decoded, failed]`` by
+           ``(sin, min)``, (int) lines that are not a recorded message, and (string) a line of
+           JSON per record, or None if not ``records``
+
+        """
+        counts = {}
+        malformed = 0
+        out = [] if records else None
+        for number, line in enumerate(lines, first):
+            try:
+                parsed = parse_line(line)
+            except ValueError as e:
+                malformed += 1
+                if records:
+                    out.append(json.dumps({'line': number, 'error': str(e)}))
+                continue
+            if parsed is None:
+                continue
+            sin, min, payload = parsed
+            count = counts.get((sin, min))
+            if count is None:
+                count = counts[(sin, min)] = [0, 0]
+            try:
+                values = self.decode(sin, min, payload)
+            except CodecError as e:
+                count[1] += 1
+                if records:
+                    out.append(json.dumps({'line': number, 'sin': sin, 'min': min, 'error': str(e)}))
+                continue
+            count[0] += 1
+            if records:
+                out.append(json.dumps({'line': number, 'sin': sin, 'min': min, 'fields': _jsonable(values)}))
+        return counts, malformed, ''.join(record + '\n' for record in out) if records else None
+
+
+class ReplayReport(object):
+    """
+    Outcome of a replay.
+
+    Attributes:
+
+        * ``counts`` - (dict) ``[decoded, failed]`` by ``(sin, min)``
+        * ``decoded``, ``failed`` - (int) records decoded and failed
+        * ``malformed`` - (int) lines that are not a recorded message
+
+    """
+    def __init__(self):
+        self.counts = {}
+        self.decoded = 0
+        self.failed = 0
+        self.malformed = 0
+
+    def add(self, counts, malformed):
+        """Adds the counts of a chunk, as returned by ``ReplayDecoder.decode_lines``."""
+        for key, (decoded, failed) in counts.items():
+            count = self.counts.get(key)
+            if count is None:
+                count = self.counts[key] = [0, 0]
+            count[0] += decoded
+            count[1] += failed
+            self.decoded += decoded
+            self.failed += failed
+        self.malformed += malformed
+
+    def write_counts(self, out):
+        """Writes a line of JSON with the counts of each SIN and MIN, in ascending order, to a text file."""
+        for sin, min in sorted(self.counts):
+            decoded, failed = self.counts[sin, min]
+            out.write(json.dumps({'sin': sin, 'min': min, 'decoded': decoded, 'failed': failed}) + '\n')
+
+
+# Decoder of a worker process loaded once by _init_worker, or the error loading it
+_decoder = None
+
+
+def _init_worker(definitions, direction):
+    """
+    Loads the decoder of a worker process, keeping any error loading it for ``_decode_chunk`` to
+    raise, as a pool replaces a worker whose initializer raises without failing any task.
+
+    """
+    global _decoder
+    try:
+        _decoder = ReplayDecoder(definitions, direction)
+    except (SyntaxError, ValueError, EnvironmentError) as e:
+        _decoder = e
+
+
+def _decode_chunk(args):
+    """Process pool worker decoding ``(first, lines, records)`` with the decoder of the worker."""
+    if isinstance(_decoder, Exception):
+        raise _decoder
+    return _decoder.decode_lines(*args)
+
+
+def _iter_chunks(f, chunk_lines):
+    """Yields ``(first, lines)`` of each chunk of ``chunk_lines`` lines of a file, numbering lines from 1."""
+    first = 1
+    while True:
+        lines = list(itertools.islice(f, chunk_lines))
+        if len(lines) == 0:
+            return
+        yield first, lines
+        first += len(lines)
+
+
+def replay_log(log, definitions, output=None, workers=None, chunk_lines=REPLAY_CHUNK, direction=RETURN):
+    """
+    Decodes each recorded message of a log with merged message definitions.
+
+    :param log: (string) path/filename of the log
+    :param definitions: (string) path/filename of a merged message definition file, or of its
+       binary export ``.idpbin``
+    :param output: (string) path/filename to which the record of each line is written as a line
+       of JSON, ``-`` for the standard output, or None not to write records
+    :param workers: (int) number of worker processes decoding chunks, or None to decode serially
+    :param chunk_lines: (int) lines of the log per chunk
+    :param direction: ``RETURN`` (default) or ``FORWARD`` messages are replayed
+    :return: (ReplayReport)
+    :raises IOError: if the log cannot be read or the output written
+    :raises SyntaxError: if the definitions cannot be parsed
+
+    """
+    report = ReplayReport()
+    records = output is not None
+    out = None
+    if output == '-':
+        out = sys.stdout
+    elif records:
+        out = open(output, 'w')
+    try:
+        with open(log, 'rb') as f:
+            chunks = _iter_chunks(f, chunk_lines)
+            if workers is not None and workers > 1 and os.path.getsize(log) > 0:
+                import multiprocessing
+                # Loaded up front so that definitions that cannot be loaded fail before any worker
+                ReplayDecoder(definitions, direction).close()
+                pool = multiprocessing.Pool(processes=workers, initializer=_init_worker,
+                                            initargs=(definitions, direction))
+                pending = deque()
+                try:
+                    for first, lines in chunks:
+                        pending.append(pool.apply_async(_decode_chunk, ((first, lines, records),)))
+                        while len(pending) > 2 * workers or (pending and pending[0].ready()):
+                            _add_chunk(report, pending.popleft().get(), out)
+                    while pending:
+                        _add_chunk(report, pending.popleft().get(), out)
+                    pool.close()
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                decoder = ReplayDecoder(definitions, direction)
+                try:
+                    for first, lines in chunks:
+                        _add_chunk(report, decoder.decode_lines(first, lines, records), out)
+                finally:
+                    decoder.close()
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    return report
+
+
+def _add_chunk(report, decoded, out):
+    counts, malformed, text = decoded
+    report.add(counts, malformed)
+    if out is not None:
+        out.write(text)
@@ -0,0 +1,390 @@
+"""
+Local HTTP merge service.
+
+A :class:`MergeService` answers merge requests over HTTP from an asyncio event loop, so that tools
+needing merged definitions on demand do not pay for starting an interpreter, importing Tk and
+parsing every source file for each merge. The serialized Services of each source file are kept
+in a least recently used cache of ``max_sources`` files, validated by the size and modification
+time of the file. A source file not cached is parsed in an executor, worker processes if
+``workers`` is more than 1 and otherwise a thread, so that the event loop keeps answering other
+requests. A source file needed by several merges at once is parsed once, and identical merge
+requests received while one is in progress share its result. Requires Python 3.7 or later.
+
+A merge is requested with the source files and options of a bundle (see
+:mod:`~idp_mdf_merge.bundle`), all but ``files`` being optional::
+
+    POST /merge
+    {"files": ["/path/to/fleet.idpmsg"], "modem": true, "lsf": false, "meta": false}
+
+and answered with the merged document and the diagnostics of the merge as JSON::
+
+    {"xml": "<?xml version='1.0' encoding='utf-8'?>...", "error": "WARNING: ...",
+     "exceptions": ["WARNING: ..."], "services": 24, "parsed": 1, "resident": 2, "shared": false,
+     "elapsed": 0.012}
+
+where ``xml`` is null if no Services were merged, ``error`` is the description ``merge_mdf``
+returns, with at most ``MAX_REPEATS`` repeats of a warning as in its error log, ``exceptions``
+those diagnostics, ``parsed`` and ``resident`` count the source files parsed and taken from the cache, and
+``shared`` is true if the result is that of an identical request. ``GET /stats`` returns the
+counters of the service.
+
+"""
+
+import json
+import time
+import asyncio
+from collections import OrderedDict
+try:
+    from . import idp_mdf_merge as core
+    from .writer import build_document
+    from .validate import ErrorLog
+except (ImportError, ValueError):
+    import idp_mdf_merge as core
+    from writer import build_document
+    from validate import ErrorLog
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8640
+SERVICE_MAX_SOURCES = 64
+SERVICE_MAX_BODY = 1024 * 1024
+
+REQUEST_OPTIONS = ('files', 'modem', 'lsf', 'meta')
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class RequestError(Exception):
+    """Raised when an HTTP request cannot be served, with the status of the response."""
+    def __init__(self, status, reason):
+        super(RequestError, self).__init__(reason)
+        self.status = status
+
+
+def request_files(options):
+    """
+    Returns the source files of a merge request.
+
+    :param options: (dict) the request, with ``files`` and optional ``modem`` and ``lsf``
+    :return: (list of string) source files/paths or URLs, in merge order
+    :raises RequestError: if the request is not valid
+
+    """
+    if not isinstance(options, dict):
+        raise RequestError(400, "request is not a JSON object")
+    unknown = sorted(set(options) - set(REQUEST_OPTIONS))
+    if len(unknown) > 0:
+        raise RequestError(400, "unknown option(s) {options}".format(options=', '.join(unknown)))
+    files = options.get('files') or []
+    if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+        raise RequestError(400, "files are not a list of strings")
+    files = list(files)
+    if options.get('modem'):
+        files.append(core.CORE_MODEM_PATH + core.CORE_MODEM_FILE)
+    if options.get('lsf'):
+        files.append(core.LSF_CORE_PATH + core.LSF_CORE_AGENTS_FILE)
+    if len(files) == 0:
+        raise RequestError(400, "no files")
+    return files
+
+
+def _load_source(args):
+    """
+    Executor worker wrapping ``serialize_file`` that raises parse errors as a ``SyntaxError``,
+    as the parse errors of lxml cannot be pickled back from a worker process.
+
+    """
+    try:
+        return core.serialize_file(*args)
+    except SyntaxError as e:
+        raise SyntaxError(str(e))
+
+
+def _response(status, body, keep_alive):
+    """Returns (bytes) an HTTP response with a JSON body."""
+    data = json.dumps(body).encode('utf-8')
+    head = 'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {length}\r\n' \
+           'Connection: {connection}\r\n\r\n'.format(status=status, reason=_REASONS[status], length=len(data),
+                                                     connection='keep-alive' if keep_alive else 'close')
+    return head.encode('latin-1') + data
+
+
+class MergeService(object):
+    """
+    Merges message definition files on request, keeping parsed source files resident.
+
+    :param max_sources: (int) number of source files whose Services are kept in memory
+    :param workers: (int) number of worker processes parsing source files, or None to parse them
+       in a thread
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param fetcher: (RemoteFetcher) used to fetch any URLs, or None to use the default fetcher
+
+    Attributes:
+
+        * ``requests`` - (int) merge requests received
+        * ``merges`` - (int) merges run, the other requests sharing the result of an identical request
+        * ``parses`` - (int) source files parsed
+        * ``hits`` - (int) source files taken from the cache
+
+    """
+    def __init__(self, max_sources=SERVICE_MAX_SOURCES, workers=None, backend=None, fetcher=None):
+        self.max_sources = max_sources
+        self.workers = workers
+        self.backend = core.get_backend(backend)
+        self.fetcher = fetcher
+        self.requests = 0
+        self.merges = 0
+        self.parses = 0
+        self.hits = 0
+        self._sources = OrderedDict()
+        self._loading = {}
+        self._merging = {}
+        self._pipelines = {}
+        self._executor = None
+
+    def stats(self):
+        """Returns (dict) the counters of the service and the number of source files cached."""
+        return {
+            'requests': self.requests,
+            'merges': self.merges,
+            'parses': self.parses,
+            'hits': self.hits,
+            'sources': len(self._sources),
+        }
+
+    def close(self):
+        """Stops the executor parsing source files."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers is not None and self.workers > 1:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # workers forked from the event loop would inherit the sockets of its connections
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    def _pipeline(self, meta):
+        pipeline = self._pipelines.get(meta)
+        if pipeline is None:
+            pipeline = self._pipelines[meta] = core.default_pipeline(meta)
+        return pipeline
+
+    async def _load(self, path, pipeline):
+        """
+        Returns the serialized Services of a source file, parsing it unless cached and unchanged.
+
+        :return: (tuple) ``(serialized, resident)`` with serialized as returned by
+           ``serialize_file``, and resident True if taken from the cache
+
+        """
+        key = (path, pipeline.signature)
+        stamp = core.target_stamp(path)
+        entry = self._sources.get(key)
+        if entry is not None and entry[0] == stamp:
+            self._sources.move_to_end(key)
+            self.hits += 1
+            return entry[1], True
+        loading = self._loading.get(key + (stamp,))
+        if loading is not None:
+            return await asyncio.shield(loading), False
+        loading = asyncio.get_running_loop().run_in_executor(self._get_executor(), _load_source,
+                                                             (path, pipeline, self.backend))
+        self._loading[key + (stamp,)] = loading
+        self.parses += 1
+        try:
+            serialized = await asyncio.shield(loading)
+        finally:
+            del self._loading[key + (stamp,)]
+        self._sources[key] = (stamp, serialized)
+        self._sources.move_to_end(key)
+        while len(self._sources) > self.max_sources:
+            self._sources.popitem(last=False)
+        return serialized, False
+
+    async def merge(self, files, meta=False):
+        """
+        Merges message definition files, sharing the result of an identical merge in progress.
+
+        :param files: (list of string) with each full path/filename or URL to merge
+        :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+        :return: (dict) the merged document and diagnostics, as answered to ``POST /merge``
+
+        """
+        self.requests += 1
+        key = (tuple(files), bool(meta))
+        merging = self._merging.get(key)
+        if merging is not None:
+            result = dict(await asyncio.shield(merging))
+            result['shared'] = True
+            return result
+        merging = asyncio.ensure_future(self._merge(list(files), bool(meta)))
+        self._merging[key] = merging
+        merging.add_done_callback(lambda future: self._merging.pop(key, None))
+        return await asyncio.shield(merging)
+
+    async def _merge(self, files, meta):
+        start = time.time()
+        self.merges += 1
+        exceptions = ErrorLog(None)
+        if len(files) == 1 and meta:
+            exceptions.append("WARNING: not merging files only applying metadata tags to single file.")
+        pipeline = self._pipeline(meta)
+        local = {}
+        if any('http://' in f or 'https://' in f for f in files):
+            local = await asyncio.get_running_loop().run_in_executor(None, core.fetch_sources, files, self.fetcher,
+                                                                     exceptions)
+        pending = []
+        checked = core.local_paths(files, local, pending)
+        results = await asyncio.gather(*[self._load(path, pipeline) for f, path in checked], return_exceptions=True)
+        loaded = []
+        for (f, path), result in zip(checked, results):
+            # the parse errors of ElementTree and lxml are both SyntaxErrors
+            if isinstance(result, (SyntaxError, ValueError)):
+                exceptions.append("ERROR: Invalid Message Definition File {file}: {reason}".format(file=f,
+                                                                                                   reason=result))
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                loaded.append((f, result[0]))
+        services = {}
+        namespaces = {}
+        if len(loaded) == len(checked):
+            services, namespaces = core.resolve_services(loaded, exceptions)
+        exceptions.extend(pending)
+        xml = None
+        if len(services) > 0:
+            xml = build_document(core.root_declarations(namespaces), [services[sin] for sin in sorted(services)])
+        else:
+            exceptions.append("ERROR: No Services found in source file set.")
+        exceptions.close()
+        resident = sum(1 for result in results if isinstance(result, tuple) and result[1])
+        return {
+            'xml': xml.decode('utf-8') if xml is not None else None,
+            'error': exceptions.text if len(exceptions) > 0 else None,
+            'exceptions': exceptions.lines,
+            'services': len(services),
+            'parsed': len(checked) - resident,
+            'resident': resident,
+            'shared': False,
+            'elapsed': time.time() - start,
+        }
+
+    async def _respond(self, head, reader):
+        """
+        Serves one HTTP request.
+
+        :param head: (bytes) the request line and headers
+        :param reader: (asyncio.StreamReader) positioned at the body of the request
+        :return: (tuple) ``(status, body, keep_alive)``
+
+        """
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, version = lines[0].split()
+        except ValueError:
+            return 400, {'error': "invalid request line"}, False
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400, {'error': "invalid Content-Length"}, False
+        if length > SERVICE_MAX_BODY:
+            return 413, {'error': "request larger than {max} bytes".format(max=SERVICE_MAX_BODY)}, False
+        body = await reader.readexactly(length) if length > 0 else b''
+        try:
+            if path == '/stats':
+                if method != 'GET':
+                    raise RequestError(405, "use GET")
+                return 200, self.stats(), keep_alive
+            if path != '/merge':
+                raise RequestError(404, "unknown path {path}".format(path=path))
+            if method != 'POST':
+                raise RequestError(405, "use POST")
+            try:
+                options = json.loads(body.decode('utf-8'))
+            except ValueError as e:
+                raise RequestError(400, "invalid JSON: {reason}".format(reason=e))
+            files = request_files(options)
+            return 200, await self.merge(files, meta=bool(options.get('meta'))), keep_alive
+        except RequestError as e:
+            return e.status, {'error': str(e)}, keep_alive
+        except Exception as e:
+            return 500, {'error': "{type}: {reason}".format(type=type(e).__name__, reason=e)}, keep_alive
+
+    async def handle(self, reader, writer):
+        """Serves the HTTP requests of a connection until the client or the service closes it."""
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                status, body, keep_alive = await self._respond(head, reader)
+                writer.write(_response(status, body, keep_alive))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """
+        Starts accepting connections.
+
+        :param host: (string) address to listen on
+        :param port: (int) port to listen on, or 0 for any free port
+        :return: (asyncio.Server) the server, e.g. to read the port from its ``sockets``
+
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, max_sources=SERVICE_MAX_SOURCES, workers=None, backend=None,
+          callback=None):
+    """
+    Runs a merge service until interrupted.
+
+    :param host: (string) address to listen on
+    :param port: (int) port to listen on
+    :param max_sources: (int) number of source files whose Services are kept in memory
+    :param workers: (int) number of worker processes parsing source files, or None to parse them in a thread
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param callback: (function) called with the address ``(host, port)`` once listening, or None
+
+    """
+    service = MergeService(max_sources=max_sources, workers=workers, backend=backend)
+    loop = asyncio.new_event_loop()
+    try:
+        server = loop.run_until_complete(service.start(host, port))
+        if callback is not None:
+            callback(server.sockets[0].getsockname()[:2])
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+    finally:
+        service.close()
+        loop.close()
@@ -0,0 +1,250 @@
+"""
+Merge split into shards: merged files each within a budget of bytes and/or Services.
+
+The message gateway limits the size of a message definition upload, so a large merge may have to
+be uploaded as several files. :func:`merge_shards` merges the source files as ``merge_mdf`` does,
+with the same duplicate resolution and error log, then partitions the merged Services between
+shards with :func:`pack` and writes the shards in a thread pool if ``workers`` is more than 1.
+
+:func:`pack` is a first fit decreasing bin packing of the serialized size of each Service: the
+largest Service is placed first, each in the first shard with room for it. A shard is sized
+exactly as written, including the XML declaration, root element and namespace declarations. A
+Service larger than the byte budget on its own is written to a shard of its own with a warning.
+Shards are numbered in ascending order of their lowest SIN, and the Services of each shard are
+written in ascending order of SIN.
+
+The shards of target ``merged.idpmsg`` are ``merged_1.idpmsg``, ``merged_2.idpmsg``... next to
+the manifest ``merged_SHARDS.json`` listing the SINs and size of each shard and the shard of each
+SIN::
+
+    {
+      "version": 1,
+      "shards": [{"file": "merged_1.idpmsg", "bytes": 9841, "sins": [0, 16, 17]}, ...],
+      "sins": {"0": "merged_1.idpmsg", "16": "merged_1.idpmsg", ...}
+    }
+
+Shards listed by the manifest of a previous split of the same target that are not written again
+are removed.
+
+"""
+
+import os
+import json
+try:
+    from . import idp_mdf_merge as core
+    from .writer import SEPARATOR, document_size, replace_file
+except (ImportError, ValueError):
+    import idp_mdf_merge as core
+    from writer import SEPARATOR, document_size, replace_file
+
+# Bump when the format of the shard manifest changes
+SHARDS_VERSION = 1
+
+
+class Shard(object):
+    """
+    A merged file holding part of the Services of a merge.
+
+    :param filename: (string) path/filename of the shard
+    :param sins: (list of int) SINs of the Services of the shard, in ascending order
+    :param size: (int) bytes of the shard
+
+    """
+    __slots__ = ('filename', 'sins', 'size')
+
+    def __init__(self, filename, sins, size):
+        self.filename = filename
+        self.sins = sins
+        self.size = size
+
+    def __repr__(self):
+        return 'Shard({!r}, {!r}, {!r})'.format(self.filename, self.sins, self.size)
+
+
+def pack(weights, capacity=None, max_items=None):
+    """
+    Packs items into bins by first fit decreasing.
+
+    :param weights: (dict) weight of each item, e.g. bytes by SIN
+    :param capacity: (int) largest total weight of a bin, or None for no limit
+    :param max_items: (int) largest number of items of a bin, or None for no limit
+    :return: (list of list) the items of each bin, in decreasing order of weight; an item heavier
+       than ``capacity`` is alone in its bin
+
+    """
+    bins = []
+    # [load, items] of the bins that may still take an item, in the order they were opened
+    open_bins = []
+    lightest = min(weights.values()) if len(weights) > 0 else 0
+    for item in sorted(weights, key=lambda item: (-weights[item], item)):
+        weight = weights[item]
+        for entry in open_bins:
+            if capacity is None or entry[0] + weight <= capacity:
+                break
+        else:
+            entry = [0, []]
+            bins.append(entry[1])
+            open_bins.append(entry)
+        entry[0] += weight
+        entry[1].append(item)
+        if ((capacity is not None and entry[0] + lightest > capacity) or
+                (max_items is not None and len(entry[1]) >= max_items)):
+            open_bins.remove(entry)
+    return bins
+
+
+def shard_paths(target):
+    """
+    Returns the files written by a split of a merge to ``target``.
+
+    :param target: (string) target path/filename of the merge
+    :return: (tuple) ``(pattern, manifest_filename)``: the path/filename of shard ``n`` as
+       ``pattern.format(n)``, and the shard manifest
+
+    """
+    target = core.output_paths(target)[0]
+    base_filename = os.path.splitext(target)[0]
+    return base_filename.replace('{', '{{').replace('}', '}}') + '_{}.idpmsg', base_filename + '_SHARDS.json'
+
+
+def _read_shard_files(manifest_filename):
+    """Returns (list of string) the shard files listed by a shard manifest, or none if unreadable."""
+    try:
+        with open(manifest_filename) as f:
+            manifest = json.load(f)
+        return [entry['file'] for entry in manifest['shards']]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def _write_manifest(manifest_filename, shards):
+    """Replaces the shard manifest once complete."""
+    manifest = {
+        'version': SHARDS_VERSION,
+        'shards': [{'file': os.path.basename(shard.filename), 'bytes': shard.size, 'sins': shard.sins}
+                   for shard in shards],
+        'sins': dict((str(sin), os.path.basename(shard.filename)) for shard in shards for sin in shard.sins),
+    }
+    tmp = '{target}.{pid}.tmp'.format(target=manifest_filename, pid=os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        replace_file(tmp, manifest_filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def split_services(services, namespaces, target, max_bytes=None, max_services=None, exceptions=None,
+                   workers=None):
+    """
+    Writes serialized Services to shards within a budget, and the shard manifest.
+
+    :param services: (dict) serialized Service by SIN
+    :param namespaces: (dict) ``{prefix: uri}`` used by the Services, declared on every shard
+    :param target: (string) target path/filename of the merge, naming the shards and manifest
+    :param max_bytes: (int) largest size of a shard, or None for no limit
+    :param max_services: (int) largest number of Services of a shard, or None for no limit
+    :param exceptions: (list of string) to which a warning of each Service larger than
+       ``max_bytes`` is appended, or None
+    :param workers: (int) number of threads writing shards, or None to write them serially
+    :return: (list of Shard) in order of their lowest SIN
+
+    """
+    declarations = core.root_declarations(namespaces)
+    # each Service is charged the separator written before it, which the first Service has not
+    weights = dict((sin, len(xml) + len(SEPARATOR)) for sin, xml in services.items())
+    capacity = None
+    if max_bytes is not None:
+        capacity = max_bytes - document_size(declarations, []) + len(SEPARATOR)
+        if exceptions is not None:
+            for sin in sorted(sin for sin, weight in weights.items() if weight > capacity):
+                exceptions.append("WARNING: SIN {sin} ({size} bytes) exceeds the shard size "
+                                  "{limit} bytes".format(sin=sin, size=len(services[sin]), limit=max_bytes))
+    pattern, manifest_filename = shard_paths(target)
+    shards = []
+    for n, sins in enumerate(sorted(sorted(sins) for sins in pack(weights, capacity, max_services)), 1):
+        shards.append(Shard(pattern.format(n), sins, document_size(declarations, [len(services[sin])
+                                                                                   for sin in sins])))
+
+    def write(shard):
+        core.write_services(shard.filename, (services[sin] for sin in shard.sins), namespaces)
+
+    if workers is not None and workers > 1 and len(shards) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(processes=min(workers, len(shards)))
+        try:
+            pool.map(write, shards)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for shard in shards:
+            write(shard)
+    directory = os.path.dirname(os.path.abspath(manifest_filename))
+    written = set(os.path.basename(shard.filename) for shard in shards)
+    for name in _read_shard_files(manifest_filename):
+        path = os.path.join(directory, os.path.basename(name))
+        if os.path.basename(name) not in written and os.path.isfile(path):
+            os.remove(path)
+    _write_manifest(manifest_filename, shards)
+    return shards
+
+
+def merge_shards(files, target, max_bytes=None, max_services=None, meta=False, workers=None, fetcher=None,
+                 pipeline=None, backend=None, conflicts=core.FIRST, validate=False):
+    """
+    Merges message definition files into shards within a budget of bytes and/or Services.
+
+    :param files: (list of string) with each full path/filename or URL to merge
+    :param target: (string) target path/filename of the merge, naming the shards, manifest and
+       error log
+    :param max_bytes: (int) largest size of a shard, or None for no limit
+    :param max_services: (int) largest number of Services of a shard, or None for no limit
+    :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+    :param workers: (int) number of worker processes used to parse the files and of threads used
+       to write the shards, or None to do both serially
+    :param fetcher: (RemoteFetcher) used to fetch any URLs concurrently, or None to use the default
+       fetcher
+    :param pipeline: (Pipeline) transform pipeline applied to each Service in place of
+       ``default_pipeline(meta)``
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param conflicts: policy resolving a SIN found in more than one Service, one of
+       ``CONFLICT_POLICIES``, as for ``merge_mdf``
+    :param validate: (Boolean) flag to validate each Service, as for ``merge_mdf``
+    :return: (tuple) ``(shards, error)``: (list of Shard) written, and (string) error description
+       if error, or None if successful
+
+    """
+    if files is None:
+        return [], "No files to merge."
+    if target is None:
+        return [], "No target file to output."
+    if conflicts not in core.CONFLICT_POLICIES:
+        return [], "Unknown conflict policy {conflicts}".format(conflicts=conflicts)
+    if core.backend_error(backend) is not None:
+        return [], "ERROR: {reason}".format(reason=core.backend_error(backend))
+    target, err_filename = core.output_paths(target)[:2]
+    if not core.valid_path(target.replace(os.path.basename(target), '')):
+        return [], "ERROR: Invalid target file/path {target}".format(target=target)
+    exceptions = []
+    pipeline = core.merge_pipeline(pipeline, meta, validate)
+    backend = core.get_backend(backend)
+    local = core.fetch_sources(files, fetcher, exceptions)
+    pending = []
+    checked = core.local_paths(files, local, pending)
+    loaded = list(core.serialize_files([path for f, path in checked], pipeline, backend, workers=workers))
+    services, namespaces = core.resolve_services([(f, serialized) for (f, path), (_, serialized)
+                                                  in zip(checked, loaded)], exceptions, conflicts=conflicts)
+    exceptions.extend(pending)
+    shards = []
+    if services is None:
+        core.not_written(target, exceptions)
+    elif len(services) > 0:
+        shards = split_services(services, namespaces, target, max_bytes, max_services, exceptions, workers)
+    else:
+        exceptions.append("ERROR: No Services found in source file set.")
+    if len(exceptions) > 0:
+        return shards, core.write_error_log(err_filename, exceptions)
+    return shards, None
@@ -0,0 +1,234 @@
+"""
+Encoded size bounds of messages.
+
+A :class:`SizeIndex` holds the minimum and maximum encoded size in bytes of each message of a set
+of Services by ``(sin, direction, min)``, computed from the Size of its fields with the wire
+format of :mod:`~idp_mdf_merge.codec`: the 16-bit SIN and MIN header, Size bits of an integer,
+Size characters or bytes of a String or Data, Size elements of an Array, a length prefix before
+a String, Data or Array that is not Fixed, and a presence flag before an Optional field, an
+absent Optional field taking only its flag. Dynamic, Property and Message fields take their type
+from outside the message definition, so the maximum size of a message using them is unbounded
+(None).
+
+Bounds are memoized by field layout, i.e. type, Size, Optional, Fixed and the layouts of any
+Array element fields, each layout being numbered on first use so that a key holds the numbers
+of its element layouts rather than their nested keys. Every Field is visited once, and the
+bounds of a layout repeated across messages, e.g. the same Array of the Services of each
+customer, are computed once for the whole set.
+
+:meth:`SizeIndex.exceeding` lists the messages that may exceed a size limit, e.g. of the
+satellite link::
+
+    index = SizeIndex.from_file('merged.idpmsg', cache=DefinitionCache())
+    for sin, direction, min in index.exceeding(6400):
+        ...
+
+"""
+
+try:
+    from .codec import (ENUM, BOOLEAN, UNSIGNED, SIGNED, STRING, DATA, ARRAY, MAX_LENGTH, CodecError,
+                        FIELD_TYPES, enum_size)
+    from .registry import RETURN, DIRECTIONS
+    from .model import Service, iter_load
+except (ImportError, ValueError):
+    from codec import (ENUM, BOOLEAN, UNSIGNED, SIGNED, STRING, DATA, ARRAY, MAX_LENGTH, CodecError,
+                       FIELD_TYPES, enum_size)
+    from registry import RETURN, DIRECTIONS
+    from model import Service, iter_load
+
+# Bumped when the bounds computed change, as it identifies cached indexes
+SIZES_VERSION = 2
+
+# SIN and MIN of the payload header
+HEADER_BITS = 16
+
+_INT_TYPES = (ENUM, UNSIGNED, SIGNED)
+_TYPE_NAMES = dict((ftype, name) for name, ftype in FIELD_TYPES.items())
+
+
+def _prefix_bits(length):
+    """Returns (int) bits of the length prefix of a String, Data or Array of up to ``length``."""
+    return 8 if length < 128 else 16
+
+
+def _to_bytes(bits):
+    return None if bits is None else (HEADER_BITS + bits + 7) // 8
+
+
+def message_order(key):
+    """Returns (tuple) the sort key of a ``(sin, direction, min)`` in ascending order of SIN, direction and MIN."""
+    return key[0], DIRECTIONS.index(key[1]), key[2] is None, key[2]
+
+
+def _size(field):
+    """Returns (int) the Size of a Field, derived from the Items of an Enum without one, or None."""
+    if field.size is None and field.type == ENUM:
+        return enum_size(len(field.items))
+    return field.size
+
+
+def _layout_bounds(field, size, elements):
+    """
+    Computes the bounds of a Field whose element layouts, if an Array, are known.
+
+    :param field: (Field) the model Field
+    :param size: (int) the Size of the Field as returned by ``_size``
+    :param elements: (tuple) ``(layout, min_bits, max_bits)`` of each Array element field
+    :return: (tuple) ``(min_bits, max_bits)``, ``max_bits`` being None if unbounded
+    :raises CodecError: if a Size is missing
+
+    """
+    ftype = field.type
+    if ftype == BOOLEAN:
+        low = high = 1
+    elif ftype in _INT_TYPES:
+        if size is None:
+            raise CodecError("{type} {name} has no Size".format(type=_TYPE_NAMES[ftype], name=field.name))
+        low = high = size
+    elif ftype in (STRING, DATA, ARRAY):
+        if size is None or size < 0:
+            if field.fixed:
+                raise CodecError("Fixed {type} {name} has no Size".format(type=_TYPE_NAMES[ftype],
+                                                                          name=field.name))
+            size = MAX_LENGTH
+        if ftype == ARRAY:
+            element_low = sum(element[1] for element in elements)
+            element_high = None
+            if all(element[2] is not None for element in elements):
+                element_high = sum(element[2] for element in elements)
+        else:
+            element_low = element_high = 8
+        if field.fixed:
+            low = size * element_low
+            high = None if element_high is None else size * element_high
+        else:
+            low = _prefix_bits(0)
+            high = None if element_high is None else _prefix_bits(size) + size * element_high
+    else:
+        low, high = 0, None
+    if field.optional:
+        return 1, None if high is None else high + 1
+    return low, high
+
+
+def field_bounds(field, memo):
+    """
+    Returns the encoded size bounds of a Field, memoized by layout.
+
+    :param field: (Field) the model Field
+    :param memo: (dict) bounds of the layouts seen so far, shared across calls
+    :return: (tuple) ``(layout, min_bits, max_bits)``, ``layout`` being the number of the layout
+       in ``memo`` and ``max_bits`` None if unbounded
+    :raises CodecError: if a Size is missing
+
+    """
+    size = _size(field)
+    if field.fields:
+        elements = tuple(field_bounds(child, memo) for child in field.fields)
+        key = (field.type, size, field.optional, field.fixed, tuple(element[0] for element in elements))
+    else:
+        elements = ()
+        key = (field.type, size, field.optional, field.fixed)
+    bounds = memo.get(key)
+    if bounds is None:
+        low, high = _layout_bounds(field, size, elements)
+        bounds = memo[key] = (len(memo), low, high)
+    return bounds
+
+
+class SizeIndex(object):
+    """
+    Encoded size bounds of the messages of a set of Services.
+
+    :param services: iterable of model Services or Service elements, e.g. a ``ServiceRegistry``
+
+    Attributes:
+
+        * ``bounds`` - (dict) ``(min_bytes, max_bytes)`` of each message by ``(sin, direction, min)``,
+          ``max_bytes`` being None if unbounded
+        * ``names`` - (dict) message name by ``(sin, direction, min)``
+        * ``errors`` - (dict) reason the size of a message could not be computed by ``(sin, direction, min)``
+
+    """
+    def __init__(self, services=()):
+        self.bounds = {}
+        self.names = {}
+        self.errors = {}
+        self._memo = {}
+        for service in services:
+            self.add_service(service)
+
+    @classmethod
+    def from_file(cls, filename, backend=None, cache=None):
+        """
+        Builds the index of a message definition file, e.g. a merged file.
+
+        :param filename: (string) path/filename of the message definition file
+        :param backend: (ElementTreeBackend) XML backend, or None for the default of ``get_backend``
+        :param cache: (DefinitionCache) to reuse the index of an unchanged file, or None
+        :return: (SizeIndex)
+        :raises ValueError: if a field type is unknown or a number is not an integer
+
+        """
+        key = cache.key(filename, 'sizes:{}'.format(SIZES_VERSION)) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            index = cls()
+            index.bounds, index.names, index.errors = cached
+            return index
+        index = cls(iter_load(filename, backend))
+        if key is not None:
+            cache.put(key, (index.bounds, index.names, index.errors))
+        return index
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def add_service(self, service):
+        """
+        Computes the bounds of the messages of a Service, replacing any with the same SIN and MIN.
+
+        :param service: (Service) model Service, or (Element) Service element
+
+        """
+        if not isinstance(service, Service):
+            service = Service.from_element(service)
+        memo = self._memo
+        for direction in DIRECTIONS:
+            for message in service.messages(direction):
+                key = (service.sin, direction, message.min)
+                self.names[key] = message.name
+                try:
+                    low = 0
+                    high = 0
+                    for field in message.fields:
+                        bounds = field_bounds(field, memo)
+                        low += bounds[1]
+                        high = None if high is None or bounds[2] is None else high + bounds[2]
+                except CodecError as e:
+                    self.bounds.pop(key, None)
+                    self.errors[key] = str(e)
+                    continue
+                self.bounds[key] = (_to_bytes(low), _to_bytes(high))
+                self.errors.pop(key, None)
+
+    def get(self, sin, min, direction=RETURN):
+        """
+        Returns the bounds of a message.
+
+        :return: (tuple) ``(min_bytes, max_bytes)``, or None if not defined or not computed
+
+        """
+        return self.bounds.get((sin, direction, min))
+
+    def exceeding(self, limit):
+        """
+        Lists the messages that may exceed a size limit.
+
+        :param limit: (int) bytes of the largest message allowed, including the SIN and MIN
+        :return: (list of tuple) ``(sin, direction, min)`` of each message whose maximum size is
+           above ``limit`` or unbounded, in ascending order of SIN, direction and MIN
+
+        """
+        return sorted((key for key, (low, high) in self.bounds.items() if high is None or high > limit),
+                      key=message_order)
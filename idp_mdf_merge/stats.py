@@ -0,0 +1,270 @@
+"""
+Instrumentation of a merge.
+
+A :class:`MergeStats` passed to :func:`~idp_mdf_merge.idp_mdf_merge.merge_mdf` records the wall time
+of each phase of the merge, the elements processed, the bytes read and written and the peak memory,
+in total and for each input file. A callback can observe each phase as it ends. CPU profiling with
+``cProfile`` and memory tracing with ``tracemalloc`` are opt-in, as both slow the merge down.
+
+Phases:
+
+    * ``fetch`` - download of remote sources
+    * ``hash`` - hashing of the content of inputs of an incremental merge
+    * ``parse`` - XML parsing of an input
+    * ``prune`` - removal of unsupported tags from each Service
+    * ``meta`` - application of metadata tags to each Service and Message
+    * ``describe`` - clean up of each Description
+    * ``validate`` - validation of each Service by the ``ValidateStage`` of ``validate=True``
+    * ``serialize`` - serialization of each Service (stream mode)
+    * ``load`` - parse and normalize of an input loaded in a worker process, from the cache or from
+      the manifest of an incremental merge, where the phases above are not measured separately
+    * ``index`` - duplicate resolution and sorting of the Services by SIN
+    * ``write`` - writing of the merged output
+
+Each custom stage of a transform pipeline adds a phase named after the stage.
+
+"""
+
+import os
+import sys
+import time
+
+PHASES = ('fetch', 'hash', 'parse', 'prune', 'meta', 'describe', 'validate', 'serialize', 'load', 'index',
+          'write')
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def _peak_rss():
+    """Returns (int) the peak resident set size of the process in bytes, or None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class FileStats(object):
+    """
+    Measurements of one input file.
+
+    Attributes:
+
+        * ``filename`` - (string) the input file/path as given to the merge
+        * ``bytes_read`` - (int) size of the (local copy of the) file
+        * ``services`` - (int) Services found in the file
+        * ``elements`` - (int) XML elements parsed from the file, or None if it was not parsed
+        * ``phases`` - (dict) seconds spent in each phase
+        * ``peak_memory`` - (int) peak traced memory while the file was processed if tracing
+          memory, otherwise peak resident set size of the process once it was processed, in bytes
+
+    """
+    __slots__ = ('filename', 'bytes_read', 'services', 'elements', 'phases', 'peak_memory')
+
+    def __init__(self, filename, path=None):
+        self.filename = filename
+        try:
+            self.bytes_read = os.path.getsize(path if path is not None else filename)
+        except OSError:
+            self.bytes_read = None
+        self.services = 0
+        self.elements = None
+        self.phases = {}
+        self.peak_memory = None
+
+    def as_dict(self):
+        """Returns (dict) the measurements."""
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class _Timer(object):
+    """Context manager adding the time spent in its block to a phase."""
+    __slots__ = ('stats', 'phase', 'filename', 'start')
+
+    def __init__(self, stats, phase, filename):
+        self.stats = stats
+        self.phase = phase
+        self.filename = filename
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add(self.phase, clock() - self.start, self.filename)
+        return False
+
+
+class MergeStats(object):
+    """
+    Collects measurements of a merge.
+
+    :param callback: (function) called with ``(phase, filename, seconds)`` each time a phase ends,
+       filename being None for phases of the whole merge
+    :param memory: (Boolean) flag to trace memory allocations with ``tracemalloc``, ignored if it is
+       not available, ``memory`` then being False
+    :param profile: (Boolean) flag to profile the merge with ``cProfile``
+
+    Attributes:
+
+        * ``phases`` - (dict) total seconds spent in each phase
+        * ``files`` - (list of FileStats) measurements of each input file, in input order
+        * ``elapsed`` - (float) seconds of the whole merge
+        * ``services`` - (int) Services written
+        * ``bytes_written`` - (int) size of the merged output
+        * ``peak_memory`` - (int) peak traced memory if tracing memory, otherwise peak resident set
+          size of the process, in bytes
+        * ``profile`` - (pstats.Stats) the CPU profile if profiling, otherwise None
+
+    """
+    def __init__(self, callback=None, memory=False, profile=False):
+        self.callback = callback
+        if memory:
+            try:
+                # availability check only: Python 2 has neither tracemalloc nor importlib.util
+                import tracemalloc  # noqa: F401
+            except ImportError:
+                memory = False
+        self.memory = memory
+        self.phases = {}
+        self.files = []
+        self.elapsed = None
+        self.services = 0
+        self.bytes_written = 0
+        self.peak_memory = None
+        self.profile = None
+        self._profiler = None
+        self._start = None
+        self._by_name = {}
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        """Starts measuring the whole merge."""
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self._profiler is not None:
+            self._profiler.enable()
+        self._start = clock()
+
+    def stop(self, target=None):
+        """
+        Stops measuring the whole merge.
+
+        :param target: (string) path/filename of the merged output, to measure its size
+
+        """
+        self.elapsed = clock() - self._start
+        if self._profiler is not None:
+            import pstats
+            self._profiler.disable()
+            self.profile = pstats.Stats(self._profiler)
+        if self.memory:
+            import tracemalloc
+            peaks = [f.peak_memory for f in self.files if f.peak_memory is not None]
+            self.peak_memory = max(peaks + [tracemalloc.get_traced_memory()[1]])
+            tracemalloc.stop()
+        else:
+            self.peak_memory = _peak_rss()
+        if target is not None and os.path.isfile(target):
+            self.bytes_written = os.path.getsize(target)
+
+    def file(self, filename, path=None):
+        """
+        Starts measuring an input file.
+
+        :param filename: (string) the input file/path as given to the merge
+        :param path: (string) the local path read, if not ``filename``
+        :return: (FileStats) measurements of the file
+
+        """
+        stats = FileStats(filename, path)
+        self.files.append(stats)
+        self._by_name[filename] = stats
+        if self.memory:
+            import tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        return stats
+
+    def file_done(self, filename):
+        """Records the peak memory of an input file once processed."""
+        stats = self._by_name.get(filename)
+        if stats is None:
+            return
+        if self.memory:
+            import tracemalloc
+            stats.peak_memory = tracemalloc.get_traced_memory()[1]
+        else:
+            stats.peak_memory = _peak_rss()
+
+    def count(self, filename, services=0, elements=0):
+        """Adds Services and elements processed from an input file."""
+        stats = self._by_name.get(filename)
+        if stats is not None:
+            stats.services += services
+            if elements:
+                stats.elements = (stats.elements or 0) + elements
+
+    def add(self, phase, seconds, filename=None):
+        """
+        Adds time spent in a phase.
+
+        :param phase: (string) one of ``PHASES``, or the name of a custom transform stage
+        :param seconds: (float) time spent
+        :param filename: (string) the input file the time was spent on, or None
+
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        if filename is not None:
+            stats = self._by_name.get(filename)
+            if stats is not None:
+                stats.phases[phase] = stats.phases.get(phase, 0.0) + seconds
+        if self.callback is not None:
+            self.callback(phase, filename, seconds)
+
+    def timer(self, phase, filename=None):
+        """Returns a context manager adding the time spent in its block to ``phase``."""
+        return _Timer(self, phase, filename)
+
+    def as_dict(self):
+        """Returns (dict) the measurements, e.g. for JSON output."""
+        return {
+            'elapsed': self.elapsed,
+            'phases': dict(self.phases),
+            'services': self.services,
+            'bytes_read': sum(f.bytes_read or 0 for f in self.files),
+            'bytes_written': self.bytes_written,
+            'peak_memory': self.peak_memory,
+            'files': [f.as_dict() for f in self.files],
+        }
+
+    def format_table(self):
+        """Returns (string) a text table of the measurements."""
+        phases = [phase for phase in PHASES if phase in self.phases]
+        phases += sorted(phase for phase in self.phases if phase not in PHASES)
+        lines = ['{:<10} {:>10} {:>6}'.format('phase', 'ms', '%')]
+        for phase in phases:
+            lines.append('{:<10} {:>10.2f} {:>6.1f}'.format(
+                phase, self.phases[phase] * 1000, 100.0 * self.phases[phase] / self.elapsed if self.elapsed else 0))
+        lines.append('{:<10} {:>10.2f}'.format('total', (self.elapsed or 0) * 1000))
+        lines.append('')
+        header = '{:<40} {:>10} {:>8} {:>9}'.format('file', 'bytes', 'services', 'elements')
+        header += ''.join(' {:>9}'.format(phase) for phase in phases if phase not in ('index', 'write'))
+        lines.append(header + ' {:>9}'.format('peak MB'))
+        for f in self.files:
+            name = f.filename if len(f.filename) <= 40 else '...' + f.filename[-37:]
+            line = '{:<40} {:>10} {:>8} {:>9}'.format(name, f.bytes_read if f.bytes_read is not None else '-',
+                                                       f.services, f.elements if f.elements is not None else '-')
+            line += ''.join(' {:>9.2f}'.format(f.phases.get(phase, 0) * 1000)
+                            for phase in phases if phase not in ('index', 'write'))
+            line += ' {:>9}'.format('-' if f.peak_memory is None else '{:.1f}'.format(f.peak_memory / 1048576.0))
+            lines.append(line)
+        lines.append('')
+        lines.append('{} Services, {} bytes written, peak memory {}'.format(
+            self.services, self.bytes_written,
+            '-' if self.peak_memory is None else '{:.1f} MB'.format(self.peak_memory / 1048576.0)))
+        return '\n'.join(lines)
@@ -0,0 +1,395 @@
+"""
+Transform pipeline applied to each Service of a merge.
+
+A :class:`Pipeline` is an ordered list of :class:`Stage` objects. Each Service is transformed by
+first calling every stage's ``service()`` hook on the Service element, then passing the elements
+of the Service with a tag a stage is registered for to the stage.
+
+Messages are passed to their stages' ``apply()`` in one walk of the direction containers, which
+records the direction, Name, MIN and Fields of each Message in the :class:`TransformContext` from
+a single loop over its elements, so that stages such as :class:`MetaStage` and
+:class:`ValidateStage` share the walk and do not search each Message again. The elements of any
+other tag are found by one search of the Service per tag and passed to the ``apply_all()`` of
+each of its stages.
+
+The default pipeline of a merge prunes unsupported tags (:class:`PruneStage`), applies metadata
+tags when requested (:class:`MetaStage`) and removes line feeds from descriptions
+(:class:`DescriptionStage`); :class:`ValidateStage` may be added to validate each Service. A
+Service without an integer SIN is not transformed and is left out of the merge. Custom stages are
+added with :meth:`Pipeline.register`. Stages must be picklable to be used with worker processes,
+and should set a ``name`` and bump their ``version`` whenever their output changes, as both
+identify cached normalized Services.
+
+"""
+
+try:
+    from .registry import DIRECTIONS
+    from .stats import clock
+    from .validate import check_message, validate_service
+except (ImportError, ValueError):
+    from registry import DIRECTIONS
+    from stats import clock
+    from validate import check_message, validate_service
+
+
+class TransformContext(object):
+    """
+    State passed to the stages while a Service is transformed.
+
+    Attributes:
+
+        * ``sin`` - (string) the SIN of the Service
+        * ``exceptions`` - (list of string) to which stages append any warnings or errors
+        * ``direction`` - (string) the direction container of the Message being walked
+        * ``message_name`` - (string) the Name of the Message being walked, or None
+        * ``message_min`` - (string) the MIN of the Message being walked, or None
+        * ``message_fields`` - (ElementTree.Element) the Fields of the Message being walked, or None
+
+    """
+    __slots__ = ('sin', 'exceptions', 'direction', 'message_name', 'message_min', 'message_fields')
+
+    def __init__(self, sin, exceptions):
+        self.sin = sin
+        self.exceptions = exceptions
+        self.direction = self.message_name = self.message_min = self.message_fields = None
+
+
+class Stage(object):
+    """
+    Base class of a transform stage.
+
+    Attributes:
+
+        * ``name`` - (string) identifies the stage, e.g. in merge statistics
+        * ``version`` - (int) bumped when the output of the stage changes
+        * ``tags`` - (tuple of string) tags of the elements passed to ``apply()`` or ``apply_all()``
+
+    """
+    name = 'stage'
+    version = 1
+    tags = ()
+
+    @property
+    def signature(self):
+        """(string) identifies the stage, its version and any options changing its output."""
+        return '{}:{}'.format(self.name, self.version)
+
+    def service(self, service, context):
+        """
+        Transforms a Service element before its subtree is traversed.
+
+        :param service: (ElementTree.Element) the Service, modified in place
+        :param context: (TransformContext) of the Service
+
+        """
+        pass
+
+    def apply(self, elem, context):
+        """
+        Transforms one element of the subtree of a Service whose tag is in ``tags``. A Message
+        is passed with its direction, Name, MIN and Fields set in ``context``.
+
+        :param elem: (ElementTree.Element) the element, modified in place
+        :param context: (TransformContext) of the Service
+
+        """
+        pass
+
+    def apply_all(self, elems, context):
+        """
+        Transforms the elements of one of ``tags``, other than Messages, found in the subtree of a
+        Service, by calling ``apply()`` on each. A stage may override it to avoid a call per
+        element.
+
+        :param elems: (iterable of ElementTree.Element) the elements, modified in place
+        :param context: (TransformContext) of the Service
+
+        """
+        for elem in elems:
+            self.apply(elem, context)
+
+
+class PruneStage(Stage):
+    """
+    Removes the child elements of a Service that are not supported.
+
+    :param supported: (list of string) the tags of the child elements kept
+
+    """
+    name = 'prune'
+    version = 2
+
+    def __init__(self, supported):
+        self.supported = frozenset(supported)
+
+    def service(self, service, context):
+        for twig in [twig for twig in service if twig.tag not in self.supported]:
+            service.remove(twig)
+            context.exceptions.append("WARNING: Found/removed unsupported tag {tag} "
+                                      "in {service}".format(tag=twig.tag, service=context.sin))
+
+
+class MetaStage(Stage):
+    """
+    Sets ``sin``/``name`` attributes on each Service and ``min``/``name`` on each Message.
+
+    :param missing_min: (Boolean) flag to report a Message without a MIN, cleared when the Service
+       is validated, which reports it
+
+    """
+    name = 'meta'
+    tags = ('Message',)
+
+    def __init__(self, missing_min=True):
+        self.missing_min = missing_min
+
+    @property
+    def signature(self):
+        signature = super(MetaStage, self).signature
+        return signature if self.missing_min else signature + '-min'
+
+    def service(self, service, context):
+        service.set('sin', context.sin)
+        name = service.findtext('Name')
+        service.set('name', name if name else "*undefined*")
+
+    def apply(self, elem, context):
+        min = context.message_min
+        name = context.message_name
+        if min:
+            elem.set('min', min)
+        elif self.missing_min:
+            context.exceptions.append("ERROR: MIN not specified in SIN {sin}".format(sin=context.sin))
+        elem.set('name', name if name else '*undefined*')
+
+
+class DescriptionStage(Stage):
+    """
+    Cleans up the text of each Description, leaving an empty Description as it is.
+
+    :param clean: (function) returning the cleaned up text of a Description
+
+    """
+    name = 'describe'
+    tags = ('Description',)
+
+    def __init__(self, clean):
+        self.clean = clean
+
+    def apply(self, elem, context):
+        if elem.text is not None:
+            elem.text = self.clean(elem.text)
+
+    def apply_all(self, elems, context):
+        clean = self.clean
+        for elem in elems:
+            text = elem.text
+            if text is not None:
+                elem.text = clean(text)
+
+
+class ValidateStage(Stage):
+    """
+    Validates each Service with the rules of :mod:`~idp_mdf_merge.validate`: mandatory elements,
+    SIN and MIN ranges, Size limits and Enum items.
+
+    Validates each Service as it is loaded, before duplicate SINs are resolved, so a Service left
+    out of the merge is also reported. The elements of the Service are checked before the walk and
+    each Message as it is passed. Added to the pipeline of a merge by ``merge_mdf(validate=True)``.
+
+    """
+    name = 'validate'
+    version = 2
+    tags = ('Message',)
+
+    def __init__(self):
+        self._container = self._where = None
+
+    def service(self, service, context):
+        validate_service(service, context.sin, context.exceptions, messages=False)
+
+    def apply(self, elem, context):
+        # the location of the direction container is formatted once for its Messages
+        container = (context.sin, context.direction)
+        if container != self._container:
+            self._container = container
+            self._where = 'SIN {sin} {direction}'.format(sin=context.sin.strip(), direction=context.direction)
+        check_message(context.message_name, context.message_min, context.message_fields, self._where,
+                      context.exceptions)
+
+
+class Pipeline(object):
+    """
+    An ordered list of transform stages applied to each Service.
+
+    :param stages: (list of Stage) initial stages
+
+    """
+    def __init__(self, stages=None):
+        self.stages = []
+        self._dispatch = None
+        for stage in stages or []:
+            self.register(stage)
+
+    def __getstate__(self):
+        return {'stages': self.stages}
+
+    def __setstate__(self, state):
+        self.stages = state['stages']
+        self._dispatch = None
+
+    def register(self, stage):
+        """
+        Appends a stage to the pipeline.
+
+        :param stage: (Stage) the stage
+        :return: (Stage) the stage
+
+        """
+        self.stages.append(stage)
+        self._dispatch = None
+        return stage
+
+    @property
+    def signature(self):
+        """(string) identifies the stages and their versions, e.g. in cache keys."""
+        return ','.join(stage.signature for stage in self.stages)
+
+    def _compile(self):
+        """
+        Returns (tuple) ``(hooks, messages, tags)``: the ``service()`` of each stage overriding it,
+        the stages of Messages, and ``(tag, stages)`` of each other tag, in stage order.
+
+        """
+        dispatch = {}
+        for stage in self.stages:
+            for tag in stage.tags:
+                dispatch.setdefault(tag, []).append(stage)
+        hooks = [stage.service for stage in self.stages if _overrides(stage, 'service')]
+        tags = [(tag, stages) for tag, stages in dispatch.items() if tag != 'Message']
+        self._dispatch = hooks, dispatch.get('Message'), tags
+        return self._dispatch
+
+    def run(self, service, exceptions, stats=None, filename=None):
+        """
+        Transforms a Service.
+
+        :param service: (ElementTree.Element) the Service, modified in place
+        :param exceptions: (list of string) to which any warnings or errors are appended
+        :param stats: (MergeStats) to which the time of each stage is added, or None
+        :param filename: (string) input file of the Service, for ``stats``
+        :return: (string) the SIN of the Service, or None if it has no integer SIN and is to be
+           left out of the merge
+
+        """
+        sin = service.findtext('SIN')
+        if not sin:
+            exceptions.append("ERROR: SIN not specified - Service {name} not merged".format(
+                name=service.findtext('Name')))
+            return None
+        if not sin.strip().isdigit():
+            exceptions.append("ERROR: SIN {sin} is not an integer - Service {name} not merged".format(
+                sin=sin.strip(), name=service.findtext('Name')))
+            return None
+        context = TransformContext(sin, exceptions)
+        hooks, messages, tags = self._dispatch if self._dispatch is not None else self._compile()
+        if stats is not None:
+            self._run_timed(service, context, messages, tags, stats, filename)
+            return context.sin
+        for hook in hooks:
+            hook(service, context)
+        if messages is not None:
+            _walk_messages(service, context, [stage.apply for stage in messages])
+        if tags:
+            _walk_tags(service, context, tags)
+        return context.sin
+
+    def _run_timed(self, service, context, messages, tags, stats, filename):
+        """Runs the pipeline adding the time spent in each stage to ``stats`` under the stage name."""
+        elapsed = dict((stage.name, 0.0) for stage in self.stages)
+        for stage in self.stages:
+            start = clock()
+            stage.service(service, context)
+            elapsed[stage.name] += clock() - start
+        if messages is not None:
+            _walk_messages(service, context, [_timed(stage.apply, stage.name, elapsed) for stage in messages])
+        if tags:
+            _walk_tags(service, context, tags, elapsed)
+        for stage in self.stages:
+            stats.add(stage.name, elapsed[stage.name], filename)
+
+
+def _overrides(stage, method):
+    """Returns True if the class of ``stage`` overrides ``method`` of ``Stage``."""
+    for cls in type(stage).__mro__:
+        if cls is Stage:
+            return False
+        if method in cls.__dict__:
+            return True
+    return False
+
+
+def _walk_messages(service, context, applies):
+    """
+    Passes each Message of the direction containers of a Service to ``applies``, with its
+    direction, Name, MIN and Fields set in ``context`` from a single loop over its elements.
+
+    """
+    for container in service:
+        if container.tag not in DIRECTIONS:
+            continue
+        context.direction = container.tag
+        for message in container:
+            if message.tag != 'Message':
+                continue
+            name = min = fields = None
+            for part in message:
+                tag = part.tag
+                if tag == 'Name':
+                    name = part.text
+                elif tag == 'MIN':
+                    min = part.text
+                elif tag == 'Fields':
+                    fields = part
+            context.message_name = name
+            context.message_min = min
+            context.message_fields = fields
+            for apply in applies:
+                apply(message, context)
+    context.direction = context.message_name = context.message_min = context.message_fields = None
+
+
+def _walk_tags(service, context, tags, elapsed=None):
+    """
+    Passes the elements of the subtree of a Service with each tag other than Message to the
+    ``apply_all()`` of the stages of the tag.
+
+    The subtree is traversed once for all the tags, each element being collected in the list of its
+    tag. With lxml, or a single tag, the traversal is filtered by the tags; ElementTree filters only
+    one tag, so for several every element is visited and looked up by tag.
+
+    :param tags: (list of tuple) ``(tag, stages)``
+    :param elapsed: (dict) to which the seconds spent in each stage are added by stage name, or None
+
+    """
+    elems = dict((tag, []) for tag, stages in tags)
+    for elem in service.iter(*elems) if len(elems) == 1 or hasattr(service, 'getparent') else service.iter():
+        collected = elems.get(elem.tag)
+        if collected is not None:
+            collected.append(elem)
+    found = [(stages, elems[tag]) for tag, stages in tags]
+    for stages, elems in found:
+        for stage in stages:
+            if elapsed is None:
+                stage.apply_all(elems, context)
+            else:
+                _timed(stage.apply_all, stage.name, elapsed)(elems, context)
+
+
+def _timed(method, name, elapsed):
+    """Returns ``method`` adding the seconds spent in each call to ``elapsed[name]``."""
+    def timed(*args):
+        start = clock()
+        method(*args)
+        elapsed[name] += clock() - start
+    return timed
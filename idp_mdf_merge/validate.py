@@ -0,0 +1,333 @@
+"""
+Validation of message definitions and bounded reporting of the diagnostics of a merge.
+
+:func:`validate_service` checks each Service of a merge as it is loaded, in the same pass as its
+other transforms, by the :class:`~idp_mdf_merge.transform.ValidateStage` that
+``merge_mdf(validate=True)`` adds to the transform pipeline:
+
+    * mandatory elements - the Name of each Service, Message and Field, the MIN of each Message,
+      the Size of Unsigned and Signed fields and of any Fixed String, Data or Array, the Items of
+      an Enum and the Fields of an Array; an Enum without a Size takes the fewest bits numbering
+      its Items, as the gateway derives it
+    * ranges - SIN and MIN in ``ID_RANGE``, as coded in the first two bytes of a payload
+    * Size limits - Unsigned and Enum fields of at most 31 bits, Signed fields of at most 32 bits
+      (``INT_SIZE_LIMITS``), String, Data and Array of at most ``MAX_LENGTH`` characters, bytes
+      or elements
+    * Enum items - no more Items than the Size of the Enum can number
+
+The checks of each field type are compiled once into a :class:`FieldRule` of ``FIELD_RULES``, so
+validating a Field is a dict lookup of its type, one pass over its child elements and only the
+checks its rule needs. Diagnostics
+read ``<level>: <problem> - <location>``::
+
+    ERROR: EnumField 9 Items exceed Size 3 - SIN 128 ReturnMessages MIN 2 Field mode
+
+An :class:`ErrorLog` writes the diagnostics of a merge to its error log as they are reported. Once
+a warning has been written ``max_repeats`` times, further repeats of the same text are only
+counted, and the number omitted is written when the log is closed. Errors, and warnings naming a
+different SIN, MIN or Field, are always written.
+
+"""
+
+try:
+    from .codec import (ENUM, UNSIGNED, SIGNED, STRING, DATA, ARRAY, FIELD_TYPES, MAX_LENGTH,
+                        XSI_TYPE)
+    from .registry import DIRECTIONS
+except (ImportError, ValueError):
+    from codec import ENUM, UNSIGNED, SIGNED, STRING, DATA, ARRAY, FIELD_TYPES, MAX_LENGTH, XSI_TYPE
+    from registry import DIRECTIONS
+
+# Range of a SIN or MIN, coded in 8 bits
+ID_RANGE = (0, 255)
+
+# Largest Size in bits of each integer field type
+INT_SIZE_LIMITS = {ENUM: 31, UNSIGNED: 31, SIGNED: 32}
+
+# Repeats of a warning written to an error log before further ones are only counted
+MAX_REPEATS = 10
+
+
+class FieldRule(object):
+    """
+    Checks of the Fields of one type, compiled once by :func:`compile_rules`.
+
+    :param type_name: (string) the field type e.g. ``UnsignedIntField``
+    :param ftype: (int) the field type number e.g. ``UNSIGNED``
+
+    Attributes:
+
+        * ``size`` - (tuple) ``(minimum, maximum)`` Size, or None if the Size is not checked
+        * ``sized`` - (Boolean) the Size is mandatory
+        * ``fixable`` - (Boolean) the Size is mandatory if Fixed
+        * ``items`` - (Boolean) the Items are mandatory and counted against the Size
+        * ``fields`` - (Boolean) the Fields are mandatory and validated
+
+    """
+    def __init__(self, type_name, ftype):
+        self.type_name = type_name
+        self.size = None
+        self.sized = ftype in (UNSIGNED, SIGNED)
+        self.fixable = ftype in (STRING, DATA, ARRAY)
+        self.items = ftype == ENUM
+        self.fields = ftype == ARRAY
+        if ftype in INT_SIZE_LIMITS:
+            self.size = (1, INT_SIZE_LIMITS[ftype])
+        elif self.fixable:
+            self.size = (1, MAX_LENGTH)
+        self.unnamed = "WARNING: Field Name not specified"
+        self.no_size = "ERROR: {type} Size not specified".format(type=type_name)
+        self.no_fixed_size = "ERROR: Fixed {type} Size not specified".format(type=type_name)
+        self.bad_size = "ERROR: {type} Size {{size}} is not an integer".format(type=type_name)
+        self.size_range = "WARNING: {type} Size {{size}} outside {low} to {high}".format(
+            type=type_name, low=self.size[0], high=self.size[1]) if self.size else None
+        self.no_items = "ERROR: {type} Items not specified".format(type=type_name)
+        self.items_exceed = "ERROR: {type} {{items}} Items exceed Size {{size}}".format(type=type_name)
+        self.no_fields = "ERROR: {type} Fields not specified".format(type=type_name)
+
+    def check(self, field, where, position, exceptions):
+        """
+        Validates a Field of the type of the rule, and the Fields of an Array.
+
+        :param field: (ElementTree.Element) the Field
+        :param where: (string) location of the Message or Array containing the Field
+        :param position: (int) of the Field in its Message or Array from 1, locating a Field
+           without a Name
+        :param exceptions: (list of string) to which a diagnostic of each problem is appended
+
+        """
+        name = size_text = fixed = items = children = None
+        for child in field:
+            tag = child.tag
+            if tag == 'Name':
+                name = child.text
+            elif tag == 'Size':
+                size_text = child.text
+            elif tag == 'Fixed':
+                fixed = child.text
+            elif tag == 'Items':
+                items = child
+            elif tag == 'Fields':
+                children = child
+        problems = [] if name else [self.unnamed]
+        size = None
+        if self.size is not None:
+            size_text = size_text.strip() if size_text else None
+            fixed = self.fixable and (fixed or '').strip().lower() == 'true'
+            if not size_text:
+                if self.sized or fixed:
+                    problems.append(self.no_size if self.sized else self.no_fixed_size)
+            elif not size_text.lstrip('-').isdigit():
+                problems.append(self.bad_size.format(size=size_text))
+            else:
+                size = int(size_text)
+                if not self.size[0] <= size <= self.size[1] and (not self.fixable or fixed or size != -1):
+                    problems.append(self.size_range.format(size=size))
+        if self.items:
+            count = len(items) if items is not None else 0
+            if count == 0:
+                problems.append(self.no_items)
+            elif size is not None and size > 0 and (count - 1).bit_length() > size:
+                problems.append(self.items_exceed.format(items=count, size=size))
+        if not self.fields:
+            children = None
+        elif children is None or len(children) == 0:
+            problems.append(self.no_fields)
+        if problems or children is not None:
+            location = '{where} Field {name}'.format(where=where, name=name or position)
+            if problems:
+                exceptions.extend('{problem} - {location}'.format(problem=problem, location=location)
+                                  for problem in problems)
+            if children is not None:
+                _validate_fields(children, location, exceptions)
+
+
+def compile_rules():
+    """Returns (dict) the :class:`FieldRule` of each field type name of ``FIELD_TYPES``."""
+    return dict((type_name, FieldRule(type_name, ftype)) for type_name, ftype in FIELD_TYPES.items())
+
+
+FIELD_RULES = compile_rules()
+
+
+def _validate_fields(fields, where, exceptions):
+    """Validates the Fields of a Message or Array located by ``where``."""
+    for position, field in enumerate(fields, 1):
+        rule = FIELD_RULES.get(field.get(XSI_TYPE))
+        if rule is None:
+            exceptions.append("ERROR: Unknown field type {type} - {where} Field {name}".format(
+                type=field.get(XSI_TYPE), where=where, name=field.findtext('Name') or position))
+        else:
+            rule.check(field, where, position, exceptions)
+
+
+def _check_id(text, label, where, exceptions):
+    """Appends a diagnostic if a SIN or MIN is not an integer in ``ID_RANGE``; returns (Boolean) True if valid."""
+    text = text.strip()
+    if not text.isdigit():
+        exceptions.append("ERROR: {label} {text} is not an integer - {where}".format(label=label, text=text,
+                                                                                     where=where))
+        return False
+    if not ID_RANGE[0] <= int(text) <= ID_RANGE[1]:
+        exceptions.append("ERROR: {label} {text} outside {low} to {high} - {where}".format(
+            label=label, text=text, low=ID_RANGE[0], high=ID_RANGE[1], where=where))
+        return False
+    return True
+
+
+def validate_message(message, where, exceptions):
+    """
+    Validates a Message and its Fields.
+
+    :param message: (ElementTree.Element) the Message
+    :param where: (string) location of the Message container e.g. ``SIN 128 ReturnMessages``
+    :param exceptions: (list of string) to which a diagnostic of each problem is appended
+
+    """
+    name = min_text = fields = None
+    for child in message:
+        tag = child.tag
+        if tag == 'Name':
+            name = child.text
+        elif tag == 'MIN':
+            min_text = child.text
+        elif tag == 'Fields':
+            fields = child
+    check_message(name, min_text, fields, where, exceptions)
+
+
+def check_message(name, min_text, fields, where, exceptions):
+    """
+    Validates a Message from its elements already read, e.g. by the transform pipeline.
+
+    :param name: (string) the text of the Name of the Message, or None
+    :param min_text: (string) the text of the MIN of the Message, or None
+    :param fields: (ElementTree.Element) the Fields of the Message, or None
+    :param where: (string) location of the Message container e.g. ``SIN 128 ReturnMessages``
+    :param exceptions: (list of string) to which a diagnostic of each problem is appended
+
+    """
+    if not min_text:
+        where = '{where} Message {name}'.format(where=where, name=name)
+        exceptions.append("ERROR: MIN not specified - {where}".format(where=where))
+    else:
+        _check_id(min_text, 'MIN', '{where} Message {name}'.format(where=where, name=name), exceptions)
+        where = '{where} MIN {min}'.format(where=where, min=min_text.strip())
+    if not name:
+        exceptions.append("WARNING: Message Name not specified - {where}".format(where=where))
+    if fields is not None:
+        _validate_fields(fields, where, exceptions)
+
+
+def validate_service(service, sin, exceptions, messages=True):
+    """
+    Validates a Service, its Messages and their Fields.
+
+    :param service: (ElementTree.Element) the Service
+    :param sin: (string) the SIN of the Service
+    :param exceptions: (list of string) to which a diagnostic of each problem is appended
+    :param messages: (Boolean) flag to validate the Messages, or only the Service itself if the
+       caller validates each Message with ``validate_message``
+
+    """
+    where = 'SIN {sin}'.format(sin=sin.strip())
+    name = service.findtext('Name')
+    _check_id(sin, 'SIN', 'Service {name}'.format(name=name), exceptions)
+    if not name:
+        exceptions.append("WARNING: Service Name not specified - {where}".format(where=where))
+    if not messages:
+        return
+    for direction in DIRECTIONS:
+        messages = service.find(direction)
+        if messages is None:
+            continue
+        container = '{where} {direction}'.format(where=where, direction=direction)
+        for message in messages:
+            validate_message(message, container, exceptions)
+
+
+class ErrorLog(object):
+    """
+    Errors and warnings of a merge, written to its error log as they are reported.
+
+    Used in place of a list of diagnostics. The log is created by the first diagnostic, so a merge
+    without any leaves a previous log in place, and diagnostics are separated by line feeds. Once a
+    warning has been written ``max_repeats`` times, further repeats of the same text are only
+    counted, and a diagnostic of the number omitted of each such warning is written on
+    :meth:`close`. Errors are always written.
+
+    :param filename: (string) path/filename of the error log, or None to keep the diagnostics in
+       ``lines`` only
+    :param max_repeats: (int) repeats of a warning written, or None to write every diagnostic
+
+    Attributes:
+
+        * ``lines`` - (list of string) the diagnostics written
+
+    """
+    def __init__(self, filename, max_repeats=MAX_REPEATS):
+        self.filename = filename
+        self.max_repeats = max_repeats
+        self.lines = []
+        self._reported = 0
+        self._repeats = {}
+        self._order = []
+        self._file = None
+        self._closed = False
+
+    def __len__(self):
+        """Returns (int) the number of diagnostics reported, whether written or omitted."""
+        return self._reported
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def text(self):
+        """(string) the diagnostics written, separated by line feeds."""
+        return '\n'.join(self.lines)
+
+    def append(self, message):
+        """Reports a diagnostic, written unless it is a warning already written ``max_repeats`` times."""
+        self._reported += 1
+        if self.max_repeats is not None and not message.startswith('ERROR'):
+            seen = self._repeats.get(message, 0) + 1
+            self._repeats[message] = seen
+            if seen > self.max_repeats:
+                if seen == self.max_repeats + 1:
+                    self._order.append(message)
+                return
+        self._write(message)
+
+    def extend(self, messages):
+        """Reports each diagnostic of an iterable."""
+        for message in messages:
+            self.append(message)
+
+    def _write(self, message):
+        if self.filename is not None:
+            if self._file is None:
+                self._file = open(self.filename, 'w')
+            else:
+                self._file.write('\n')
+            self._file.write(message)
+        self.lines.append(message)
+
+    def close(self):
+        """Writes the number of repeats omitted of each warning, then closes the log."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            for message in self._order:
+                level, text = message.split(': ', 1) if ': ' in message else ('WARNING', message)
+                self._write("{level}: {omitted} repeat(s) of \"{text}\" omitted".format(
+                    level=level, omitted=self._repeats[message] - self.max_repeats, text=text))
+        finally:
+            if self._file is not None:
+                self._file.close()
@@ -0,0 +1,263 @@
+"""
+Watch mode: a long-running merge that rewrites the target whenever a source in a directory changes.
+
+A :class:`Watcher` keeps the serialized Services of every source resident in memory between merges
+(see the ``incremental`` option of :func:`~idp_mdf_merge.idp_mdf_merge.merge_mdf`), so a change
+reparses only the edited file. Changes are detected with Linux ``inotify`` where available, or by
+polling file sizes and modification times otherwise. Bursts of events, such as an editor saving
+through a temporary file, are debounced into a single merge, and the target is replaced atomically.
+A merge that fails, e.g. on a half-written or malformed source, is reported and leaves the previous
+target in place until the next change.
+
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+try:
+    from .idp_mdf_merge import FIRST, merge_mdf
+except (ImportError, ValueError):
+    from idp_mdf_merge import FIRST, merge_mdf
+
+WATCH_EXT = '.idpmsg'
+WATCH_DEBOUNCE = 0.1
+WATCH_POLL_INTERVAL = 0.5
+
+# inotify(7) flags
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0x00000800
+_IN_CLOEXEC = 0x00080000
+_IN_EVENT = struct.Struct('iIII')
+
+
+def _snapshot(directory):
+    """Returns (dict) ``(size, mtime)`` of each message definition file in ``directory`` by name."""
+    files = {}
+    for name in os.listdir(directory):
+        if name.endswith(WATCH_EXT):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            files[name] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+class PollingMonitor(object):
+    """
+    Detects changes to the message definition files of a directory by polling.
+
+    :param directory: (string) the directory to watch
+    :param interval: (float) seconds between polls
+
+    """
+    def __init__(self, directory, interval=WATCH_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._files = _snapshot(directory)
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes.
+
+        :param timeout: (float) maximum seconds to wait, or None to wait until a change
+        :return: (set of string) names of the files created, changed or removed, empty on timeout
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            files = _snapshot(self.directory)
+            changed = set(name for name in set(files) | set(self._files)
+                          if files.get(name) != self._files.get(name))
+            self._files = files
+            if changed:
+                return changed
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.time())
+            if remaining <= 0:
+                return changed
+            time.sleep(remaining)
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor(object):
+    """
+    Detects changes to the message definition files of a directory with Linux ``inotify``.
+
+    :param directory: (string) the directory to watch
+    :raises OSError: if ``inotify`` is not available
+
+    """
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.directory = directory
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(self._fd, os.path.abspath(directory).encode('utf-8'), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, "inotify_add_watch failed on {dir}".format(dir=directory))
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes.
+
+        :param timeout: (float) maximum seconds to wait, or None to wait until a change
+        :return: (set of string) names of the files created, changed or removed, empty on timeout
+
+        """
+        changed = set()
+        deadline = None if timeout is None else time.time() + timeout
+        while not changed:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            readable = select.select([self._fd], [], [], remaining)[0]
+            if not readable:
+                break
+            changed.update(self._read())
+        return changed
+
+    def _read(self):
+        names = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return names
+            raise
+        offset = 0
+        while offset + _IN_EVENT.size <= len(data):
+            wd, mask, cookie, length = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+            if name.endswith(WATCH_EXT):
+                names.add(name)
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+def monitor(directory, interval=WATCH_POLL_INTERVAL):
+    """
+    Returns the best available change monitor of a directory.
+
+    :param directory: (string) the directory to watch
+    :param interval: (float) seconds between polls if ``inotify`` is not available
+    :return: an ``InotifyMonitor`` or else a ``PollingMonitor``
+
+    """
+    try:
+        return InotifyMonitor(directory)
+    except (OSError, AttributeError):
+        return PollingMonitor(directory, interval)
+
+
+class Watcher(object):
+    """
+    Merges the message definition files of a directory into a target each time one changes.
+
+    :param directory: (string) directory of the ``.idpmsg`` sources to watch
+    :param target: (string) path/filename of the merged output
+    :param files: (list of string) other sources merged after those of ``directory``, e.g. the
+       core modem definitions; these are not watched
+    :param meta: (Boolean) flag to use metadata tags in XML output of Service and Message
+    :param workers: (int) number of worker processes used to parse changed files
+    :param backend: (string) XML backend, one of ``BACKENDS``, or None for the default
+    :param conflicts: policy resolving a SIN found in more than one Service, one of
+       ``CONFLICT_POLICIES``
+    :param binary: (Boolean) flag to also write the compact binary export of the target
+    :param validate: (Boolean) flag to validate each Service as it is loaded
+    :param debounce: (float) seconds without further change to wait before merging
+    :param interval: (float) seconds between polls if ``inotify`` is not available
+    :param callback: (function) called after each merge with the result of ``merge_mdf``, or the
+       error of a merge that failed, and the merge duration in seconds
+
+    Attributes:
+
+        * ``merges`` - (int) number of merges run
+
+    """
+    def __init__(self, directory, target, files=None, meta=False, workers=None, backend=None, conflicts=FIRST,
+                 binary=False, validate=False, debounce=WATCH_DEBOUNCE, interval=WATCH_POLL_INTERVAL, callback=None):
+        base_filename, ext = os.path.splitext(target)
+        self.directory = directory
+        self.target = base_filename + WATCH_EXT
+        self.files = list(files) if files is not None else []
+        self.meta = meta
+        self.workers = workers
+        self.backend = backend
+        self.conflicts = conflicts
+        self.binary = binary
+        self.validate = validate
+        self.debounce = debounce
+        self.interval = interval
+        self.callback = callback
+        self.merges = 0
+        self._manifest = {}
+        self._ignored = set()
+        if os.path.realpath(os.path.dirname(os.path.abspath(self.target))) == os.path.realpath(directory):
+            self._ignored.add(os.path.basename(self.target))
+
+    def sources(self):
+        """Returns (list of string) the sources to merge, those of ``directory`` in name order."""
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(WATCH_EXT) and name not in self._ignored)
+        return [os.path.join(self.directory, name) for name in names] + self.files
+
+    def merge(self):
+        """
+        Merges the sources into the target, reparsing only the sources changed since the last merge.
+
+        A source that cannot be read or parsed fails the merge, leaving the previous target and
+        the sources kept in memory as they were.
+
+        :return: (string) error description if error, or None if successful
+
+        """
+        start = time.time()
+        try:
+            error = merge_mdf(self.sources(), self.target, meta=self.meta, workers=self.workers,
+                              incremental=self._manifest, backend=self.backend, conflicts=self.conflicts,
+                              binary=self.binary, validate=self.validate)
+        # the parse errors of ElementTree and lxml are both SyntaxErrors
+        except (SyntaxError, ValueError, EnvironmentError) as e:
+            error = "ERROR: Merge failed, keeping the previous {target}: {reason}".format(target=self.target,
+                                                                                           reason=e)
+        self.merges += 1
+        if self.callback is not None:
+            self.callback(error, time.time() - start)
+        return error
+
+    def run(self, stop=None):
+        """
+        Merges once, then again after each debounced burst of changes.
+
+        :param stop: (threading.Event) ends the watch when set, or None to watch until interrupted
+
+        """
+        changes = monitor(self.directory, self.interval)
+        try:
+            self.merge()
+            while stop is None or not stop.is_set():
+                if not changes.wait(self.interval) - self._ignored:
+                    continue
+                while changes.wait(self.debounce) - self._ignored:
+                    pass
+                self.merge()
+        finally:
+            changes.close()
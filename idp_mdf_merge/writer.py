@@ -0,0 +1,335 @@
+"""
+Streaming writer of merged message definition files.
+
+A :class:`MdfWriter` writes the XML declaration, the ``MessageDefinition`` root with its namespace
+declarations and then each Service, in the order given, straight to a buffered temporary file next
+to the target. Closing the writer completes the document and replaces the target with it, so
+readers of the target never see a partly written merge, and a failed merge leaves any previous
+target in place. The document has the layout ElementTree gives a merged tree, without building one.
+
+"""
+
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+# Size of the buffer of the output file
+WRITE_BUFFER = 256 * 1024
+
+# Namespace declaration ElementTree adds to the start tag of a serialized element
+_XMLNS_DECLARATION = re.compile(br' xmlns:([\w.-]+)="([^"]*)"')
+
+# ElementTree sorts attributes before Python 3.8, and keeps their insertion order since
+_SORTED_ATTRIBUTES = sys.version_info < (3, 8)
+
+# Prefix registered with ElementTree for each namespace URI seen, or None if it has none
+_prefixes = {}
+
+# Prefix ElementTree numbers a namespace without a registered prefix with
+_NUMBERED = re.compile(r'ns\d+$')
+
+# Pieces of the document around and between the Services
+_HEAD = b"<?xml version='1.0' encoding='utf-8'?>\n<MessageDefinition"
+_ROOT_END = b'>\n  <Services>\n    '
+SEPARATOR = b'\n    '
+_TAIL = b'\n  </Services>\n</MessageDefinition>\n'
+
+# Attributes are read with items()/keys(): reading the attrib of an element without attributes
+# creates and keeps an empty dict in the C implementation of ElementTree
+
+
+def _escape_text(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _escape_attrib(value):
+    value = _escape_text(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#09;')
+    return value
+
+
+def registered_prefix(uri):
+    """Returns (string) the prefix registered with ElementTree for a namespace URI, or None."""
+    try:
+        return _prefixes[uri]
+    except KeyError:
+        prefix = _XMLNS_DECLARATION.search(ET.tostring(ET.Element('{' + uri + '}x'))).group(1).decode('utf-8')
+        prefix = None if _NUMBERED.match(prefix) else prefix
+        _prefixes[uri] = prefix
+        return prefix
+
+
+def _prefix(uri, namespaces):
+    """
+    Returns the prefix of a namespace URI in a document using ``namespaces``: the prefix it is
+    bound to, else its registered prefix if free, else the next of ``ns0``, ``ns1``... free, as
+    ElementTree numbers the namespaces of a document.
+
+    """
+    registered = registered_prefix(uri)
+    if registered is not None and namespaces.get(registered, uri) == uri:
+        return registered
+    for prefix, bound in namespaces.items():
+        if bound == uri:
+            return prefix
+    n = len(namespaces)
+    while 'ns{}'.format(n) in namespaces:
+        n += 1
+    return 'ns{}'.format(n)
+
+
+def _qualify(name, namespaces):
+    """Returns (string) ``prefix:local`` of a ``{uri}local`` name, adding the prefix to ``namespaces``."""
+    uri, local = name[1:].split('}', 1)
+    prefix = _prefixes.get(uri)
+    if prefix is None or namespaces.get(prefix, uri) != uri:
+        prefix = _prefix(uri, namespaces)
+    namespaces[prefix] = uri
+    return prefix + ':' + local
+
+
+def _serialize(write, elem, namespaces):
+    """Writes the pieces of an element as ElementTree serializes it without namespace declarations."""
+    tag = elem.tag
+    text = elem.text
+    if tag is ET.Comment:
+        write(u'<!--{}-->'.format(text))
+    elif tag is ET.ProcessingInstruction:
+        write(u'<?{}?>'.format(text))
+    else:
+        if tag[0] == '{':
+            tag = _qualify(tag, namespaces)
+        write(u'<' + tag)
+        items = elem.items()
+        if items:
+            for key, value in sorted(items) if _SORTED_ATTRIBUTES else items:
+                if key[0] == '{':
+                    key = _qualify(key, namespaces)
+                write(u' {}="{}"'.format(key, _escape_attrib(value)))
+        if text or len(elem):
+            write(u'>')
+            if text:
+                write(_escape_text(text))
+            for child in elem:
+                _serialize(write, child, namespaces)
+            write(u'</' + tag + u'>')
+        else:
+            write(u' />')
+    if elem.tail:
+        write(_escape_text(elem.tail))
+
+
+def serialize_service(limb, namespaces):
+    """
+    Serializes a Service as ElementTree does, without the namespace declarations it puts on a subtree.
+
+    :param limb: (ElementTree.Element) the Service, whose tail is dropped
+    :param namespaces: (dict) ``{prefix: uri}`` of the document the Service is written to, updated
+       with any other namespace used by the Service
+    :return: (bytes) UTF-8 encoded XML of the Service, without tail
+
+    """
+    limb.tail = None
+    pieces = []
+    _serialize(pieces.append, limb, namespaces)
+    return u''.join(pieces).encode('utf-8')
+
+
+def service_namespaces(services):
+    """
+    Returns the namespaces ``serialize_service`` finds in Services, without serializing them.
+
+    :param services: (iterable of ElementTree.Element) the Services
+    :return: (dict) ``{prefix: uri}`` of the qualified tags and attribute names of the Services
+
+    """
+    namespaces = {}
+    for limb in services:
+        for elem in limb.iter():
+            if elem.tag[0] == '{':
+                _qualify(elem.tag, namespaces)
+            for key in elem.keys():
+                if key[0] == '{':
+                    _qualify(key, namespaces)
+    return namespaces
+
+
+def adopt_service(xml, limb_namespaces, namespaces):
+    """
+    Returns a Service serialized on its own as serialized in a document, binding its namespaces in
+    the document unless they clash with a prefix already bound to another namespace, in which case
+    the Service is serialized again with the prefixes of the document.
+
+    :param xml: (bytes) the Service, as returned by ``serialize_service``
+    :param limb_namespaces: (dict) ``{prefix: uri}`` used by ``xml``
+    :param namespaces: (dict) ``{prefix: uri}`` of the document, updated with those of the Service
+    :return: (bytes) the Service using the prefixes of ``namespaces``
+
+    """
+    for prefix, uri in limb_namespaces.items():
+        if namespaces.get(prefix, uri) != uri:
+            break
+    else:
+        namespaces.update(limb_namespaces)
+        return xml
+    declarations = b''.join(_declaration(prefix, uri) for prefix, uri in limb_namespaces.items())
+    return serialize_service(ET.fromstring(b'<Services' + declarations + b'>' + xml + b'</Services>')[0], namespaces)
+
+
+def _declaration(prefix, uri):
+    return ' xmlns:{prefix}="{uri}"'.format(prefix=prefix, uri=uri).encode('utf-8')
+
+
+def document_size(declarations, sizes):
+    """
+    Returns the size of the document ``MdfWriter`` writes, without writing it.
+
+    :param declarations: (list of tuple) ``(prefix, uri)`` namespaces declared on the root
+    :param sizes: (list of int) size of each serialized Service
+    :return: (int) bytes of the document
+
+    """
+    size = len(_HEAD) + sum(len(_declaration(prefix, uri)) for prefix, uri in declarations) + len(_ROOT_END)
+    if len(sizes) > 0:
+        size += sum(sizes) + len(SEPARATOR) * (len(sizes) - 1)
+    return size + len(_TAIL)
+
+
+def build_document(declarations, services):
+    """
+    Returns the document ``MdfWriter`` writes, built in memory.
+
+    :param declarations: (list of tuple) ``(prefix, uri)`` namespaces declared on the root
+    :param services: (list of bytes) serialized Services in the order written
+    :return: (bytes) the document
+
+    """
+    return b''.join([_HEAD] + [_declaration(prefix, uri) for prefix, uri in declarations] +
+                    [_ROOT_END, SEPARATOR.join(services), _TAIL])
+
+
+def replace_file(source, target):
+    """Renames ``source`` over ``target``, atomically where the platform supports it."""
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    else:
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+
+
+class MdfWriter(object):
+    """
+    Writes a merged message definition file one Service at a time.
+
+    Used as a context manager, the target is replaced on a clean exit and the temporary file is
+    removed if an exception is raised.
+
+    :param target: (string) path/filename of the merged output
+    :param declarations: (list of tuple) ``(prefix, uri)`` namespaces declared on the root, in order
+    :param buffering: (int) size of the output buffer in bytes
+
+    Attributes:
+
+        * ``services`` - (int) Services written
+        * ``bytes_written`` - (int) size of the document written so far
+
+    """
+    def __init__(self, target, declarations=(), buffering=WRITE_BUFFER):
+        self.target = target
+        self.declarations = list(declarations)
+        self.buffering = buffering
+        self.services = 0
+        self.bytes_written = 0
+        self._tmp = '{target}.{pid}.tmp'.format(target=target, pid=os.getpid())
+        self._out = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _open(self, path):
+        return open(path, 'wb', self.buffering)
+
+    def _write(self, data):
+        self._out.write(data)
+        self.bytes_written += len(data)
+
+    def open(self):
+        """
+        Creates the temporary file and writes the XML declaration and root start tag.
+
+        :return: (MdfWriter) self
+
+        """
+        self._out = self._open(self._tmp)
+        try:
+            head = [_HEAD]
+            for prefix, uri in self.declarations:
+                head.append(_declaration(prefix, uri))
+            head.append(_ROOT_END)
+            self._write(b''.join(head))
+        except BaseException:
+            self.abort()
+            raise
+        return self
+
+    def write(self, xml):
+        """
+        Writes a serialized Service.
+
+        :param xml: (bytes) as returned by ``serialize_service``
+
+        """
+        if self.services > 0:
+            self._write(SEPARATOR)
+        self._write(xml)
+        self.services += 1
+
+    def write_service(self, limb):
+        """
+        Serializes and writes a Service.
+
+        :param limb: (ElementTree.Element) the Service, whose namespaces must be declared on the root
+
+        """
+        self.write(serialize_service(limb, {}))
+
+    def close(self):
+        """Completes the document and replaces the target with it."""
+        try:
+            self._write(_TAIL)
+            self._out.close()
+            self._out = None
+            replace_file(self._tmp, self.target)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Removes the temporary file, leaving the target unchanged."""
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
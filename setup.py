@@ -27,6 +27,11 @@ setup(name='idp_mdf_merge',
           'sys',
           'os'
       ],
+      extras_require={
+          'batch': ['numpy'],
+          'lxml': ['lxml'],
+          'yaml': ['PyYAML']
+      },
       include_package_data=True,
       zip_safe=False,
       console=["idp_mdf_merge.py"],
@@ -0,0 +1,86 @@
+import glob
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks.payloads import sample_payloads
+from idp_mdf_merge.batch import decode_batch
+from idp_mdf_merge.codec import Codec, CodecError, RETURN
+
+np = pytest.importorskip('numpy')
+
+BUNDLED = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'idp_mdf_merge', 'mdf', '*.idpmsg')))
+
+SERVICE = """<Service xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <SIN>128</SIN>
+  <ReturnMessages>
+    <Message>
+      <Name>position</Name>
+      <MIN>1</MIN>
+      <Fields>
+        <Field xsi:type="SignedIntField"><Name>latitude</Name><Size>24</Size></Field>
+        <Field xsi:type="SignedIntField"><Name>longitude</Name><Size>25</Size></Field>
+        <Field xsi:type="BooleanField"><Name>moving</Name></Field>
+        <Field xsi:type="EnumField">
+          <Name>mode</Name>
+          <Items><string>off</string><string>on</string><string>auto</string></Items>
+        </Field>
+        <Field xsi:type="UnsignedIntField"><Name>speed</Name><Size>40</Size></Field>
+      </Fields>
+    </Message>
+  </ReturnMessages>
+</Service>"""
+
+
+def row(columns, n):
+    """Returns the values of row ``n`` of BatchColumns as decoded by a MessagePlan."""
+    values = {}
+    for name, column in columns.columns.items():
+        value = column[n]
+        if columns.vectorized:
+            value = value.item()
+            items = columns.items.get(name)
+            if items is not None:
+                value = items[value] if value < len(items) else value
+        if value is not None:
+            values[name] = value
+    return values
+
+
+def check_batch(codec, payloads):
+    """Checks that each payload decodes in a batch as decoded alone, and returns the BatchColumns."""
+    results = decode_batch(codec, payloads)
+    decoded = {}
+    errors = {}
+    for columns in results.values():
+        for n, position in enumerate(columns.indices.tolist()):
+            decoded[position] = row(columns, n)
+        errors.update(columns.errors)
+    assert set(decoded) | set(errors) == set(range(len(payloads)))
+    assert not set(decoded) & set(errors)
+    for position, payload in enumerate(payloads):
+        try:
+            expected = codec.decode(payload)[2]
+        except CodecError:
+            assert position in errors
+        else:
+            assert decoded[position] == expected
+    return results
+
+
+@pytest.mark.parametrize('filename', BUNDLED, ids=os.path.basename)
+def test_batch_matches_codec(filename):
+    codec = Codec.from_file(filename)
+    payloads = [payload for plan, values, payload in sample_payloads(codec, direction=RETURN)]
+    check_batch(codec, payloads + [b'\x80', b'\xff\xff\x00', payloads[0][:2]])
+
+
+def test_vectorized():
+    codec = Codec([ET.fromstring(SERVICE)])
+    payloads = [payload for plan, values, payload in sample_payloads(codec, variants=6)]
+    results = check_batch(codec, payloads + [payloads[0][:5]])
+    columns = results[(128, 1)]
+    assert columns.vectorized and len(columns) == 6
+    assert columns.columns['latitude'].dtype == np.int32 and columns.columns['speed'].dtype == np.uint64
+    assert columns.errors == [(6, 'Payload too short for SIN 128 MIN 1')]
@@ -0,0 +1,58 @@
+import glob
+import os
+
+from idp_mdf_merge.binary import BinaryDefinitions, binary_path, read_source
+from idp_mdf_merge.idp_mdf_merge import export_binary, get_backend, merge_mdf, target_stamp
+from idp_mdf_merge.model import Field, Message, load
+from idp_mdf_merge.registry import DIRECTIONS
+
+BUNDLED = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'idp_mdf_merge', 'mdf', '*.idpmsg')))
+
+
+def exported(definition):
+    """Returns a Message or Field as exported, without descriptions or default values."""
+    if isinstance(definition, Message):
+        return Message(definition.name, definition.min, fields=[exported(field) for field in definition.fields],
+                       hide=definition.hide)
+    return Field(definition.name, definition.type, size=definition.size, optional=definition.optional,
+                 fixed=definition.fixed, items=definition.items,
+                 fields=[exported(field) for field in definition.fields], sin=definition.sin, pin=definition.pin)
+
+
+def check_export(target):
+    """Checks that each message of the merged file ``target`` reads back from its binary export."""
+    expected = {}
+    for service in load(target):
+        for direction in DIRECTIONS:
+            for message in service.messages(direction):
+                if message.min is not None:
+                    expected.setdefault((service.sin, direction, message.min), message)
+    with BinaryDefinitions(binary_path(target)) as definitions:
+        assert definitions.source == target_stamp(target)
+        assert sorted(definitions.keys()) == sorted(expected)
+        for (sin, direction, min), message in expected.items():
+            assert definitions.message(sin, min, direction) == exported(message)
+        assert definitions.message(255, 255) is None
+    return len(expected)
+
+
+def test_round_trip(tmp_path):
+    target = str(tmp_path / 'merged.idpmsg')
+    merge_mdf(BUNDLED, target, binary=True)
+    assert check_export(target) > 0
+
+
+def test_stale_sidecar(tmp_path):
+    target = str(tmp_path / 'merged.idpmsg')
+    sidecar = binary_path(target)
+    merge_mdf(BUNDLED[:1], target, binary=True)
+    # the target merged again without its export leaves the sidecar stale
+    merge_mdf(BUNDLED, target)
+    assert read_source(sidecar) is not None and read_source(sidecar) != target_stamp(target)
+    merge_mdf(BUNDLED, target, binary=True)
+    check_export(target)
+    # an export up to date with its target is not written again
+    written = os.stat(sidecar).st_mtime
+    os.utime(sidecar, (written - 10, written - 10))
+    export_binary(target, get_backend(), [])
+    assert os.stat(sidecar).st_mtime == written - 10
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from idp_mdf_merge.binary import binary_path
+from idp_mdf_merge.bundle import Bundle, merge_bundles, read_bundles
+from idp_mdf_merge.idp_mdf_merge import merge_mdf
+from idp_mdf_merge.registry import ERROR, UNION
+
+SOURCE = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Services>
+    <Service>
+      <Name>{name}</Name>
+      <SIN>250</SIN>
+      <ReturnMessages>
+        <Message>
+          <Name>{name}</Name>
+          <MIN>1</MIN>
+          <Fields>
+            <Field xsi:type="UnsignedIntField"><Name>speed</Name><Size>{size}</Size></Field>
+          </Fields>
+        </Message>
+      </ReturnMessages>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+
+def write_source(tmp_path, name, size=8):
+    """Writes a file of SIN 250 with one Message named ``name`` and returns its path."""
+    filename = tmp_path / (name + '.idpmsg')
+    filename.write_text(SOURCE.format(name=name, size=size))
+    return str(filename)
+
+
+def merged(target):
+    with open(target, 'rb') as f:
+        return f.read()
+
+
+def test_options_passed_through(tmp_path):
+    first = write_source(tmp_path, 'first')
+    second = write_source(tmp_path, 'second', size=40)
+    options = [{}, {'conflicts': UNION}, {'conflicts': ERROR}, {'validate': True}, {'binary': True}]
+    bundles = [Bundle(str(tmp_path / 'bundle{}.idpmsg'.format(n)), [first, second], **bundle_options)
+               for n, bundle_options in enumerate(options)]
+    report = merge_bundles(bundles, workers=2)
+    assert report.sources == 4
+    for n, (bundle, bundle_options) in enumerate(zip(bundles, options)):
+        single = str(tmp_path / 'single{}.idpmsg'.format(n))
+        expected = merge_mdf([first, second], single, **bundle_options)
+        assert report.errors[n] == expected.replace(single, bundle.target)
+        if bundle_options.get('conflicts') == ERROR:
+            assert not os.path.exists(bundle.target)
+        else:
+            assert merged(bundle.target) == merged(single)
+    assert 'not written' in report.errors[2] and 'Size 40' in report.errors[3]
+    assert os.path.isfile(binary_path(bundles[4].target)) and not os.path.exists(binary_path(bundles[0].target))
+
+
+def test_manifest_options(tmp_path):
+    write_source(tmp_path, 'first')
+    manifest = tmp_path / 'bundles.json'
+    manifest.write_text(json.dumps({
+        'defaults': {'conflicts': UNION, 'validate': True},
+        'bundles': [{'target': 'a.idpmsg', 'files': ['first.idpmsg']},
+                    {'target': 'b.idpmsg', 'files': ['first.idpmsg'], 'conflicts': ERROR, 'binary': True}],
+    }))
+    a, b = read_bundles(str(manifest))
+    assert (a.conflicts, a.validate, a.binary) == (UNION, True, False)
+    assert (b.conflicts, b.validate, b.binary) == (ERROR, True, True)
+    manifest.write_text(json.dumps([{'target': 'a.idpmsg', 'files': ['first.idpmsg'], 'conflicts': 'newest'}]))
+    with pytest.raises(ValueError, match='unknown conflict policy newest'):
+        read_bundles(str(manifest))
@@ -0,0 +1,167 @@
+import glob
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks.payloads import sample_payloads
+from idp_mdf_merge.codec import Codec, CodecError, compile_message
+
+BUNDLED = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'idp_mdf_merge', 'mdf', '*.idpmsg')))
+
+SERVICE = """<Service xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <SIN>128</SIN>
+  <ReturnMessages>
+    <Message>
+      <Name>report</Name>
+      <MIN>1</MIN>
+      <Fields>
+        <Field xsi:type="UnsignedIntField"><Name>speed</Name><Size>8</Size></Field>
+        <Field xsi:type="SignedIntField"><Name>offset</Name><Size>4</Size></Field>
+        <Field xsi:type="BooleanField"><Name>moving</Name></Field>
+        <Field xsi:type="EnumField">
+          <Name>mode</Name>
+          <Items><string>off</string><string>on</string><string>auto</string></Items>
+        </Field>
+        <Field xsi:type="StringField"><Name>label</Name><Size>10</Size><Optional>true</Optional></Field>
+        <Field xsi:type="ArrayField">
+          <Name>samples</Name>
+          <Size>4</Size>
+          <Fields><Field xsi:type="DataField"><Name>raw</Name><Size>2</Size><Fixed>true</Fixed></Field></Fields>
+        </Field>
+      </Fields>
+    </Message>
+    <Message>
+      <Name>properties</Name>
+      <MIN>2</MIN>
+      <Fields>
+        <Field xsi:type="DynamicField"><Name>value</Name></Field>
+        <Field xsi:type="PropertyField"><Name>latitude</Name><SIN>20</SIN><PIN>6</PIN></Field>
+        <Field xsi:type="MessageField"><Name>log</Name></Field>
+      </Fields>
+    </Message>
+  </ReturnMessages>
+</Service>"""
+
+
+@pytest.fixture
+def codec():
+    return Codec([ET.fromstring(SERVICE)])
+
+
+def test_layout(codec):
+    payload = codec.encode(128, 1, {'speed': 10, 'offset': -1, 'moving': True, 'mode': 'auto', 'samples': []})
+    # SIN, MIN, speed 8 bits, offset 1111, moving 1, mode 10, label absent 0, samples length prefix 0x00
+    assert payload == bytes(bytearray([128, 1, 10, 0xfc, 0x00]))
+    assert codec.decode(payload) == (128, 1, {'speed': 10, 'offset': -1, 'moving': True, 'mode': 'auto',
+                                              'samples': []})
+
+
+def test_round_trip(codec):
+    values = {'speed': 255, 'offset': -8, 'moving': False, 'mode': 'on', 'label': u'abc',
+              'samples': [{'raw': b'\x01\x02'}, {'raw': b'\xff\x00'}]}
+    assert codec.decode(codec.encode(128, 1, values))[2] == values
+
+
+def test_unsupported(codec):
+    assert list(codec.unsupported) == [(128, 'ReturnMessages', 2)]
+    assert 'DynamicField value has no static layout' in codec.unsupported[(128, 'ReturnMessages', 2)]
+    with pytest.raises(CodecError):
+        codec.encode(128, 2, {})
+    with pytest.raises(CodecError):
+        codec.decode(b'\x80\x02\x00')
+
+
+def single(field):
+    """Returns a Codec of message SIN 128 MIN 3 with the single Field given as XML."""
+    return Codec([ET.fromstring('<Service xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><SIN>128</SIN>'
+                                '<ReturnMessages><Message><Name>single</Name><MIN>3</MIN><Fields>' + field +
+                                '</Fields></Message></ReturnMessages></Service>')])
+
+
+ITEMS = '<Items><string>off</string><string>on</string><string>auto</string></Items>'
+
+
+@pytest.mark.parametrize('field, value, payload', [
+    # 2-bit Enum derived from 3 Items: 01
+    ('<Field xsi:type="EnumField"><Name>f</Name>' + ITEMS + '</Field>', 'on', [0x40]),
+    ('<Field xsi:type="EnumField"><Name>f</Name><Size>4</Size>' + ITEMS + '</Field>', 'auto', [0x20]),
+    ('<Field xsi:type="BooleanField"><Name>f</Name></Field>', True, [0x80]),
+    ('<Field xsi:type="UnsignedIntField"><Name>f</Name><Size>12</Size></Field>', 0xabc, [0xab, 0xc0]),
+    # 6-bit two's complement: 111101
+    ('<Field xsi:type="SignedIntField"><Name>f</Name><Size>6</Size></Field>', -3, [0xf4]),
+    ('<Field xsi:type="StringField"><Name>f</Name><Size>10</Size></Field>', u'hi', [0x02, 0x68, 0x69]),
+    ('<Field xsi:type="StringField"><Name>f</Name><Size>4</Size><Fixed>true</Fixed></Field>', u'hi',
+     [0x68, 0x69, 0x00, 0x00]),
+    # length 130 takes the 16-bit prefix 1 + 000000010000010
+    ('<Field xsi:type="DataField"><Name>f</Name><Size>200</Size></Field>', b'\x01' * 130, [0x80, 0x82] + [0x01] * 130),
+    ('<Field xsi:type="DataField"><Name>f</Name><Size>2</Size><Fixed>true</Fixed></Field>', b'\xff\x01',
+     [0xff, 0x01]),
+    ('<Field xsi:type="ArrayField"><Name>f</Name><Size>3</Size><Fields><Field xsi:type="UnsignedIntField">'
+     '<Name>n</Name><Size>4</Size></Field></Fields></Field>', [{'n': 1}, {'n': 2}], [0x02, 0x12]),
+    ('<Field xsi:type="ArrayField"><Name>f</Name><Size>2</Size><Fixed>true</Fixed><Fields>'
+     '<Field xsi:type="BooleanField"><Name>b</Name></Field></Fields></Field>', [{'b': True}, {'b': False}], [0x80]),
+    # presence flag 1 then 00000101
+    ('<Field xsi:type="UnsignedIntField"><Name>f</Name><Size>8</Size><Optional>true</Optional></Field>', 5,
+     [0x82, 0x80]),
+    ('<Field xsi:type="UnsignedIntField"><Name>f</Name><Size>8</Size><Optional>true</Optional></Field>', None,
+     [0x00]),
+])
+def test_field_payload(field, value, payload):
+    codec = single(field)
+    values = {} if value is None else {'f': value}
+    expected = bytes(bytearray([128, 3] + payload))
+    assert codec.encode(128, 3, values) == expected
+    assert codec.decode(expected) == (128, 3, values)
+
+
+def test_enum_index():
+    codec = single('<Field xsi:type="EnumField"><Name>f</Name>' + ITEMS + '</Field>')
+    assert codec.encode(128, 3, {'f': 2}) == codec.encode(128, 3, {'f': 'auto'})
+
+
+def test_string_padding():
+    fixed = single('<Field xsi:type="StringField"><Name>f</Name><Size>4</Size><Fixed>true</Fixed></Field>')
+    assert fixed.decode(b'\x80\x03a\x00\x00\x00')[2] == {'f': u'a'}
+    variable = single('<Field xsi:type="StringField"><Name>f</Name><Size>4</Size></Field>')
+    assert variable.decode(variable.encode(128, 3, {'f': u'a\x00'}))[2] == {'f': u'a\x00'}
+
+
+def test_size_beyond_length_prefix():
+    codec = single('<Field xsi:type="DataField"><Name>f</Name><Size>40000</Size></Field>')
+    assert 'exceeds the length prefix' in codec.unsupported[(128, 'ReturnMessages', 3)]
+    codec = single('<Field xsi:type="DataField"><Name>f</Name><Size>40000</Size><Fixed>true</Fixed></Field>')
+    assert codec.unsupported == {}
+
+
+@pytest.mark.parametrize('values', [
+    {'speed': 256, 'offset': 0, 'moving': True, 'mode': 'off', 'samples': []},
+    {'speed': 0, 'offset': 8, 'moving': True, 'mode': 'off', 'samples': []},
+    {'speed': 0, 'offset': 0, 'moving': True, 'mode': 'missing', 'samples': []},
+    {'speed': 0, 'offset': 0, 'moving': True, 'mode': 'off', 'samples': [{'raw': b'a'}] * 5},
+    {'offset': 0, 'moving': True, 'mode': 'off', 'samples': []},
+])
+def test_invalid_values(codec, values):
+    with pytest.raises(CodecError):
+        codec.encode(128, 1, values)
+
+
+def test_short_payload(codec):
+    with pytest.raises(CodecError):
+        codec.decode(b'\x80\x01\x0a')
+
+
+def test_invalid_size():
+    message = ET.fromstring('<Message xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><Name>m</Name>'
+                            '<MIN>1</MIN><Fields><Field xsi:type="UnsignedIntField"><Name>f</Name>'
+                            '<Size>x</Size></Field></Fields></Message>')
+    with pytest.raises(CodecError):
+        compile_message(message, 128)
+
+
+@pytest.mark.parametrize('filename', BUNDLED, ids=os.path.basename)
+def test_bundled_round_trip(filename):
+    codec = Codec.from_file(filename)
+    assert all('has no static layout' in reason for reason in codec.unsupported.values())
+    for plan, values, payload in sample_payloads(codec):
+        assert codec.decode(payload, plan.direction) == (plan.sin, plan.min, values)
@@ -0,0 +1,125 @@
+import pytest
+
+from idp_mdf_merge.diff import ADDED, MODIFIED, REMOVED, Snapshot, diff, diff_files
+
+OLD = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Services>
+    <Service>
+      <Name>tracking</Name>
+      <SIN>128</SIN>
+      <ReturnMessages>
+        <Message>
+          <Name>position</Name>
+          <MIN>1</MIN>
+          <Fields>
+            <Field xsi:type="SignedIntField"><Name>latitude</Name><Size>24</Size></Field>
+            <Field xsi:type="SignedIntField"><Name>longitude</Name><Size>25</Size></Field>
+            <Field xsi:type="UnsignedIntField"><Name>heading</Name><Size>9</Size></Field>
+          </Fields>
+        </Message>
+        <Message>
+          <Name>status</Name>
+          <MIN>2</MIN>
+          <Fields>
+            <Field xsi:type="EnumField">
+              <Name>mode</Name>
+              <Size>2</Size>
+              <Items><string>off</string><string>on</string></Items>
+            </Field>
+          </Fields>
+        </Message>
+      </ReturnMessages>
+    </Service>
+    <Service>
+      <Name>retired</Name>
+      <SIN>129</SIN>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+# Services and Messages reordered, reformatted
+SHUFFLED = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><Services>
+<Service><Name>retired</Name><SIN>129</SIN></Service>
+<Service><Name>tracking</Name><SIN>128</SIN><ReturnMessages>
+<Message><Name>status</Name><MIN>2</MIN><Fields><Field xsi:type="EnumField"><Name>mode</Name><Size>2</Size>
+<Items><string>off</string><string>on</string></Items></Field></Fields></Message>
+<Message><Name>position</Name><MIN>1</MIN><Fields>
+<Field xsi:type="SignedIntField"><Name>latitude</Name><Size>24</Size></Field>
+<Field xsi:type="SignedIntField"><Name>longitude</Name><Size>25</Size></Field>
+<Field xsi:type="UnsignedIntField"><Name>heading</Name><Size>9</Size></Field>
+</Fields></Message>
+</ReturnMessages></Service>
+</Services></MessageDefinition>
+"""
+
+
+def write(tmp_path, name, text):
+    filename = tmp_path / name
+    filename.write_text(text)
+    return str(filename)
+
+
+def changes(tmp_path, new, old=OLD, descriptions=True):
+    """Returns the changes from ``old`` to ``new`` as text."""
+    return [str(change) for change in diff_files(write(tmp_path, 'old.idpmsg', old), write(tmp_path, 'new.idpmsg', new),
+                                                 descriptions=descriptions)]
+
+
+def test_unchanged(tmp_path):
+    assert changes(tmp_path, OLD) == []
+    assert changes(tmp_path, SHUFFLED) == []
+
+
+def test_added_and_removed(tmp_path):
+    new = OLD.replace('<SIN>129</SIN>', '<SIN>130</SIN>').replace('<MIN>2</MIN>', '<MIN>3</MIN>')
+    result = diff_files(write(tmp_path, 'old.idpmsg', OLD), write(tmp_path, 'new.idpmsg', new))
+    assert [str(change) for change in result] == [
+        'removed SIN 128 ReturnMessages MIN 2',
+        'added SIN 128 ReturnMessages MIN 3',
+        'removed SIN 129',
+        'added SIN 130',
+    ]
+    assert [(change.kind, change.sin, change.min) for change in result] == [
+        (REMOVED, 128, 2), (ADDED, 128, 3), (REMOVED, 129, None), (ADDED, 130, None)]
+
+
+def test_fields_added_removed_and_modified(tmp_path):
+    new = (OLD.replace('<Name>heading</Name><Size>9</Size>', '<Name>heading</Name><Size>10</Size>')
+              .replace('<Field xsi:type="SignedIntField"><Name>longitude</Name><Size>25</Size></Field>',
+                       '<Field xsi:type="BooleanField"><Name>valid</Name></Field>')
+              .replace('<string>on</string>', '<string>on</string><string>auto</string>'))
+    assert changes(tmp_path, new) == [
+        'removed SIN 128 ReturnMessages MIN 1 field longitude',
+        'added SIN 128 ReturnMessages MIN 1 field valid',
+        'modified SIN 128 ReturnMessages MIN 1 field heading: size 9 -> 10',
+        "modified SIN 128 ReturnMessages MIN 2 field mode: items ['off', 'on'] -> ['off', 'on', 'auto']",
+    ]
+
+
+def test_fields_reordered(tmp_path):
+    latitude = '<Field xsi:type="SignedIntField"><Name>latitude</Name><Size>24</Size></Field>'
+    longitude = '<Field xsi:type="SignedIntField"><Name>longitude</Name><Size>25</Size></Field>'
+    new = OLD.replace(latitude, 'LATITUDE').replace(longitude, latitude).replace('LATITUDE', longitude)
+    result = diff_files(write(tmp_path, 'old.idpmsg', OLD), write(tmp_path, 'new.idpmsg', new))
+    assert [str(change) for change in result] == ['modified SIN 128 ReturnMessages MIN 1: fields reordered']
+    assert (result[0].kind, result[0].field) == (MODIFIED, None)
+
+
+def test_service_and_message_renamed(tmp_path):
+    new = OLD.replace('<Name>tracking</Name>', '<Name>tracker</Name>').replace('<Name>status</Name>',
+                                                                               '<Name>state</Name>')
+    assert changes(tmp_path, new) == [
+        'modified SIN 128: name tracking -> tracker',
+        'modified SIN 128 ReturnMessages MIN 2: name status -> state',
+    ]
+
+
+def test_descriptions(tmp_path):
+    new = OLD.replace('<Name>heading</Name>', '<Name>heading</Name><Description>degrees</Description>')
+    assert changes(tmp_path, new) == ['modified SIN 128 ReturnMessages MIN 1 field heading: description']
+    assert changes(tmp_path, new, descriptions=False) == []
+    with pytest.raises(ValueError):
+        diff(Snapshot([], descriptions=True), Snapshot([], descriptions=False))
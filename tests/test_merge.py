@@ -0,0 +1,198 @@
+import glob
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmarks.generator import generate_set
+from idp_mdf_merge.idp_mdf_merge import merge_mdf
+from idp_mdf_merge.registry import ERROR, FIRST, LAST, UNION
+
+BUNDLED = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'idp_mdf_merge', 'mdf', '*.idpmsg')))
+
+HEAD = ('<?xml version="1.0" encoding="utf-8"?>\n'
+        '<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema">\n'
+        '  <Services>\n')
+TAIL = '  </Services>\n</MessageDefinition>\n'
+
+
+def write_mdf(filename, *services):
+    """Writes a message definition file of Services given as ``(sin, name)`` and returns its path."""
+    with open(str(filename), 'w') as f:
+        f.write(HEAD)
+        for sin, name in services:
+            f.write('    <Service>\n      <Name>{}</Name>\n      <SIN>{}</SIN>\n    </Service>\n'.format(name, sin))
+        f.write(TAIL)
+    return str(filename)
+
+
+def merged(files, target, **options):
+    """Merges ``files`` into ``target`` and returns the error description and merged bytes."""
+    error = merge_mdf(files, str(target), **options)
+    with open(str(target), 'rb') as f:
+        return error, f.read()
+
+
+def test_workers_identical_to_serial(tmp_path):
+    # the large first file finishes after the small duplicate of its first SIN
+    large = generate_set(str(tmp_path / 'large'), services=200, messages=4, first_sin=128)
+    small = write_mdf(tmp_path / 'small.idpmsg', (128, 'later'), (20, 'extra'))
+    files = large + [small] + BUNDLED
+    serial_error, serial = merged(files, tmp_path / 'serial.idpmsg')
+    pooled_error, pooled = merged(files, tmp_path / 'pooled.idpmsg', workers=3)
+    assert pooled == serial
+    assert pooled_error == serial_error
+    assert b'<Name>synthetic128</Name>' in pooled and b'<Name>later</Name>' not in pooled
+    assert 'ignoring SIN 128' in pooled_error
+
+
+def test_incremental_matches_full_merge(tmp_path):
+    inputs = generate_set(str(tmp_path / 'set'), files=3, services=20, messages=3, first_sin=128)
+    small = write_mdf(tmp_path / 'small.idpmsg', (20, 'extra'), (140, 'duplicate'))
+    files = inputs + [small] + BUNDLED
+    target = tmp_path / 'incremental.idpmsg'
+    assert merged(files, target, incremental=True) == merged(files, tmp_path / 'full.idpmsg')
+    # one changed file: a Service renamed, one removed and a duplicate of a Service of the first file
+    write_mdf(small, (21, 'renamed'), (128, 'duplicate'))
+    with open(inputs[1]) as f:
+        text = f.read()
+    with open(inputs[1], 'w') as f:
+        f.write(text.replace('<Name>synthetic150</Name>', '<Name>changed150</Name>'))
+    error, incremental = merged(files, target, incremental=True)
+    assert (error, incremental) == merged(files, tmp_path / 'full.idpmsg')
+    assert b'<Name>changed150</Name>' in incremental and b'<Name>renamed</Name>' in incremental
+    assert b'<Name>extra</Name>' not in incremental
+
+
+def test_resident_manifest_matches_full_merge(tmp_path):
+    small = write_mdf(tmp_path / 'small.idpmsg', (20, 'extra'))
+    files = [small] + BUNDLED
+    manifest = {}
+    target = tmp_path / 'incremental.idpmsg'
+    assert merged(files, target, incremental=manifest) == merged(files, tmp_path / 'full.idpmsg')
+    write_mdf(small, (20, 'renamed'), (21, 'added'))
+    assert merged(files, target, incremental=manifest) == merged(files, tmp_path / 'full.idpmsg')
+
+
+FOREIGN = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:p="{uri}">
+  <Services>
+    <Service p:origin="{name}">
+      <Name>{name}</Name>
+      <SIN>{sin}</SIN>
+      <ReturnMessages>
+        <Message>
+          <Name>report</Name>
+          <MIN>1</MIN>
+          <Fields><Field xsi:type="BooleanField" p:note="{name}"><Name>moving</Name></Field></Fields>
+        </Message>
+      </ReturnMessages>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+
+@pytest.mark.parametrize('options', [{}, {'stream': True}, {'workers': 2}, {'incremental': {}}, {'conflicts': LAST}],
+                         ids=['tree', 'stream', 'workers', 'incremental', 'last'])
+def test_foreign_namespaces(tmp_path, options):
+    files = []
+    for sin, name, uri in ((128, 'first', 'urn:a'), (129, 'second', 'urn:b'), (128, 'third', 'urn:c')):
+        files.append(str(tmp_path / (name + '.idpmsg')))
+        with open(files[-1], 'w') as f:
+            f.write(FOREIGN.format(uri=uri, name=name, sin=sin))
+    error, xml = merged(files, tmp_path / 'merged.idpmsg', backend='etree', **options)
+    services = ET.fromstring(xml).find('Services')
+    kept = 'third' if options.get('conflicts') == LAST else 'first'
+    uri = 'urn:c' if kept == 'third' else 'urn:a'
+    assert [service.attrib for service in services] == [{'{' + uri + '}origin': kept}, {'{urn:b}origin': 'second'}]
+    assert [field.get('{urn:b}note') for field in services[1].iter('Field')] == ['second']
+
+
+def test_backends_identical(tmp_path):
+    pytest.importorskip('lxml')
+    odd = str(tmp_path / 'odd.idpmsg')
+    with open(odd, 'w') as f:
+        # empty elements, and '/>' in text and in an attribute value
+        f.write(FOREIGN.format(uri='urn:a', name='a/&gt;b', sin=250).replace('<Fields>',
+                                                                             '<Fields><Field /><Field p:x="/&gt;"/>'))
+    files = BUNDLED + [odd]
+    assert merged(files, tmp_path / 'lxml.idpmsg', backend='lxml') == merged(files, tmp_path / 'etree.idpmsg')
+    assert merged(files, tmp_path / 'lxml.idpmsg', backend='lxml', stream=True) == merged(files,
+                                                                                           tmp_path / 'etree.idpmsg')
+    with open(str(tmp_path / 'lxml.idpmsg'), 'rb') as f:
+        xml = f.read()
+    assert b'<Name>a/&gt;b</Name>' in xml and b'<Field />' in xml and b':x="/&gt;" />' in xml
+
+
+MESSAGES = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Services>
+    <Service>
+      <Name>{name}</Name>
+      <SIN>250</SIN>
+      <ReturnMessages>{messages}</ReturnMessages>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+
+def write_messages(filename, name, *messages):
+    """Writes a file of SIN 250 with return Messages given as ``(min, name)`` and returns its path."""
+    with open(str(filename), 'w') as f:
+        f.write(MESSAGES.format(name=name, messages=''.join(
+            '\n        <Message><Name>{}</Name><MIN>{}</MIN></Message>'.format(message, min) for min, message in messages)))
+    return str(filename)
+
+
+def merged_messages(xml):
+    """Returns the Name of the Service of SIN 250 and ``(min, name)`` of each of its return Messages."""
+    service = ET.fromstring(xml).find('Services/Service')
+    return service.findtext('Name'), [(int(message.findtext('MIN')), message.findtext('Name'))
+                                      for message in service.find('ReturnMessages')]
+
+
+@pytest.mark.parametrize('mode', [{}, {'stream': True}, {'workers': 2}, {'incremental': {}}],
+                         ids=['tree', 'stream', 'workers', 'incremental'])
+@pytest.mark.parametrize('conflicts', [FIRST, LAST, UNION, ERROR])
+def test_conflict_policies(tmp_path, mode, conflicts):
+    a = write_messages(tmp_path / 'a.idpmsg', 'a', (1, 'a-1'), (3, 'a-3'))
+    # MIN 1 conflicts with the first file, MIN 3 is the same message indented otherwise
+    b = write_messages(tmp_path / 'b.idpmsg', 'b', (1, 'b-1'), (2, 'b-2'))
+    with open(b) as f:
+        text = f.read()
+    with open(b, 'w') as f:
+        f.write(text.replace('</ReturnMessages>', '<Message>\n  <Name>a-3</Name>\n  <MIN>3</MIN>\n</Message>'
+                                                  '</ReturnMessages>'))
+    target = tmp_path / 'merged.idpmsg'
+    error = merge_mdf([a, b], str(target), conflicts=conflicts, **mode)
+    if conflicts == ERROR:
+        assert error == ('ERROR: Found conflicting MIN 1 in ReturnMessages of SIN 250 in "{b}"\n'
+                         'ERROR: Conflicting message definitions - {target} not written'.format(b=b, target=target))
+        assert not target.exists()
+        return
+    with open(str(target), 'rb') as f:
+        name, messages = merged_messages(f.read())
+    if conflicts == FIRST:
+        assert (name, messages) == ('a', [(1, 'a-1'), (3, 'a-3')])
+        assert error == 'WARNING: Found duplicate SIN in "{}" Services - ignoring SIN 250'.format(b)
+    elif conflicts == LAST:
+        assert (name, messages) == ('b', [(1, 'b-1'), (2, 'b-2'), (3, 'a-3')])
+        assert error == 'WARNING: Found duplicate SIN in "{}" Services - replacing SIN 250'.format(b)
+    else:
+        # the identical MIN 3 collapses into one message without a conflict
+        assert (name, messages) == ('a', [(1, 'a-1'), (3, 'a-3'), (2, 'b-2')])
+        assert error == ('WARNING: Found conflicting MIN 1 in ReturnMessages of SIN 250 in "{}" '
+                         '- keeping the first'.format(b))
+
+
+@pytest.mark.parametrize('conflicts', [UNION, ERROR])
+def test_identical_messages_collapse(tmp_path, conflicts):
+    a = write_messages(tmp_path / 'a.idpmsg', 'a', (1, 'a-1'), (2, 'a-2'))
+    again = write_messages(tmp_path / 'again.idpmsg', 'a', (2, 'a-2'))
+    error, xml = merged([a, again], tmp_path / 'merged.idpmsg', conflicts=conflicts)
+    assert error is None
+    assert merged_messages(xml) == ('a', [(1, 'a-1'), (2, 'a-2')])
+    assert xml == merged([a], tmp_path / 'single.idpmsg')[1]
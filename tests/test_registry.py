@@ -0,0 +1,111 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from idp_mdf_merge.registry import ServiceRegistry, FIRST, LAST, UNION, ERROR, FORWARD, RETURN
+
+
+def service(sin, name, forward=(), returned=()):
+    """Returns a Service element with a message named ``<name>-<min>`` per MIN of each direction."""
+    elem = ET.Element('Service')
+    ET.SubElement(elem, 'SIN').text = str(sin)
+    ET.SubElement(elem, 'Name').text = name
+    for direction, mins in ((FORWARD, forward), (RETURN, returned)):
+        if mins:
+            messages = ET.SubElement(elem, direction)
+            for min in mins:
+                message = ET.SubElement(messages, 'Message')
+                ET.SubElement(message, 'Name').text = '{}-{}'.format(name, min)
+                ET.SubElement(message, 'MIN').text = str(min)
+    return elem
+
+
+def message_names(registry):
+    return [(sin, direction, min, message.findtext('Name')) for sin, direction, min, message in registry.messages()]
+
+
+def test_insertion_order_and_indexed():
+    registry = ServiceRegistry()
+    registry.add(service(130, 'b', returned=[1]))
+    registry.add(service(128, 'a', forward=[1], returned=[1, 2]))
+    assert registry.sins() == [130, 128]
+    assert [s.findtext('Name') for s in registry] == ['b', 'a']
+    assert [s.findtext('Name') for s in registry.by_sin()] == ['a', 'b']
+    assert len(registry) == 2
+    assert registry.message(128, 2).findtext('Name') == 'a-2'
+    assert registry.message(128, 1, FORWARD).findtext('Name') == 'a-1'
+    assert registry.message(128, 3) is None
+    assert 130 in registry and 129 not in registry
+
+
+def test_duplicate_min():
+    registry = ServiceRegistry()
+    registry.add(service(128, 'a', returned=[1, 1]))
+    assert registry.duplicate_mins == [(128, RETURN, 1)]
+
+
+def test_duplicate_sin_compared_as_integer():
+    registry = ServiceRegistry()
+    registry.add(service(16, 'a'))
+    assert not registry.add(service('016', 'b'))
+    assert registry.duplicate_sins == [16]
+    assert registry.service('16').findtext('Name') == 'a'
+
+
+def test_by_sin_after_adding():
+    registry = ServiceRegistry()
+    registry.add(service(130, 'b'))
+    registry.add(service(128, 'a'))
+    registry.add(service(129, 'c'))
+    assert [s.findtext('Name') for s in registry.by_sin()] == ['a', 'c', 'b']
+
+
+def test_first():
+    registry = ServiceRegistry()
+    assert registry.add(service(128, 'a', returned=[1]))
+    assert not registry.add(service(128, 'b', returned=[1, 2]), FIRST)
+    assert registry.service(128).findtext('Name') == 'a'
+    assert message_names(registry) == [(128, RETURN, 1, 'a-1')]
+    assert registry.duplicate_sins == [128]
+
+
+def test_last():
+    registry = ServiceRegistry()
+    registry.add(service(128, 'a', returned=[1, 3]))
+    assert registry.add(service(128, 'b', returned=[1, 2]), LAST)
+    assert registry.service(128).findtext('Name') == 'b'
+    assert message_names(registry) == [(128, RETURN, 1, 'b-1'), (128, RETURN, 2, 'b-2')]
+    assert registry.duplicate_sins == [128]
+
+
+def test_last_identical():
+    registry = ServiceRegistry()
+    first = service(128, 'a', returned=[1])
+    registry.add(first)
+    assert not registry.add(service(128, 'a', returned=[1]), LAST)
+    assert registry.service(128) is first
+    assert registry.duplicate_sins == [128]
+
+
+@pytest.mark.parametrize('policy', [UNION, ERROR])
+def test_union(policy):
+    registry = ServiceRegistry()
+    registry.add(service(128, 'a', returned=[1]))
+    assert registry.add(service(128, 'b', forward=[1], returned=[1, 2]), policy)
+    assert registry.service(128).findtext('Name') == 'a'
+    assert message_names(registry) == [(128, FORWARD, 1, 'b-1'), (128, RETURN, 1, 'a-1'), (128, RETURN, 2, 'b-2')]
+    assert [m.tag for m in registry.service(128)] == ['SIN', 'Name', FORWARD, RETURN]
+    assert registry.conflicts == [(128, RETURN, 1)]
+
+
+def test_union_identical_message_is_not_a_conflict():
+    registry = ServiceRegistry()
+    registry.add(service(128, 'a', returned=[1]))
+    assert not registry.add(service(128, 'a', returned=[1]), UNION)
+    assert registry.conflicts == []
+    assert registry.duplicate_sins == [128]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ServiceRegistry().add(service(128, 'a'), 'newest')
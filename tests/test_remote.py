@@ -0,0 +1,105 @@
+import os
+import threading
+
+import pytest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from idp_mdf_merge.remote import RemoteError, RemoteFetcher
+
+BODY = b'<?xml version="1.0" encoding="utf-8"?>\n<MessageDefinition><Services /></MessageDefinition>\n'
+LAST_MODIFIED = 'Fri, 16 Oct 2026 12:00:00 GMT'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves ``BODY`` at any path with an ETag and Last-Modified, answering 304 if either matches."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.received.append(dict((key.lower(), value) for key, value in self.headers.items()))
+        if self.server.etag is not None:
+            unchanged = self.headers.get('If-None-Match') == self.server.etag
+        else:
+            unchanged = self.headers.get('If-Modified-Since') == LAST_MODIFIED
+        if unchanged:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.server.etag is not None:
+            self.send_header('ETag', self.server.etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """Server handling each kept-alive connection on its own thread."""
+    daemon_threads = True
+
+
+@pytest.fixture(params=['"v1"', None], ids=['etag', 'last-modified'])
+def server(request):
+    server = Server(('127.0.0.1', 0), Handler)
+    server.etag = request.param
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server, path='/defs.idpmsg'):
+    return 'http://127.0.0.1:{port}{path}'.format(port=server.server_address[1], path=path)
+
+
+def test_fetch_and_revalidate(server, tmp_path):
+    fetcher = RemoteFetcher(str(tmp_path), timeout=5)
+    path = fetcher.fetch(url(server))
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert (fetcher.requests, fetcher.not_modified) == (1, 0)
+    assert fetcher.fetch(url(server)) == path
+    assert (fetcher.requests, fetcher.not_modified) == (2, 1)
+    if server.etag is not None:
+        assert server.received[1]['if-none-match'] == server.etag
+    assert server.received[1]['if-modified-since'] == LAST_MODIFIED
+    assert fetcher.connections == 1
+    fetcher.close()
+
+
+def test_fetch_all_requests_each_url_once(server, tmp_path):
+    fetcher = RemoteFetcher(str(tmp_path), workers=4, timeout=5)
+    urls = [url(server, '/a.idpmsg'), url(server, '/b.idpmsg'), url(server, '/a.idpmsg')]
+    paths, errors = fetcher.fetch_all(urls)
+    assert errors == {}
+    assert sorted(paths) == sorted(set(urls)) and fetcher.requests == 2
+    fetcher.close()
+
+
+def test_offline_uses_local_copy(server, tmp_path):
+    fetcher = RemoteFetcher(str(tmp_path), timeout=5)
+    path = fetcher.fetch(url(server))
+    fetcher.close()
+    server.shutdown()
+    server.server_close()
+    # a later run with the same local copies
+    fetcher = RemoteFetcher(str(tmp_path), timeout=5)
+    assert fetcher.fetch(url(server)) == path
+    assert url(server) in fetcher.offline
+    with pytest.raises(RemoteError):
+        fetcher.fetch(url(server, '/never.idpmsg'))
+    assert os.path.isfile(path)
+    fetcher.close()
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from idp_mdf_merge.idp_mdf_merge import export_binary, get_backend
+from idp_mdf_merge.replay import ReplayDecoder, replay_log
+
+DEFINITIONS = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Services>
+    <Service>
+      <Name>tracking</Name>
+      <SIN>128</SIN>
+      <ReturnMessages>
+        <Message>
+          <Name>speed</Name>
+          <MIN>1</MIN>
+          <Fields>
+            <Field xsi:type="UnsignedIntField"><Name>speed</Name><Size>8</Size></Field>
+            <Field xsi:type="BooleanField"><Name>moving</Name></Field>
+          </Fields>
+        </Message>{raw}
+      </ReturnMessages>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+RAW = """
+        <Message>
+          <Name>raw</Name>
+          <MIN>2</MIN>
+          <Fields>
+            <Field xsi:type="DataField"><Name>data</Name><Size>2</Size><Fixed>true</Fixed></Field>
+          </Fields>
+        </Message>"""
+
+# a decoded record, a comment, a decoded record, a short payload, a malformed line, a blank line
+# and an unknown MIN
+LOG = "128,1,80010a80\n# comment\n128 2 80020b0c\n128,1,8001\noops\n\n128,3,8003\n"
+
+RECORDS = [
+    {"line": 1, "sin": 128, "min": 1, "fields": {"speed": 10, "moving": True}},
+    {"line": 3, "sin": 128, "min": 2, "fields": {"data": "0b0c"}},
+    {"line": 4, "sin": 128, "min": 1, "error": "Payload too short for SIN 128 MIN 1"},
+    {"line": 5, "error": "Expected SIN, MIN and payload"},
+    {"line": 7, "sin": 128, "min": 3, "error": "Message SIN 128 MIN 3 ReturnMessages: not defined"},
+]
+
+
+def write(tmp_path, repeats=1, raw=True):
+    """Writes the definitions and a log of ``LOG`` repeated, returning their paths."""
+    definitions = tmp_path / 'merged.idpmsg'
+    definitions.write_text(DEFINITIONS.format(raw=RAW if raw else ''))
+    log = tmp_path / 'messages.log'
+    log.write_text(LOG * repeats)
+    return str(log), str(definitions)
+
+
+def read_records(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+
+def expected_records(repeats):
+    """Returns ``RECORDS`` as replayed from ``LOG`` repeated."""
+    lines = LOG.count('\n')
+    return [dict(record, line=record['line'] + n * lines) for n in range(repeats) for record in RECORDS]
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_records_and_counts(tmp_path, workers):
+    log, definitions = write(tmp_path, repeats=5)
+    output = str(tmp_path / 'replayed.ndjson')
+    report = replay_log(log, definitions, output=output, workers=workers, chunk_lines=3)
+    assert read_records(output) == expected_records(5)
+    assert report.counts == {(128, 1): [5, 5], (128, 2): [5, 0], (128, 3): [0, 5]}
+    assert (report.decoded, report.failed, report.malformed) == (10, 10, 5)
+    counts = tmp_path / 'counts.ndjson'
+    with open(str(counts), 'w') as f:
+        report.write_counts(f)
+    assert read_records(str(counts)) == [
+        {"sin": 128, "min": 1, "decoded": 5, "failed": 5},
+        {"sin": 128, "min": 2, "decoded": 5, "failed": 0},
+        {"sin": 128, "min": 3, "decoded": 0, "failed": 5},
+    ]
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_binary_export(tmp_path, workers):
+    log, definitions = write(tmp_path, repeats=3, raw=False)
+    export_binary(definitions, get_backend(), [])
+    output = str(tmp_path / 'replayed.ndjson')
+    # an export up to date with the definitions is used
+    decoder = ReplayDecoder(definitions)
+    assert decoder._binary is not None
+    decoder.close()
+    report = replay_log(log, definitions, output=output, workers=workers, chunk_lines=3)
+    assert report.counts == {(128, 1): [3, 3], (128, 2): [0, 3], (128, 3): [0, 3]}
+    # a stale export, without MIN 2, is not
+    write(tmp_path, repeats=3)
+    assert ReplayDecoder(definitions)._binary is None
+    report = replay_log(log, definitions, output=output, workers=workers, chunk_lines=3)
+    assert read_records(output) == expected_records(3)
+    assert report.counts == {(128, 1): [3, 3], (128, 2): [3, 0], (128, 3): [0, 3]}
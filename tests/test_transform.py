@@ -0,0 +1,38 @@
+import xml.etree.ElementTree as ET
+
+from idp_mdf_merge.transform import Pipeline, Stage
+
+SERVICE = """<Service>
+  <Name>svc</Name>
+  <SIN>128</SIN>
+  <ReturnMessages>
+    <Message>
+      <Name>report</Name>
+      <MIN>1</MIN>
+      <Fields>
+        <Field><Name>speed</Name><Size>8</Size></Field>
+        <Field><Name>label</Name><Size>10</Size><Description>text</Description></Field>
+      </Fields>
+    </Message>
+  </ReturnMessages>
+</Service>"""
+
+
+class Collect(Stage):
+    """Records the text of the elements passed to each call of ``apply_all()``."""
+    name = 'collect'
+
+    def __init__(self, *tags):
+        self.tags = tags
+        self.calls = []
+
+    def apply_all(self, elems, context):
+        self.calls.append([elem.text for elem in elems])
+
+
+def test_tags_collected_in_one_walk():
+    names, sizes, both = Collect('Name'), Collect('Size'), Collect('Size', 'Description')
+    assert Pipeline([names, sizes, both]).run(ET.fromstring(SERVICE), []) == '128'
+    assert names.calls == [['svc', 'report', 'speed', 'label']]
+    assert sizes.calls == [['8', '10']]
+    assert sorted(both.calls) == [['8', '10'], ['text']]
@@ -0,0 +1,105 @@
+import pytest
+
+from idp_mdf_merge.idp_mdf_merge import merge_mdf
+from idp_mdf_merge.shard import merge_shards
+from idp_mdf_merge.validate import ErrorLog
+
+INVALID = """<?xml version="1.0" encoding="utf-8"?>
+<MessageDefinition xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <Services>
+    <Service>
+      <Name>invalid</Name>
+      <SIN>250</SIN>
+      <ReturnMessages>
+        <Message>
+          <Name>report</Name>
+          <Fields>
+            <Field xsi:type="UnsignedIntField"><Name>speed</Name><Size>40</Size></Field>
+          </Fields>
+        </Message>
+      </ReturnMessages>
+    </Service>
+  </Services>
+</MessageDefinition>
+"""
+
+DIAGNOSTICS = [
+    "ERROR: MIN not specified - SIN 250 ReturnMessages Message report",
+    "WARNING: UnsignedIntField Size 40 outside 1 to 31 - SIN 250 ReturnMessages Message report Field speed",
+]
+
+
+def test_uncapped():
+    log = ErrorLog(None, max_repeats=None)
+    log.extend("WARNING: Found/removed unsupported tag Description in 128" for n in range(20))
+    log.close()
+    assert len(log) == 20
+    assert len(log.lines) == 20
+
+
+def test_capped_repeats():
+    log = ErrorLog(None, max_repeats=2)
+    for sin in range(2):
+        for n in range(5):
+            log.append("WARNING: Found/removed unsupported tag Description in {}".format(sin))
+            log.append("ERROR: MIN not specified in SIN {}".format(sin))
+    log.append("WARNING: Found/removed unsupported tag Description in 2")
+    log.close()
+    assert len(log) == 21
+    # errors, and warnings naming another SIN, are written however many there are
+    assert log.lines == [
+        "WARNING: Found/removed unsupported tag Description in 0",
+        "ERROR: MIN not specified in SIN 0",
+        "WARNING: Found/removed unsupported tag Description in 0",
+    ] + ["ERROR: MIN not specified in SIN 0"] * 4 + [
+        "WARNING: Found/removed unsupported tag Description in 1",
+        "ERROR: MIN not specified in SIN 1",
+        "WARNING: Found/removed unsupported tag Description in 1",
+    ] + ["ERROR: MIN not specified in SIN 1"] * 4 + [
+        "WARNING: Found/removed unsupported tag Description in 2",
+        'WARNING: 3 repeat(s) of "Found/removed unsupported tag Description in 0" omitted',
+        'WARNING: 3 repeat(s) of "Found/removed unsupported tag Description in 1" omitted',
+    ]
+
+
+def test_written_to_file(tmp_path):
+    filename = str(tmp_path / 'merged_ERR.log')
+    with ErrorLog(filename, max_repeats=1) as log:
+        log.append("ERROR: MIN not specified in SIN 1")
+        log.append("ERROR: MIN not specified in SIN 1")
+        log.append("WARNING: Found/removed unsupported tag Description in 1")
+        log.append("WARNING: Found/removed unsupported tag Description in 1")
+    with open(filename) as f:
+        assert f.read() == ('ERROR: MIN not specified in SIN 1\nERROR: MIN not specified in SIN 1\n'
+                            'WARNING: Found/removed unsupported tag Description in 1\n'
+                            'WARNING: 1 repeat(s) of "Found/removed unsupported tag Description in 1" omitted')
+
+
+def test_no_file_without_diagnostics(tmp_path):
+    filename = tmp_path / 'merged_ERR.log'
+    filename.write_text(u'previous')
+    ErrorLog(str(filename)).close()
+    assert filename.read_text() == u'previous'
+
+
+
+def invalid_files(tmp_path):
+    """Returns an invalid file given twice, and the diagnostics of its merge."""
+    source = tmp_path / 'invalid.idpmsg'
+    source.write_text(INVALID)
+    # the Service left out as a duplicate SIN is validated as it is loaded, as is the one merged
+    duplicate = 'WARNING: Found duplicate SIN in "{}" Services - ignoring SIN 250'.format(source)
+    return [str(source), str(source)], '\n'.join(DIAGNOSTICS * 2 + [duplicate])
+
+
+@pytest.mark.parametrize('options', [{}, {'stream': True}, {'workers': 2}, {'incremental': True}, {'meta': True}],
+                         ids=['tree', 'stream', 'workers', 'incremental', 'meta'])
+def test_validated_as_loaded(tmp_path, options):
+    files, expected = invalid_files(tmp_path)
+    assert merge_mdf(files, str(tmp_path / 'merged.idpmsg'), validate=True, **options) == expected
+
+
+def test_shards_validated_as_loaded(tmp_path):
+    files, expected = invalid_files(tmp_path)
+    shards, error = merge_shards(files, str(tmp_path / 'merged.idpmsg'), validate=True)
+    assert error == expected and len(shards) == 1